@@ -55,6 +55,17 @@ class ModelParams(ParamGroup):
         self.data_device = "cuda"
         self.eval = False
         self.n_views = 0
+        self.scene_cache_dir = ""
+        self.no_scene_cache = False
+        self.load_workers = 0
+        self.depth_cache_dir = ""
+        self.no_depth_cache = False
+        self.recompute_depth = False
+        self.depth_cache_dtype = "float16"
+        self.depth_provider = "midas"
+        self.depth_dir = ""
+        self.compact_images = False
+        self.compressed_model = False
         super().__init__(parser, "Loading Parameters", sentinel)
 
     def extract(self, args):
@@ -97,6 +108,11 @@ class OptimizationParams(ParamGroup):
         self.dist_thres = 10.
         self.depth_weight = 0.05
         self.depth_pseudo_weight = 0.5
+        self.prefetch_cameras = 2
+        self.capacity_storage = False
+        self.incremental_knn = False
+        self.sparse_adam = False
+        self.morton_interval = 0
         super().__init__(parser, "Optimization Parameters")
 
 
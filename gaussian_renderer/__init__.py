@@ -13,6 +13,8 @@ import torch
 import math
 from diff_gaussian_rasterization import GaussianRasterizationSettings, GaussianRasterizer
 from scene.gaussian_model import GaussianModel
+from scene.gaussian_lod import GaussianHierarchy
+from scene.gaussian_chunks import GaussianStream
 from utils.sh_utils import eval_sh
 
 
@@ -24,6 +26,9 @@ def render(viewpoint_camera, pc, pipe, bg_color : torch.Tensor, scaling_modifier
 
     Background tensor (bg_color) must be on GPU!
     """
+    if isinstance(pc, (GaussianHierarchy, GaussianStream)):
+        # level of detail / out-of-core model: draw the Gaussians these select for this view
+        pc = pc.cut(viewpoint_camera)
 
     # Create zero tensor. We will use it to make pytorch return gradients of the 2D (screen-space) means
     screenspace_points = torch.zeros_like(pc.get_xyz, dtype=pc.get_xyz.dtype, requires_grad=True, device="cuda") + 0
@@ -130,3 +135,17 @@ def render(viewpoint_camera, pc, pipe, bg_color : torch.Tensor, scaling_modifier
             "visibility_filter" : radii > 0,
             "radii": radii,
             "depth": depth}
+
+
+def blending_contribution(viewpoint_camera, pc, pipe, bg_color : torch.Tensor):
+    """
+    Per-Gaussian sum over the pixels of the view of its blending weight
+    (alpha times transmittance). Rendering unit colours, this is exactly the
+    gradient of the summed image with respect to each Gaussian's colour, so
+    the rasterizer's backward pass computes it.
+    """
+    colors = torch.ones_like(pc.get_xyz, requires_grad=True)
+    with torch.enable_grad():
+        image = render(viewpoint_camera, pc, pipe, bg_color, override_color=colors)["render"]
+        image[0].sum().backward()
+    return colors.grad[:, 0]
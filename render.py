@@ -22,6 +22,8 @@ from utils.general_utils import safe_state
 from argparse import ArgumentParser
 from arguments import ModelParams, PipelineParams, get_combined_args
 from gaussian_renderer import GaussianModel
+from scene.gaussian_lod import GaussianHierarchy
+from scene.gaussian_chunks import CHUNKS_NAME, GaussianStream, chunk_ply
 import cv2
 import time
 from tqdm import tqdm
@@ -64,7 +66,7 @@ def render_video(source_path, model_path, iteration, views, gaussians, pipeline,
     elif source_path.find('360') != -1:
         render_poses = generate_ellipse_path(views)
 
-    size = (view.original_image.shape[2], view.original_image.shape[1])
+    size = (view.image_width, view.image_height)
     fourcc = cv2.VideoWriter_fourcc(*'XVID')
     final_video = cv2.VideoWriter(os.path.join(render_path, 'final_video.mp4'), fourcc, fps, size)
     # final_video = cv2.VideoWriter(os.path.join('/ssd1/zehao/gs_release/video/', str(iteration), model_path.split('/')[-1] + '.mp4'), fourcc, fps, size)
@@ -88,7 +90,22 @@ def render_sets(dataset : ModelParams, pipeline : PipelineParams, args):
 
     with torch.no_grad():
         gaussians = GaussianModel(args)
-        scene = Scene(args, gaussians, load_iteration=args.iteration, shuffle=False)
+        if args.stream_budget_mb > 0:
+            # out of core: only the chunks in view are read, under a device memory budget
+            scene = Scene(args, gaussians, load_iteration=args.iteration, shuffle=False, load_gaussians=False)
+            point_cloud_path = os.path.join(dataset.model_path, "point_cloud", "iteration_{}".format(scene.loaded_iter))
+            chunks_path = os.path.join(point_cloud_path, CHUNKS_NAME)
+            if not os.path.exists(chunks_path):
+                chunk_ply(os.path.join(point_cloud_path, "point_cloud.ply"), chunks_path)
+            gaussians = GaussianStream(chunks_path, args.stream_budget_mb * 2 ** 20)
+            print("Streaming {} Gaussians in {} chunks".format(gaussians.num_gaussians, len(gaussians.chunks)))
+        else:
+            scene = Scene(args, gaussians, load_iteration=args.iteration, shuffle=False)
+            # the model is static from here on: apply the activations once instead of on every frame
+            gaussians = scene.gaussians = gaussians.bake()
+            if args.lod_error > 0:
+                gaussians = GaussianHierarchy(gaussians, error=args.lod_error)
+                print("Level of detail: {} Gaussians in {} nodes".format(gaussians.num_leaves, gaussians.parent.shape[0]))
 
         bg_color = [1,1,1] if dataset.white_background else [0, 0, 0]
         background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
@@ -101,6 +118,8 @@ def render_sets(dataset : ModelParams, pipeline : PipelineParams, args):
             render_set(dataset.model_path, "train", scene.loaded_iter, scene.getTrainCameras(), gaussians, pipeline, background, args)
         if not args.skip_test:
             render_set(dataset.model_path, "test", scene.loaded_iter, scene.getTestCameras(), gaussians, pipeline, background, args)
+        if args.stream_budget_mb > 0:
+            print("Chunk paging: {}".format(gaussians.stats()))
 
 
 
@@ -116,6 +135,8 @@ if __name__ == "__main__":
     parser.add_argument("--video", action="store_true")
     parser.add_argument("--fps", default=30, type=int)
     parser.add_argument("--render_depth", action="store_true")
+    parser.add_argument("--lod_error", default=0.0, type=float)
+    parser.add_argument("--stream_budget_mb", default=0, type=int)
     args = get_combined_args(parser)
     print("Rendering " + args.model_path)
 
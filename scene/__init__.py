@@ -15,9 +15,12 @@ import json
 import numpy as np
 from utils.system_utils import searchForMaxIteration
 from scene.dataset_readers import sceneLoadTypeCallbacks
+from scene.dataset_pack import PACK_NAME, open_pack
+from scene.gaussian_codec import COMPRESSED_NAME
+from scene.scene_cache import readSceneInfoCached
 from scene.gaussian_model import GaussianModel
 from arguments import ModelParams
-from utils.camera_utils import cameraList_from_camInfos, camera_to_JSON
+from utils.camera_utils import cameraList_from_camInfos, cameraList_nbytes, camera_to_JSON
 from utils.pose_utils import generate_random_poses_llff, generate_random_poses_360
 from scene.cameras import PseudoCamera
 
@@ -25,11 +28,13 @@ class Scene:
 
     gaussians : GaussianModel
 
-    def __init__(self, args : ModelParams, gaussians : GaussianModel, load_iteration=None, shuffle=True, resolution_scales=[1.0]):
+    def __init__(self, args : ModelParams, gaussians : GaussianModel, load_iteration=None, shuffle=True, resolution_scales=[1.0],
+                 load_gaussians=True):
         """b
         :param path: Path to colmap scene main folder.
         """
         self.model_path = args.model_path
+        self.compressed_model = args.compressed_model
         self.loaded_iter = None
         self.gaussians = gaussians
 
@@ -44,18 +49,29 @@ class Scene:
         self.test_cameras = {}
         self.pseudo_cameras = {}
 
-        if os.path.exists(os.path.join(args.source_path, "sparse")):
-            scene_info = sceneLoadTypeCallbacks["Colmap"](args.source_path, args.images, args.eval, args.n_views)
+        if os.path.exists(os.path.join(args.source_path, PACK_NAME)):
+            print("Found {}, reading the packed data set".format(PACK_NAME))
+            scene_type, reader_args = "Packed", (args.source_path, args.eval, args.n_views)
+        elif os.path.exists(os.path.join(args.source_path, "sparse")):
+            scene_type, reader_args = "Colmap", (args.source_path, args.images, args.eval, args.n_views)
         elif os.path.exists(os.path.join(args.source_path, "transforms_train.json")):
             print("Found transforms_train.json file, assuming Blender data set!")
-            scene_info = sceneLoadTypeCallbacks["Blender"](args.source_path, args.white_background, args.eval, args.n_views)
+            scene_type, reader_args = "Blender", (args.source_path, args.white_background, args.eval, args.n_views)
         else:
             assert False, "Could not recognize scene type!"
+        # a pack is already a single indexed file, there is nothing to cache
+        cache_dir = None if args.no_scene_cache or scene_type == "Packed" else \
+            (args.scene_cache_dir or os.path.join(args.source_path, ".scene_cache"))
+        scene_info = readSceneInfoCached(scene_type, reader_args, cache_dir)
 
 
         if not self.loaded_iter:
-            with open(scene_info.ply_path, 'rb') as src_file, open(os.path.join(self.model_path, "input.ply") , 'wb') as dest_file:
-                dest_file.write(src_file.read())
+            if scene_type == "Packed":
+                pack = open_pack(scene_info.ply_path)
+                pack.write_file(pack.index["ply"], os.path.join(self.model_path, "input.ply"))
+            else:
+                with open(scene_info.ply_path, 'rb') as src_file, open(os.path.join(self.model_path, "input.ply") , 'wb') as dest_file:
+                    dest_file.write(src_file.read())
             json_cams = []
             camlist = []
             if scene_info.test_cameras:
@@ -79,6 +95,11 @@ class Scene:
             self.train_cameras[resolution_scale] = cameraList_from_camInfos(scene_info.train_cameras, resolution_scale, args)
             print("Loading Test Cameras")
             self.test_cameras[resolution_scale] = cameraList_from_camInfos(scene_info.test_cameras, resolution_scale, args)
+            print("Camera memory at scale {}: train {:.1f} MiB, test {:.1f} MiB ({})".format(
+                resolution_scale,
+                cameraList_nbytes(self.train_cameras[resolution_scale]) / 2**20,
+                cameraList_nbytes(self.test_cameras[resolution_scale]) / 2**20,
+                "uint8 images" if args.compact_images else "float32 images"))
 
             pseudo_cams = []
             if args.source_path.find('llff'):
@@ -94,17 +115,26 @@ class Scene:
             self.pseudo_cameras[resolution_scale] = pseudo_cams
 
 
-        if self.loaded_iter:
-            self.gaussians.load_ply(os.path.join(self.model_path,
-                                                           "point_cloud",
-                                                           "iteration_" + str(self.loaded_iter),
-                                                           "point_cloud.ply"))
+        if not load_gaussians:
+            # the caller reads the model itself (e.g. streamed from a chunked store)
+            pass
+        elif self.loaded_iter:
+            point_cloud_path = os.path.join(self.model_path, "point_cloud", "iteration_" + str(self.loaded_iter))
+            ply_path = os.path.join(point_cloud_path, "point_cloud.ply")
+            compressed_path = os.path.join(point_cloud_path, COMPRESSED_NAME)
+            if os.path.exists(compressed_path) and (self.compressed_model or not os.path.exists(ply_path)):
+                print("Loading compressed model {}".format(compressed_path))
+                self.gaussians.load_compressed(compressed_path)
+            else:
+                self.gaussians.load_ply(ply_path)
         else:
             self.gaussians.create_from_pcd(scene_info.point_cloud, self.cameras_extent)
 
     def save(self, iteration):
         point_cloud_path = os.path.join(self.model_path, "point_cloud/iteration_{}".format(iteration))
         self.gaussians.save_ply(os.path.join(point_cloud_path, "point_cloud.ply"))
+        if self.compressed_model:
+            self.gaussians.save_compressed(os.path.join(point_cloud_path, COMPRESSED_NAME))
 
     def getTrainCameras(self, scale=1.0):
         return self.train_cameras[scale]
@@ -18,7 +18,8 @@ from utils.graphics_utils import getWorld2View2, getProjectionMatrix
 class Camera(nn.Module):
     def __init__(self, colmap_id, R, T, FoVx, FoVy, image, gt_alpha_mask,
                  image_name, uid, trans=np.array([0.0, 0.0, 0.0]),
-                 scale=1.0, data_device = "cuda", depth_image = None, mask = None, bounds=None):
+                 scale=1.0, data_device = "cuda", depth_image = None, mask = None, bounds=None,
+                 compact_images=False):
         super(Camera, self).__init__()
 
         self.uid = uid
@@ -28,6 +29,9 @@ class Camera(nn.Module):
         self.FoVx = FoVx
         self.FoVy = FoVy
         self.image_name = image_name
+        self.compact_images = compact_images
+        if compact_images and depth_image is not None:
+            depth_image = np.asarray(depth_image, dtype=np.float16)
         self.depth_image = depth_image
         self.mask = mask
         self.bounds = bounds
@@ -39,14 +43,17 @@ class Camera(nn.Module):
             print(f"[Warning] Custom device {data_device} failed, fallback to default cuda device" )
             self.data_device = torch.device("cuda")
 
-        self.original_image = image.clamp(0.0, 1.0).to(self.data_device)
-        self.image_width = self.original_image.shape[2]
-        self.image_height = self.original_image.shape[1]
+        image = image.clamp(0.0, 1.0)
+        self.image_width = image.shape[2]
+        self.image_height = image.shape[1]
 
         if gt_alpha_mask is not None:
-            self.original_image *= gt_alpha_mask.to(self.data_device)
+            image = image * gt_alpha_mask
+        if compact_images:
+            # quantized on the host so only the uint8 copy is ever moved to data_device
+            self._image = (image * 255.0).round().to(torch.uint8).to(self.data_device)
         else:
-            self.original_image *= torch.ones((1, self.image_height, self.image_width), device=self.data_device)
+            self._image = image.to(self.data_device)
 
         self.zfar = 100.0
         self.znear = 0.01
@@ -59,6 +66,27 @@ class Camera(nn.Module):
         self.full_proj_transform = (self.world_view_transform.unsqueeze(0).bmm(self.projection_matrix.unsqueeze(0))).squeeze(0)
         self.camera_center = self.world_view_transform.inverse()[3, :3]
 
+    @property
+    def stored_image(self):
+        # the tensor as kept on data_device: uint8 for compact cameras, float32 otherwise
+        return self._image
+
+    @property
+    def original_image(self):
+        # compact cameras are converted to float32 on every access; nothing is kept
+        if self.compact_images:
+            return self._image.float() / 255.0
+        return self._image
+
+    def resident_bytes(self):
+        """Bytes held by this camera's image, depth and mask (memory-mapped depths included)."""
+        nbytes = self._image.element_size() * self._image.nelement()
+        if self.depth_image is not None:
+            nbytes += np.asarray(self.depth_image).nbytes
+        if self.mask is not None:
+            nbytes += np.asarray(self.mask).nbytes
+        return nbytes
+
 
 
 
@@ -12,6 +12,7 @@
 import numpy as np
 import collections
 import struct
+import mmap
 
 CameraModel = collections.namedtuple(
     "CameraModel", ["model_id", "model_name", "num_params"])
@@ -52,6 +53,20 @@ def qvec2rotmat(qvec):
          2 * qvec[2] * qvec[3] + 2 * qvec[0] * qvec[1],
          1 - 2 * qvec[1]**2 - 2 * qvec[2]**2]])
 
+def qvecs2rotmats(qvecs):
+    """Batched qvec2rotmat: (N,4) quaternions to (N,3,3) rotation matrices."""
+    w, x, y, z = qvecs[:, 0], qvecs[:, 1], qvecs[:, 2], qvecs[:, 3]
+    return np.stack([
+        np.stack([1 - 2 * y**2 - 2 * z**2,
+                  2 * x * y - 2 * w * z,
+                  2 * z * x + 2 * w * y], axis=-1),
+        np.stack([2 * x * y + 2 * w * z,
+                  1 - 2 * x**2 - 2 * z**2,
+                  2 * y * z - 2 * w * x], axis=-1),
+        np.stack([2 * z * x - 2 * w * y,
+                  2 * y * z + 2 * w * x,
+                  1 - 2 * x**2 - 2 * y**2], axis=-1)], axis=-2)
+
 def rotmat2qvec(R):
     Rxx, Ryx, Rzx, Rxy, Ryy, Rzy, Rxz, Ryz, Rzz = R.flat
     K = np.array([
@@ -110,36 +125,98 @@ def read_points3D_text(path):
                     errors = np.append(errors, error[None, ...], axis=0)
     return xyzs, rgbs, errors
 
+POINT3D_RECORD_DTYPE = np.dtype([("id", "<u8"), ("xyz", "<f8", 3), ("rgb", "u1", 3), ("error", "<f8")])
+TRACK_ELEM_DTYPE = np.dtype([("image_id", "<i4"), ("point2D_idx", "<i4")])
+PointTracks = collections.namedtuple(
+    "PointTracks", ["offsets", "image_ids", "point2D_idxs"])
+
+
+def _gather_records(buf, starts, dtype, chunk_size=1 << 18):
+    """Copy fixed-size records living at arbitrary byte offsets of `buf` into a
+    contiguous structured array. Works chunk by chunk to bound the size of the
+    temporary byte index."""
+    out = np.empty(len(starts), dtype=dtype)
+    raw = out.view(np.uint8).reshape(len(starts), dtype.itemsize)
+    byte_range = np.arange(dtype.itemsize, dtype=np.int64)
+    for begin in range(0, len(starts), chunk_size):
+        end = min(begin + chunk_size, len(starts))
+        raw[begin:end] = buf[starts[begin:end, None] + byte_range]
+    return out
+
+
+def _walk_track_lengths(mm, num_points):
+    # The position of a track length depends on every track length before it,
+    # so this chain cannot be vectorized short of decoding a candidate length
+    # at every byte of the file. It is kept to one struct read per point, with
+    # everything it touches bound to locals (about 0.25s per million points).
+    unpack_track_length = struct.Struct("<Q").unpack_from
+    record_size = POINT3D_RECORD_DTYPE.itemsize + 8
+    elem_size = TRACK_ELEM_DTYPE.itemsize
+    track_lengths = [0] * num_points
+    offset = 8 + POINT3D_RECORD_DTYPE.itemsize
+    for i in range(num_points):
+        track_length = unpack_track_length(mm, offset)[0]
+        track_lengths[i] = track_length
+        offset += record_size + elem_size * track_length
+    return track_lengths
+
+
+def read_points3D_binary_bulk(path_to_model_file, return_tracks=False):
+    """
+    Memory-mapped variant of read_points3D_binary.
+
+    The file is scanned once to read the track length of every point record
+    (_walk_track_lengths); record starts follow from a cumulative sum, and
+    point attributes and (optionally) track payloads are then decoded with
+    bulk NumPy gathers.
+
+    :param path_to_model_file: path to points3D.bin
+    :param return_tracks: also return a PointTracks index where the track of
+        point i is image_ids[offsets[i]:offsets[i+1]] (same for point2D_idxs).
+    :return: xyzs (N,3), rgbs (N,3), errors (N,1) as float64 arrays, matching
+        read_points3D_binary, followed by PointTracks if requested.
+    """
+    with open(path_to_model_file, "rb") as fid:
+        mm = mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ)
+    buf = np.frombuffer(mm, dtype=np.uint8)
+    num_points = struct.unpack_from("<Q", mm, 0)[0]
+
+    header_size = POINT3D_RECORD_DTYPE.itemsize
+    track_lengths = np.array(_walk_track_lengths(mm, num_points), dtype=np.int64)
+    record_sizes = header_size + 8 + TRACK_ELEM_DTYPE.itemsize * track_lengths
+    starts = np.empty(num_points, dtype=np.int64)
+    starts[:1] = 8
+    np.cumsum(record_sizes[:-1], out=starts[1:])
+    starts[1:] += 8
+
+    records = _gather_records(buf, starts, POINT3D_RECORD_DTYPE)
+    xyzs = records["xyz"].astype(np.float64)
+    rgbs = records["rgb"].astype(np.float64)
+    errors = records["error"].astype(np.float64)[:, None]
+
+    if not return_tracks:
+        return xyzs, rgbs, errors
+
+    offsets = np.zeros(num_points + 1, dtype=np.int64)
+    np.cumsum(track_lengths, out=offsets[1:])
+    # byte position of every track element: start of the owning track payload
+    # plus the element's rank inside that track
+    payload_starts = np.repeat(starts + header_size + 8, track_lengths)
+    ranks = np.arange(offsets[-1], dtype=np.int64) - np.repeat(offsets[:-1], track_lengths)
+    elems = _gather_records(buf, payload_starts + TRACK_ELEM_DTYPE.itemsize * ranks, TRACK_ELEM_DTYPE)
+    tracks = PointTracks(offsets=offsets,
+                         image_ids=elems["image_id"].copy(),
+                         point2D_idxs=elems["point2D_idx"].copy())
+    return xyzs, rgbs, errors, tracks
+
+
 def read_points3D_binary(path_to_model_file):
     """
     see: src/base/reconstruction.cc
         void Reconstruction::ReadPoints3DBinary(const std::string& path)
         void Reconstruction::WritePoints3DBinary(const std::string& path)
     """
-
-
-    with open(path_to_model_file, "rb") as fid:
-        num_points = read_next_bytes(fid, 8, "Q")[0]
-
-        xyzs = np.empty((num_points, 3))
-        rgbs = np.empty((num_points, 3))
-        errors = np.empty((num_points, 1))
-
-        for p_id in range(num_points):
-            binary_point_line_properties = read_next_bytes(
-                fid, num_bytes=43, format_char_sequence="QdddBBBd")
-            xyz = np.array(binary_point_line_properties[1:4])
-            rgb = np.array(binary_point_line_properties[4:7])
-            error = np.array(binary_point_line_properties[7])
-            track_length = read_next_bytes(
-                fid, num_bytes=8, format_char_sequence="Q")[0]
-            track_elems = read_next_bytes(
-                fid, num_bytes=8*track_length,
-                format_char_sequence="ii"*track_length)
-            xyzs[p_id] = xyz
-            rgbs[p_id] = rgb
-            errors[p_id] = error
-    return xyzs, rgbs, errors
+    return read_points3D_binary_bulk(path_to_model_file)
 
 def read_intrinsics_text(path):
     """
@@ -165,39 +242,112 @@ def read_intrinsics_text(path):
                                             params=params)
     return cameras
 
+IMAGE_RECORD_DTYPE = np.dtype([("id", "<i4"), ("qvec", "<f8", 4), ("tvec", "<f8", 3), ("camera_id", "<i4")])
+POINT2D_RECORD_DTYPE = np.dtype([("xy", "<f8", 2), ("point3D_id", "<i8")])
+
+
+class ColmapImages:
+    """
+    All registered images of a COLMAP reconstruction, indexed by row.
+
+    Poses are stacked into (N,4) qvecs / (N,3) tvecs arrays in file order,
+    while the per-image 2D keypoints are only decoded when points2D(row) is
+    called for a specific image.
+    """
+    def __init__(self, ids, qvecs, tvecs, camera_ids, names, num_points2D, points2D_loader):
+        self.ids = ids
+        self.qvecs = qvecs
+        self.tvecs = tvecs
+        self.camera_ids = camera_ids
+        self.names = names
+        self.num_points2D = num_points2D
+        self._points2D_loader = points2D_loader
+        self._row_of_id = {int(image_id): row for row, image_id in enumerate(ids)}
+
+    @classmethod
+    def from_images(cls, images):
+        """Build the index from a dict of Image namedtuples (e.g. read_extrinsics_text)."""
+        images = list(images.values())
+        return cls(ids=np.array([image.id for image in images], dtype=np.int32),
+                   qvecs=np.array([image.qvec for image in images], dtype=np.float64).reshape(-1, 4),
+                   tvecs=np.array([image.tvec for image in images], dtype=np.float64).reshape(-1, 3),
+                   camera_ids=np.array([image.camera_id for image in images], dtype=np.int32),
+                   names=[image.name for image in images],
+                   num_points2D=np.array([len(image.point3D_ids) for image in images], dtype=np.int64),
+                   points2D_loader=lambda row: (images[row].xys, images[row].point3D_ids))
+
+    def __len__(self):
+        return len(self.names)
+
+    def row(self, image_id):
+        return self._row_of_id[image_id]
+
+    def points2D(self, row):
+        """Decode the keypoints of one image: xys (M,2) and point3D_ids (M,)."""
+        return self._points2D_loader(row)
+
+    def rotmats(self):
+        return qvecs2rotmats(self.qvecs)
+
+    def image(self, row):
+        xys, point3D_ids = self.points2D(row)
+        return Image(id=int(self.ids[row]), qvec=self.qvecs[row].copy(), tvec=self.tvecs[row].copy(),
+                     camera_id=int(self.camera_ids[row]), name=self.names[row],
+                     xys=xys, point3D_ids=point3D_ids)
+
+    def to_dict(self):
+        return {int(self.ids[row]): self.image(row) for row in range(len(self))}
+
+
+def read_images_binary_indexed(path_to_model_file):
+    """
+    Index images.bin in a single pass over a memory map of the file.
+
+    Only the fixed-size image header, the name and the keypoint count are
+    visited per image; the keypoint payloads are skipped and decoded lazily
+    by ColmapImages.points2D.
+    """
+    with open(path_to_model_file, "rb") as fid:
+        mm = mmap.mmap(fid.fileno(), 0, access=mmap.ACCESS_READ)
+    buf = np.frombuffer(mm, dtype=np.uint8)
+    num_reg_images = struct.unpack_from("<Q", mm, 0)[0]
+
+    unpack_num_points2D = struct.Struct("<Q").unpack_from
+    header_size = IMAGE_RECORD_DTYPE.itemsize
+    starts, names, points2D_starts, num_points2D = [], [], [], []
+    offset = 8
+    for _ in range(num_reg_images):
+        name_end = mm.find(b"\x00", offset + header_size)   # look for the ASCII 0 entry
+        num_points = unpack_num_points2D(mm, name_end + 1)[0]
+        starts.append(offset)
+        names.append(mm[offset + header_size:name_end].decode("utf-8"))
+        points2D_starts.append(name_end + 9)
+        num_points2D.append(num_points)
+        offset = name_end + 9 + POINT2D_RECORD_DTYPE.itemsize * num_points
+
+    records = _gather_records(buf, np.array(starts, dtype=np.int64), IMAGE_RECORD_DTYPE)
+
+    def points2D_loader(row):
+        points = np.frombuffer(mm, dtype=POINT2D_RECORD_DTYPE,
+                               count=num_points2D[row], offset=points2D_starts[row])
+        return points["xy"].astype(np.float64), points["point3D_id"].astype(np.int64)
+
+    return ColmapImages(ids=records["id"].copy(),
+                        qvecs=records["qvec"].copy(),
+                        tvecs=records["tvec"].copy(),
+                        camera_ids=records["camera_id"].copy(),
+                        names=names,
+                        num_points2D=np.array(num_points2D, dtype=np.int64),
+                        points2D_loader=points2D_loader)
+
+
 def read_extrinsics_binary(path_to_model_file):
     """
     see: src/base/reconstruction.cc
         void Reconstruction::ReadImagesBinary(const std::string& path)
         void Reconstruction::WriteImagesBinary(const std::string& path)
     """
-    images = {}
-    with open(path_to_model_file, "rb") as fid:
-        num_reg_images = read_next_bytes(fid, 8, "Q")[0]
-        for _ in range(num_reg_images):
-            binary_image_properties = read_next_bytes(
-                fid, num_bytes=64, format_char_sequence="idddddddi")
-            image_id = binary_image_properties[0]
-            qvec = np.array(binary_image_properties[1:5])
-            tvec = np.array(binary_image_properties[5:8])
-            camera_id = binary_image_properties[8]
-            image_name = ""
-            current_char = read_next_bytes(fid, 1, "c")[0]
-            while current_char != b"\x00":   # look for the ASCII 0 entry
-                image_name += current_char.decode("utf-8")
-                current_char = read_next_bytes(fid, 1, "c")[0]
-            num_points2D = read_next_bytes(fid, num_bytes=8,
-                                           format_char_sequence="Q")[0]
-            x_y_id_s = read_next_bytes(fid, num_bytes=24*num_points2D,
-                                       format_char_sequence="ddq"*num_points2D)
-            xys = np.column_stack([tuple(map(float, x_y_id_s[0::3])),
-                                   tuple(map(float, x_y_id_s[1::3]))])
-            point3D_ids = np.array(tuple(map(int, x_y_id_s[2::3])))
-            images[image_id] = Image(
-                id=image_id, qvec=qvec, tvec=tvec,
-                camera_id=camera_id, name=image_name,
-                xys=xys, point3D_ids=point3D_ids)
-    return images
+    return read_images_binary_indexed(path_to_model_file).to_dict()
 
 
 def read_intrinsics_binary(path_to_model_file):
@@ -208,24 +358,20 @@ def read_intrinsics_binary(path_to_model_file):
     """
     cameras = {}
     with open(path_to_model_file, "rb") as fid:
-        num_cameras = read_next_bytes(fid, 8, "Q")[0]
-        for _ in range(num_cameras):
-            camera_properties = read_next_bytes(
-                fid, num_bytes=24, format_char_sequence="iiQQ")
-            camera_id = camera_properties[0]
-            model_id = camera_properties[1]
-            model_name = CAMERA_MODEL_IDS[camera_properties[1]].model_name
-            width = camera_properties[2]
-            height = camera_properties[3]
-            num_params = CAMERA_MODEL_IDS[model_id].num_params
-            params = read_next_bytes(fid, num_bytes=8*num_params,
-                                     format_char_sequence="d"*num_params)
-            cameras[camera_id] = Camera(id=camera_id,
-                                        model=model_name,
-                                        width=width,
-                                        height=height,
-                                        params=np.array(params))
-        assert len(cameras) == num_cameras
+        data = fid.read()
+    num_cameras = struct.unpack_from("<Q", data, 0)[0]
+    offset = 8
+    for _ in range(num_cameras):
+        camera_id, model_id, width, height = struct.unpack_from("<iiQQ", data, offset)
+        num_params = CAMERA_MODEL_IDS[model_id].num_params
+        params = np.frombuffer(data, dtype="<f8", count=num_params, offset=offset + 24).astype(np.float64)
+        cameras[camera_id] = Camera(id=camera_id,
+                                    model=CAMERA_MODEL_IDS[model_id].model_name,
+                                    width=width,
+                                    height=height,
+                                    params=params)
+        offset += 24 + 8 * num_params
+    assert len(cameras) == num_cameras
     return cameras
 
 
@@ -0,0 +1,122 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+"""
+Single-file packed datasets (<source_path>/scene.gspack).
+
+Layout: a 24-byte header (magic, index offset, index size), then the array
+blobs, each aligned to 64 bytes, then a JSON index. The index holds the
+camera metadata and, for every array, its offset, shape and dtype. The file
+is memory-mapped once and arrays are returned as views into the mapping, so
+only the pages that are actually touched get read.
+"""
+
+import os
+import json
+import struct
+import numpy as np
+from PIL import Image
+
+PACK_NAME = "scene.gspack"
+PACK_MAGIC = b"GSPACK\x00\x01"
+PACK_VERSION = 1
+_HEADER = struct.Struct("<8sQQ")
+_ALIGN = 64
+
+
+class PackWriter:
+    def __init__(self, path, magic=PACK_MAGIC):
+        self.path = path
+        self.magic = magic
+        self.tmp_path = path + ".tmp"
+        self.file = open(self.tmp_path, "wb")
+        self.file.write(_HEADER.pack(magic, 0, 0))
+
+    def add_array(self, array):
+        """Append an array blob and return its index entry."""
+        array = np.ascontiguousarray(array)
+        offset = self.file.tell()
+        padding = -offset % _ALIGN
+        self.file.write(b"\0" * padding)
+        offset += padding
+        self.file.write(array.tobytes())
+        return {"offset": offset, "shape": list(array.shape), "dtype": array.dtype.str}
+
+    def add_file(self, path):
+        with open(path, "rb") as f:
+            return self.add_array(np.frombuffer(f.read(), dtype=np.uint8))
+
+    def close(self, index):
+        index = dict(index, version=PACK_VERSION)
+        payload = json.dumps(index).encode("utf-8")
+        index_offset = self.file.tell()
+        self.file.write(payload)
+        self.file.seek(0)
+        self.file.write(_HEADER.pack(self.magic, index_offset, len(payload)))
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+
+class PackedDataset:
+    def __init__(self, path, magic=PACK_MAGIC):
+        self.path = path
+        with open(path, "rb") as f:
+            file_magic, index_offset, index_size = _HEADER.unpack(f.read(_HEADER.size))
+            if file_magic != magic:
+                raise ValueError("{} does not start with {!r}".format(path, magic))
+            f.seek(index_offset)
+            self.index = json.loads(f.read(index_size).decode("utf-8"))
+        if self.index["version"] != PACK_VERSION:
+            raise ValueError("Unsupported pack version {} in {}".format(self.index["version"], path))
+        self.buffer = np.memmap(path, dtype=np.uint8, mode="r")
+
+    def array(self, entry):
+        """Read-only view of a blob; nothing is read until it is accessed."""
+        dtype = np.dtype(entry["dtype"])
+        count = int(np.prod(entry["shape"], dtype=np.int64))
+        blob = self.buffer[entry["offset"]:entry["offset"] + count * dtype.itemsize]
+        return blob.view(dtype).reshape(entry["shape"])
+
+    def write_file(self, entry, path):
+        with open(path, "wb") as f:
+            f.write(self.array(entry).tobytes())
+
+
+_open_packs = {}
+
+
+def open_pack(path):
+    """PackedDataset for path, shared by everything that reads the same pack."""
+    path = os.path.abspath(path)
+    if path not in _open_packs:
+        _open_packs[path] = PackedDataset(path)
+    return _open_packs[path]
+
+
+class PackedImage:
+    """
+    Stands in for the PIL image of a CameraInfo read from a pack: it has the
+    original size, and resize() returns the stored level when one was packed
+    at that resolution, decoding nothing else.
+    """
+    filename = ""
+
+    def __init__(self, size, levels):
+        self.size = tuple(size)
+        self.levels = levels
+
+    def resize(self, resolution):
+        resolution = tuple(resolution)
+        if resolution in self.levels:
+            return Image.fromarray(np.asarray(self.levels[resolution]))
+        # not packed at this resolution: resample the largest level
+        largest = max(self.levels, key=lambda size: size[0] * size[1])
+        return Image.fromarray(np.asarray(self.levels[largest])).resize(resolution)
@@ -17,7 +17,8 @@ from PIL import Image
 import imageio
 from typing import NamedTuple
 from scene.colmap_loader import read_extrinsics_text, read_intrinsics_text, qvec2rotmat, rotmat2qvec, \
-    read_extrinsics_binary, read_intrinsics_binary, read_points3D_binary, read_points3D_text
+    read_extrinsics_binary, read_intrinsics_binary, read_points3D_binary, read_points3D_text, \
+    read_images_binary_indexed, ColmapImages, qvecs2rotmats
 from utils.graphics_utils import getWorld2View2, focal2fov, fov2focal
 from utils.general_utils import chamfer_dist
 import numpy as np
@@ -29,8 +30,10 @@ import open3d as o3d
 from tqdm import tqdm
 from pathlib import Path
 from plyfile import PlyData, PlyElement
+from utils.ply_utils import vertex_elements, write_vertex_ply
 from utils.sh_utils import SH2RGB
 from scene.gaussian_model import BasicPointCloud
+from scene.dataset_pack import PACK_NAME, open_pack, PackedImage
 
 class CameraInfo(NamedTuple):
     uid: int
@@ -161,51 +164,56 @@ def readColmapCameras2(cam_extrinsics, cam_intrinsics, images_folder):
     return cam_infos
 
 
-def readColmapCameras(cam_extrinsics, cam_intrinsics, images_folder, path, rgb_mapping):
-    cam_infos = []
-    for idx, key in enumerate(sorted(cam_extrinsics.keys())):
-        sys.stdout.write('\r')
-        # the exact output you're looking for:
-        sys.stdout.write("Reading camera {}/{}".format(idx+1, len(cam_extrinsics)))
-        sys.stdout.flush()
-
-        extr = cam_extrinsics[key]
-        intr = cam_intrinsics[extr.camera_id]
-        height = intr.height
-        width = intr.width
-
-        uid = intr.id
-        R = np.transpose(qvec2rotmat(extr.qvec))
-        T = np.array(extr.tvec)
-        bounds = np.load(os.path.join(path, 'poses_bounds.npy'))[idx, -2:]
-
+def colmapFovs(cam_intrinsics):
+    """FovX/FovY for every COLMAP camera model entry, keyed by camera id."""
+    fovs = {}
+    for camera_id, intr in cam_intrinsics.items():
         if intr.model=="SIMPLE_PINHOLE" or intr.model=="SIMPLE_RADIAL":
             focal_length_x = intr.params[0]
-            FovY = focal2fov(focal_length_x, height)
-            FovX = focal2fov(focal_length_x, width)
+            fovs[camera_id] = (focal2fov(focal_length_x, intr.width), focal2fov(focal_length_x, intr.height))
         elif intr.model=="PINHOLE":
             focal_length_x = intr.params[0]
             focal_length_y = intr.params[1]
-            FovY = focal2fov(focal_length_y, height)
-            FovX = focal2fov(focal_length_x, width)
+            fovs[camera_id] = (focal2fov(focal_length_x, intr.width), focal2fov(focal_length_y, intr.height))
         else:
             assert False, "Colmap camera model not handled: only undistorted datasets (PINHOLE or SIMPLE_PINHOLE cameras) supported!"
+    return fovs
 
-        image_path = os.path.join(images_folder, os.path.basename(extr.name))
+
+def readColmapCameras(cam_extrinsics, cam_intrinsics, images_folder, path, rgb_mapping):
+    # Poses, bounds and field of view are computed for all cameras at once; only
+    # building the CameraInfo tuples is left to the per-camera loop.
+    rows = sorted(range(len(cam_extrinsics)), key=lambda row: cam_extrinsics.names[row])
+    num_cams = len(rows)
+    Rs = np.transpose(qvecs2rotmats(cam_extrinsics.qvecs[rows].reshape(-1, 4)), (0, 2, 1))
+    Ts = cam_extrinsics.tvecs[rows].reshape(-1, 3)
+    all_bounds = np.load(os.path.join(path, 'poses_bounds.npy'))[:, -2:]
+    assert all_bounds.shape[0] >= num_cams, "poses_bounds.npy has fewer entries than registered images"
+
+    camera_ids = [int(cam_extrinsics.camera_ids[row]) for row in rows]
+    fovs = colmapFovs({camera_id: cam_intrinsics[camera_id] for camera_id in set(camera_ids)})
+
+    cam_infos = []
+    for idx, row in enumerate(rows):
+        intr = cam_intrinsics[camera_ids[idx]]
+        FovX, FovY = fovs[camera_ids[idx]]
+
+        image_path = os.path.join(images_folder, os.path.basename(cam_extrinsics.names[row]))
         image_name = os.path.basename(image_path).split(".")[0]
         rgb_path = rgb_mapping[idx]   # os.path.join(images_folder, rgb_mapping[idx])
-        rgb_name = os.path.basename(rgb_path).split(".")[0]
         image = Image.open(rgb_path)
+        image.close()  # keep only size/filename; pixels are decoded by the camera loader
 
-        cam_info = CameraInfo(uid=uid, R=R, T=T, FovY=FovY, FovX=FovX, image=image, image_path=image_path,
-                image_name=image_name, width=width, height=height, mask=None, bounds=bounds)
+        cam_info = CameraInfo(uid=intr.id, R=Rs[idx], T=Ts[idx], FovY=FovY, FovX=FovX, image=image,
+                              image_path=image_path, image_name=image_name, width=intr.width, height=intr.height,
+                              mask=None, bounds=all_bounds[idx])
         cam_infos.append(cam_info)
 
-    sys.stdout.write('\n')
+    print("Read {} cameras".format(num_cams))
     return cam_infos
 
 
-def farthest_point_sampling(points, k):
+def farthest_point_sampling(points, k, method="exact", seed=None, chunk_size=1 << 18, return_indices=False):
     """
     Sample k points from input pointcloud data points using Farthest Point Sampling.
 
@@ -215,22 +223,96 @@ def farthest_point_sampling(points, k):
         number of points and D is the dimensionality of each point.
     k: int
         The number of points to sample.
+    method: str
+        "exact" runs farthest point sampling with float32 distances updated
+        chunk by chunk; "voxel" keeps one random point per occupied voxel of the
+        coarsest power-of-two grid with at least k occupied voxels, then draws k
+        of them. The voxel variant is approximate but needs a single sort.
+    seed: int
+        Seed for the start point / voxel representatives, for reproducible results.
+    chunk_size: int
+        Number of points whose distances are updated at once (exact method).
+    return_indices: bool
+        Also return the indices of the sampled points.
 
     Returns:
     sampled_points: numpy.ndarray
         The sampled pointcloud data, a numpy array of shape (k, D).
     """
+    N = points.shape[0]
+    k = min(k, N)
+    rng = np.random.default_rng(seed)
+    if method == "exact":
+        indices = _farthest_point_indices(points, k, rng, chunk_size)
+    elif method == "voxel":
+        indices = _voxel_sample_indices(points, k, rng)
+    else:
+        raise ValueError("Unknown sampling method '{}', expected 'exact' or 'voxel'".format(method))
+    if return_indices:
+        return points[indices], indices
+    return points[indices]
+
+
+def _farthest_point_indices(points, k, rng, chunk_size):
     N, D = points.shape
-    farthest_pts = np.zeros((k, D))
-    distances = np.full(N, np.inf)
-    farthest = np.random.randint(0, N)
+    pts = np.ascontiguousarray(points, dtype=np.float32)
+    distances = np.full(N, np.inf, dtype=np.float32)
+    diff = np.empty((min(chunk_size, N), D), dtype=np.float32)
+    dist = np.empty(min(chunk_size, N), dtype=np.float32)
+    indices = np.empty(k, dtype=np.int64)
+    farthest = int(rng.integers(N))
     for i in range(k):
-        farthest_pts[i] = points[farthest]
-        centroid = points[farthest]
-        dist = np.sum((points - centroid) ** 2, axis=1)
-        distances = np.minimum(distances, dist)
-        farthest = np.argmax(distances)
-    return farthest_pts
+        indices[i] = farthest
+        centroid = pts[farthest]
+        best, best_dist = 0, -1.0
+        for start in range(0, N, chunk_size):
+            end = min(start + chunk_size, N)
+            n = end - start
+            np.subtract(pts[start:end], centroid, out=diff[:n])
+            np.einsum("ij,ij->i", diff[:n], diff[:n], out=dist[:n])
+            chunk = distances[start:end]
+            np.minimum(chunk, dist[:n], out=chunk)
+            arg = int(np.argmax(chunk))
+            if chunk[arg] > best_dist:
+                best, best_dist = start + arg, chunk[arg]
+        farthest = best
+    return indices
+
+
+def _voxel_sample_indices(points, k, rng):
+    # Points are sorted once along a Z-order curve; every voxel of an octree-style
+    # grid is then a contiguous run, so the occupancy of each level is a linear scan.
+    N, D = points.shape
+    bits = 63 // D
+    pts = np.asarray(points, dtype=np.float64)
+    lo = pts.min(axis=0)
+    extent = max(float((pts.max(axis=0) - lo).max()), 1e-12)
+    cells = ((pts - lo) / extent * ((1 << bits) - 1)).astype(np.uint64)
+    codes = np.zeros(N, dtype=np.uint64)
+    for b in range(bits):
+        for d in range(D):
+            codes |= ((cells[:, d] >> np.uint64(b)) & np.uint64(1)) << np.uint64(b * D + d)
+    order = np.argsort(codes)
+    codes = codes[order]
+
+    # coarsest level with at least k occupied voxels
+    for level in range(bits, -1, -1):
+        voxels = codes >> np.uint64(level * D)
+        boundary = np.empty(N, dtype=bool)
+        boundary[0] = True
+        np.not_equal(voxels[1:], voxels[:-1], out=boundary[1:])
+        if np.count_nonzero(boundary) >= k:
+            break
+    starts = np.flatnonzero(boundary)
+    counts = np.diff(np.append(starts, N))
+    reps = order[starts + (rng.random(len(starts)) * counts).astype(np.int64)]
+    if len(reps) > k:
+        reps = rng.choice(reps, k, replace=False)
+    elif len(reps) < k:
+        # more points than resolvable voxels (duplicates): top up with random unused points
+        unused = np.setdiff1d(np.arange(N), reps)
+        reps = np.concatenate([reps, rng.choice(unused, k - len(reps), replace=False)])
+    return np.sort(reps)
 
 
 def fetchPly(path):
@@ -250,14 +332,8 @@ def storePly(path, xyz, rgb):
 
     normals = np.zeros_like(xyz)
 
-    elements = np.empty(xyz.shape[0], dtype=dtype)
     attributes = np.concatenate((xyz, normals, rgb), axis=1)
-    elements[:] = list(map(tuple, attributes))
-
-    # Create the PlyData object and write to file
-    vertex_element = PlyElement.describe(elements, 'vertex')
-    ply_data = PlyData([vertex_element])
-    ply_data.write(path)
+    write_vertex_ply(path, vertex_elements(attributes, dtype))
 
 
 def readColmapSceneInfo(path, images, eval, n_views=0, llffhold=8):
@@ -268,12 +344,12 @@ def readColmapSceneInfo(path, images, eval, n_views=0, llffhold=8):
     try:
         cameras_intrinsic_file = os.path.join(path, "sparse/0", "cameras.bin")
         cameras_extrinsic_file = os.path.join(path, "sparse/0", "images.bin")
-        cam_extrinsics = read_extrinsics_binary(cameras_extrinsic_file)
+        cam_extrinsics = read_images_binary_indexed(cameras_extrinsic_file)
         cam_intrinsics = read_intrinsics_binary(cameras_intrinsic_file)
     except:
         cameras_extrinsic_file = os.path.join(path, "sparse/0", "images.txt")
         cameras_intrinsic_file = os.path.join(path, "sparse/0", "cameras.txt")
-        cam_extrinsics = read_extrinsics_text(cameras_extrinsic_file)
+        cam_extrinsics = ColmapImages.from_images(read_extrinsics_text(cameras_extrinsic_file))
         cam_intrinsics = read_intrinsics_text(cameras_intrinsic_file)
 
 
@@ -287,7 +363,6 @@ def readColmapSceneInfo(path, images, eval, n_views=0, llffhold=8):
     reading_dir = "images" if images == None else images
     rgb_mapping = [f for f in sorted(glob.glob(os.path.join(path, reading_dir, '*')))
                    if f.endswith('JPG') or f.endswith('jpg') or f.endswith('png')]
-    cam_extrinsics = {cam_extrinsics[k].name: cam_extrinsics[k] for k in cam_extrinsics}
     cam_infos_unsorted = readColmapCameras(cam_extrinsics=cam_extrinsics, cam_intrinsics=cam_intrinsics,
                              images_folder=os.path.join(path, reading_dir),  path=path, rgb_mapping=rgb_mapping)
     cam_infos = sorted(cam_infos_unsorted.copy(), key = lambda x : x.image_name)
@@ -417,7 +492,38 @@ def readNerfSyntheticInfo(path, white_background, eval, n_views=0, extension=".p
     return scene_info
 
 
+def readPackedSceneInfo(path, eval, n_views=0):
+    # Everything comes from one memory-mapped file written by tools/pack_dataset.py;
+    # image levels and the point cloud are views that are only read when touched.
+    pack = open_pack(os.path.join(path, PACK_NAME))
+    if (pack.index["eval"], pack.index["n_views"]) != (bool(eval), n_views):
+        raise ValueError("{} was packed with eval={}, n_views={}; repack it for eval={}, n_views={}".format(
+            pack.path, pack.index["eval"], pack.index["n_views"], bool(eval), n_views))
+
+    cam_infos = []
+    for cam in pack.index["cameras"]:
+        levels = {tuple(level["size"]): pack.array(level["image"]) for level in cam["levels"]}
+        cam_infos.append(CameraInfo(uid=cam["uid"], R=np.array(cam["R"]), T=np.array(cam["T"]),
+                                    FovY=cam["FovY"], FovX=cam["FovX"], image=PackedImage(cam["size"], levels),
+                                    image_path=cam["image_path"], image_name=cam["image_name"],
+                                    width=cam["width"], height=cam["height"],
+                                    mask=None if cam["mask"] is None else pack.array(cam["mask"]),
+                                    bounds=None if cam["bounds"] is None else np.array(cam["bounds"])))
+    train_cam_infos = [cam_infos[idx] for idx in pack.index["train"]]
+    test_cam_infos = [cam_infos[idx] for idx in pack.index["test"]]
+
+    pcd = None
+    if pack.index["point_cloud"] is not None:
+        pcd = BasicPointCloud(**{k: pack.array(v) for k, v in pack.index["point_cloud"].items()})
+    return SceneInfo(point_cloud=pcd,
+                     train_cameras=train_cam_infos,
+                     test_cameras=test_cam_infos,
+                     nerf_normalization=getNerfppNorm(train_cam_infos),
+                     ply_path=pack.path)
+
+
 sceneLoadTypeCallbacks = {
     "Colmap": readColmapSceneInfo,
-    "Blender" : readNerfSyntheticInfo
+    "Blender" : readNerfSyntheticInfo,
+    "Packed" : readPackedSceneInfo
 }
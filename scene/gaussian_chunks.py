@@ -0,0 +1,194 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+"""
+Out-of-core storage of trained models (point_cloud/iteration_<n>/point_cloud.gschunks).
+
+The Gaussians are cut into the cells of an octree over their Morton codes,
+each cell split until it holds at most `max_chunk_size` Gaussians. A chunk
+is one float32 blob of activated attributes (xyz, opacity, scaling,
+rotation, SH features) in the pack container of scene.dataset_pack, with
+its bounding box (grown by 3 sigma) in the index. GaussianStream renders
+from such a file with only the chunks in view resident on the device.
+"""
+
+import numpy as np
+import torch
+from collections import OrderedDict
+from scene.dataset_pack import PackWriter, PackedDataset
+from scene.gaussian_model import BakedGaussianModel
+from utils.knn_utils import morton_codes, octree_chunks
+from utils.ply_utils import read_vertex_attributes
+
+CHUNKS_NAME = "point_cloud.gschunks"
+CHUNKS_MAGIC = b"GSCHUNK\x01"
+# columns of a chunk row before the SH features
+_XYZ, _OPACITY, _SCALING, _ROTATION, _FEATURES = slice(0, 3), slice(3, 4), slice(4, 7), slice(7, 11), 11
+
+
+def write_chunks(path, xyz, gather, sh_degree, features_shape, max_chunk_size=1 << 16):
+    """
+    Write a chunked model. `xyz` (N, 3) is all that is held for every
+    Gaussian; gather(index) returns the (n, 11 + F) float32 rows of the
+    given Gaussians, so the attributes can come straight from a memory map.
+    """
+    codes = morton_codes(torch.as_tensor(xyz).cpu())
+    order = torch.argsort(codes)
+    codes = codes[order]
+    writer = PackWriter(path, magic=CHUNKS_MAGIC)
+    index = {"sh_degree": sh_degree, "features_shape": list(features_shape), "chunks": []}
+    for start, end in octree_chunks(codes, max_chunk_size):
+        rows = np.ascontiguousarray(gather(order[start:end].numpy()), dtype=np.float32)
+        reach = 3 * rows[:, _SCALING].max(axis=1, keepdims=True)
+        index["chunks"].append({"count": end - start,
+                                "lo": (rows[:, _XYZ] - reach).min(axis=0).tolist(),
+                                "hi": (rows[:, _XYZ] + reach).max(axis=0).tolist(),
+                                "rows": writer.add_array(rows)})
+    writer.close(index)
+    return index
+
+
+def chunk_model(model, path, max_chunk_size=1 << 16):
+    """Chunked store of a GaussianModel or BakedGaussianModel."""
+    with torch.no_grad():
+        rows = torch.cat((model.get_xyz, model.get_opacity, model.get_scaling, model.get_rotation,
+                          model.get_features.flatten(start_dim=1)), dim=1).float().cpu().numpy()
+    return write_chunks(path, rows[:, _XYZ], lambda index: rows[index], model.max_sh_degree,
+                        model.get_features.shape[1:], max_chunk_size)
+
+
+def chunk_ply(ply_path, path, max_chunk_size=1 << 16):
+    """Chunked store of a PLY written by GaussianModel.save_ply, read through a memory map."""
+    attributes, names = read_vertex_attributes(ply_path)
+    column = {name: idx for idx, name in enumerate(names)}
+
+    def columns(prefix):
+        group = sorted([name for name in names if name.startswith(prefix)], key=lambda x: int(x.split('_')[-1]))
+        return [column[name] for name in group]
+
+    f_dc, f_rest, scale, rot = columns("f_dc_"), columns("f_rest_"), columns("scale_"), columns("rot")
+    num_sh = (len(f_dc) + len(f_rest)) // 3
+    xyz_columns = [column["x"], column["y"], column["z"]]
+
+    def gather(index):
+        # read the rows in file order, then put them back in the order asked for
+        vertices = attributes[np.sort(index)][np.argsort(np.argsort(index))]
+        rotation = vertices[:, rot]
+        # (n, 3, SH) as save_ply lays them out, to the (n, SH, 3) of get_features
+        features = np.concatenate((vertices[:, f_dc], vertices[:, f_rest]), axis=1)
+        features = np.concatenate((features[:, :3].reshape(-1, 3, 1), features[:, 3:].reshape(-1, 3, num_sh - 1)),
+                                  axis=2).transpose(0, 2, 1).reshape(len(index), -1)
+        return np.concatenate((vertices[:, xyz_columns],
+                               1 / (1 + np.exp(-vertices[:, [column["opacity"]]])),
+                               np.exp(vertices[:, scale]),
+                               rotation / np.linalg.norm(rotation, axis=1, keepdims=True),
+                               features), axis=1)
+
+    return write_chunks(path, np.array(attributes[:, xyz_columns]), gather, int(round(num_sh ** 0.5)) - 1,
+                        (num_sh, 3), max_chunk_size)
+
+
+class GaussianStream:
+    """
+    Renders a chunked store without holding it on the device. render()
+    accepts a stream in place of a GaussianModel: for each view the chunks
+    whose box intersects the camera frustum are paged in, nearest first, and
+    kept in an LRU cache of at most `budget` bytes (the model passed to the
+    rasterizer, the concatenation of the visible chunks, comes on top).
+    Visible chunks that do not fit next to the ones already drawn this
+    frame are skipped and counted as dropped. hits, misses, evictions,
+    dropped and paged_bytes count the paging work.
+    """
+    def __init__(self, path, budget, device="cuda"):
+        self.pack = PackedDataset(path, magic=CHUNKS_MAGIC)
+        self.budget = budget
+        self.device = device
+        index = self.pack.index
+        self.sh_degree = index["sh_degree"]
+        self.features_shape = tuple(index["features_shape"])
+        self.chunks = index["chunks"]
+        self.lo = torch.tensor([chunk["lo"] for chunk in self.chunks]).reshape(-1, 3)
+        self.hi = torch.tensor([chunk["hi"] for chunk in self.chunks]).reshape(-1, 3)
+        self.row_bytes = 4 * (_FEATURES + int(np.prod(self.features_shape)))
+        self.resident = OrderedDict()
+        self.resident_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.dropped = 0
+        self.paged_bytes = 0
+        self._drawn = None
+        self._model = None
+
+    @property
+    def num_gaussians(self):
+        return sum(chunk["count"] for chunk in self.chunks)
+
+    @property
+    def hit_rate(self):
+        return self.hits / max(self.hits + self.misses, 1)
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": self.hit_rate, "evictions": self.evictions,
+                "dropped": self.dropped, "paged_bytes": self.paged_bytes, "resident_bytes": self.resident_bytes,
+                "resident_chunks": len(self.resident)}
+
+    def visible_chunks(self, camera):
+        """Chunks whose box is not entirely outside one side of the view frustum, nearest first."""
+        corners = torch.stack([torch.stack((self.lo[:, 0] if i & 1 else self.hi[:, 0],
+                                            self.lo[:, 1] if i & 2 else self.hi[:, 1],
+                                            self.lo[:, 2] if i & 4 else self.hi[:, 2]), dim=1) for i in range(8)], dim=1)
+        clip = torch.cat((corners, torch.ones_like(corners[..., :1])), dim=-1) @ camera.full_proj_transform.cpu()
+        x, y, z, w = clip.unbind(-1)
+        outside = ((x < -w).all(1) | (x > w).all(1) | (y < -w).all(1) | (y > w).all(1) | (z < 0).all(1))
+        visible = torch.nonzero(~outside).squeeze(-1)
+        distance = (((self.lo + self.hi) / 2)[visible] - camera.camera_center.cpu()).norm(dim=1)
+        return visible[torch.argsort(distance)].tolist()
+
+    def _page_in(self, chunk_id):
+        # kept split by attribute, so that a frame concatenates straight into contiguous tensors
+        rows = torch.from_numpy(np.array(self.pack.array(self.chunks[chunk_id]["rows"]))).to(self.device)
+        self.paged_bytes += rows.shape[0] * self.row_bytes
+        return (rows[:, _XYZ].contiguous(), rows[:, _OPACITY].contiguous(), rows[:, _SCALING].contiguous(),
+                rows[:, _ROTATION].contiguous(), rows[:, _FEATURES:].reshape((-1,) + self.features_shape))
+
+    def cut(self, camera):
+        """Baked model of the resident chunks in view of `camera`, paging in the missing ones."""
+        drawn = []
+        for chunk_id in self.visible_chunks(camera):
+            if chunk_id in self.resident:
+                self.hits += 1
+                self.resident.move_to_end(chunk_id)
+                drawn.append(chunk_id)
+                continue
+            self.misses += 1
+            size = self.chunks[chunk_id]["count"] * self.row_bytes
+            # chunks drawn this frame are the most recently used; never evict those
+            while self.resident_bytes + size > self.budget and len(self.resident) > len(drawn):
+                _, evicted = self.resident.popitem(last=False)
+                self.resident_bytes -= evicted[0].shape[0] * self.row_bytes
+                self.evictions += 1
+            if self.resident_bytes + size > self.budget:
+                self.dropped += 1
+                continue
+            self.resident[chunk_id] = self._page_in(chunk_id)
+            self.resident_bytes += size
+            drawn.append(chunk_id)
+
+        if drawn != self._drawn:
+            if drawn:
+                tensors = [torch.cat(parts) for parts in zip(*[self.resident[chunk_id] for chunk_id in drawn])]
+            else:
+                tensors = [torch.empty((0,) + shape, device=self.device)
+                           for shape in ((3,), (1,), (3,), (4,), self.features_shape)]
+            self._model = BakedGaussianModel.from_tensors(*tensors, self.sh_degree)
+            self._drawn = drawn
+        return self._model
@@ -0,0 +1,173 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+"""
+Compressed Gaussian models (point_cloud/iteration_<n>/point_cloud.gsz).
+
+The file uses the container of scene.dataset_pack with its own magic. The
+Gaussians are sorted along a Morton curve and cut into the octree cells of
+at most `block_size` Gaussians (so every block is spatially compact), and
+the blocks decode independently:
+- positions as uint16 over the per-block, per-channel range;
+- f_dc as float16;
+- opacity (after the sigmoid) as uint8;
+- log-scales as uint8 over the per-block, per-channel range;
+- normalized rotations as uint8 in [-1, 1];
+- f_rest as uint16 indices into one vector-quantized codebook of float16 SH
+  vectors shared by all blocks.
+"""
+
+import numpy as np
+import torch
+from concurrent.futures import ThreadPoolExecutor
+from scene.dataset_pack import PackWriter, PackedDataset
+from utils.general_utils import inverse_sigmoid
+from utils.knn_utils import morton_codes, octree_chunks
+
+COMPRESSED_NAME = "point_cloud.gsz"
+CODEC_MAGIC = b"GSCODEC\x01"
+CODEC_VERSION = 2
+
+
+def kmeans(vectors, num_clusters, iterations=10, sample_size=1 << 18, chunk_size=1 << 14, seed=0):
+    """
+    Codebook of `num_clusters` centroids fitted by Lloyd iterations on a
+    random sample of the rows, and the index of the nearest centroid of
+    every row. Distances are computed in chunks, on the device of `vectors`.
+    """
+    generator = torch.Generator(device="cpu").manual_seed(seed)
+    num_clusters = min(num_clusters, vectors.shape[0])
+    sample = vectors[torch.randperm(vectors.shape[0], generator=generator)[:sample_size].to(vectors.device)]
+    centroids = sample[torch.randperm(sample.shape[0], generator=generator)[:num_clusters].to(vectors.device)].clone()
+
+    def assign(rows):
+        labels = torch.empty(rows.shape[0], dtype=torch.int64, device=rows.device)
+        centroid_norm = (centroids ** 2).sum(dim=1)
+        for start in range(0, rows.shape[0], chunk_size):
+            chunk = rows[start:start + chunk_size]
+            labels[start:start + chunk_size] = (centroid_norm[None] - 2 * chunk @ centroids.T).argmin(dim=1)
+        return labels
+
+    for _ in range(iterations):
+        labels = assign(sample)
+        sums = torch.zeros_like(centroids).index_add_(0, labels, sample)
+        counts = torch.bincount(labels, minlength=num_clusters)
+        # clusters that lost all their samples keep their previous centroid
+        filled = counts > 0
+        centroids[filled] = sums[filled] / counts[filled, None].to(sums.dtype)
+    return centroids, assign(vectors)
+
+
+def compress_gaussians(model, path, block_size=1 << 16, codebook_size=4096, kmeans_iterations=10, seed=0):
+    """
+    Write the Gaussians of `model` to `path`; returns the index that was
+    written. The rows are stored in Morton order, not in the order of `model`.
+    """
+    with torch.no_grad():
+        codes = morton_codes(model._xyz)
+        order = torch.argsort(codes)
+        codes = codes[order].cpu()
+        xyz = model._xyz.detach().float()[order]
+        num = xyz.shape[0]
+        f_dc = model._features_dc.detach().flatten(start_dim=1).float()[order]
+        f_rest = model._features_rest.detach().flatten(start_dim=1).float()[order]
+        opacity = model.get_opacity.detach().float()[order]
+        log_scale = model._scaling.detach().float()[order]
+        rotation = torch.nn.functional.normalize(model._rotation.detach().float()[order])
+        # q and -q are the same rotation: keep w >= 0 so that it is not wasted on a sign
+        rotation = torch.where(rotation[:, :1] < 0, -rotation, rotation)
+
+        writer = PackWriter(path, magic=CODEC_MAGIC)
+        index = {"codec_version": CODEC_VERSION, "num_gaussians": num, "sh_degree": model.max_sh_degree,
+                 "f_dc_shape": list(model._features_dc.shape[1:]), "f_rest_shape": list(model._features_rest.shape[1:]),
+                 "blocks": []}
+        if f_rest.shape[1] and num:
+            codebook, labels = kmeans(f_rest, min(codebook_size, 1 << 16), kmeans_iterations, seed=seed)
+            index["codebook"] = writer.add_array(codebook.half().cpu().numpy())
+        else:
+            labels = torch.zeros(num, dtype=torch.int64, device=xyz.device)
+
+        for start, end in octree_chunks(codes, block_size):
+            rows = slice(start, end)
+            xyz_lo = xyz[rows].min(dim=0).values
+            xyz_step = ((xyz[rows].max(dim=0).values - xyz_lo) / 65535).clamp_min(1e-12)
+            scale_lo = log_scale[rows].min(dim=0).values
+            scale_hi = log_scale[rows].max(dim=0).values
+            scale_step = ((scale_hi - scale_lo) / 255).clamp_min(1e-12)
+            index["blocks"].append({
+                "start": rows.start, "count": rows.stop - rows.start,
+                "xyz_lo": xyz_lo.tolist(), "xyz_step": xyz_step.tolist(),
+                "scale_lo": scale_lo.tolist(), "scale_step": scale_step.tolist(),
+                "xyz": writer.add_array(((xyz[rows] - xyz_lo) / xyz_step).round().clamp(0, 65535)
+                                        .to(torch.int32).cpu().numpy().astype(np.uint16)),
+                "f_dc": writer.add_array(f_dc[rows].half().cpu().numpy()),
+                "opacity": writer.add_array(_to_uint8(opacity[rows].squeeze(-1) * 255)),
+                "scaling": writer.add_array(_to_uint8((log_scale[rows] - scale_lo) / scale_step)),
+                "rotation": writer.add_array(_to_uint8((rotation[rows] + 1) * 127.5)),
+                "f_rest": writer.add_array(labels[rows].to(torch.int32).cpu().numpy().astype(np.uint16)),
+            })
+        writer.close(index)
+    return index
+
+
+def _to_uint8(values):
+    return values.round().clamp(0, 255).to(torch.uint8).cpu().numpy()
+
+
+def decompress_gaussians(path, device="cuda", workers=None):
+    """
+    Decode a compressed model into the raw (pre-activation) tensors GaussianModel
+    keeps: xyz, f_dc, f_rest, opacity, scaling and rotation, plus its sh_degree.
+    Blocks are decoded concurrently, each straight into its rows of the outputs.
+    """
+    pack = PackedDataset(path, magic=CODEC_MAGIC)
+    index = pack.index
+    if index["codec_version"] != CODEC_VERSION:
+        raise ValueError("Unsupported compressed model version {} in {}".format(index["codec_version"], path))
+    num = index["num_gaussians"]
+    out = {"xyz": torch.empty((num, 3), device=device),
+           "f_dc": torch.empty([num] + index["f_dc_shape"], device=device),
+           "f_rest": torch.empty([num] + index["f_rest_shape"], device=device),
+           "opacity": torch.empty((num, 1), device=device),
+           "scaling": torch.empty((num, 3), device=device),
+           "rotation": torch.empty((num, 4), device=device)}
+    codebook = None
+    if "codebook" in index:
+        codebook = torch.from_numpy(np.array(pack.array(index["codebook"]))).to(device).float()
+    opacity_eps = 0.5 / 255
+
+    def load(block, name):
+        return torch.from_numpy(np.array(pack.array(block[name]))).to(device)
+
+    def decode(block):
+        rows = slice(block["start"], block["start"] + block["count"])
+        out["xyz"][rows] = (load(block, "xyz").to(torch.int32).float() * torch.tensor(block["xyz_step"], device=device)
+                            + torch.tensor(block["xyz_lo"], device=device))
+        out["f_dc"][rows] = load(block, "f_dc").float().view((-1,) + tuple(index["f_dc_shape"]))
+        opacity = (load(block, "opacity").float() / 255).clamp(opacity_eps, 1 - opacity_eps)
+        out["opacity"][rows] = inverse_sigmoid(opacity)[:, None]
+        out["scaling"][rows] = (load(block, "scaling").float() * torch.tensor(block["scale_step"], device=device)
+                                + torch.tensor(block["scale_lo"], device=device))
+        out["rotation"][rows] = load(block, "rotation").float() / 127.5 - 1
+        if codebook is not None:
+            labels = load(block, "f_rest").to(torch.int64)
+            out["f_rest"][rows] = codebook[labels].view((-1,) + tuple(index["f_rest_shape"]))
+
+    workers = workers or min(8, max(1, len(index["blocks"])))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        list(pool.map(decode, index["blocks"]))
+    out["sh_degree"] = index["sh_degree"]
+    return out
+
+
+def ply_nbytes(model):
+    """Size of the vertex block save_ply writes for `model` (float32 per attribute)."""
+    return model.get_xyz.shape[0] * len(model.construct_list_of_attributes()) * 4
@@ -0,0 +1,165 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import copy
+import math
+import torch
+from scene.gaussian_model import BakedGaussianModel
+from utils.general_utils import build_scaling_rotation
+from utils.knn_utils import morton_order
+
+
+def _matrix_to_quaternion(R):
+    # (w, x, y, z) of rotation matrices, the inverse of build_rotation; each row uses the
+    # formula of its largest diagonal term (Shepperd) so that no division is ill-conditioned
+    m = R
+    trace = m[:, 0, 0] + m[:, 1, 1] + m[:, 2, 2]
+    s = torch.stack((1 + trace, 1 + m[:, 0, 0] - m[:, 1, 1] - m[:, 2, 2],
+                     1 - m[:, 0, 0] + m[:, 1, 1] - m[:, 2, 2], 1 - m[:, 0, 0] - m[:, 1, 1] + m[:, 2, 2]), dim=1)
+    s = 2 * torch.sqrt(s.clamp_min(1e-12))
+    candidates = torch.stack((
+        torch.stack((s[:, 0] / 4, (m[:, 2, 1] - m[:, 1, 2]) / s[:, 0], (m[:, 0, 2] - m[:, 2, 0]) / s[:, 0],
+                     (m[:, 1, 0] - m[:, 0, 1]) / s[:, 0]), dim=1),
+        torch.stack(((m[:, 2, 1] - m[:, 1, 2]) / s[:, 1], s[:, 1] / 4, (m[:, 0, 1] + m[:, 1, 0]) / s[:, 1],
+                     (m[:, 0, 2] + m[:, 2, 0]) / s[:, 1]), dim=1),
+        torch.stack(((m[:, 0, 2] - m[:, 2, 0]) / s[:, 2], (m[:, 0, 1] + m[:, 1, 0]) / s[:, 2], s[:, 2] / 4,
+                     (m[:, 1, 2] + m[:, 2, 1]) / s[:, 2]), dim=1),
+        torch.stack(((m[:, 1, 0] - m[:, 0, 1]) / s[:, 3], (m[:, 0, 2] + m[:, 2, 0]) / s[:, 3],
+                     (m[:, 1, 2] + m[:, 2, 1]) / s[:, 3], s[:, 3] / 4), dim=1)), dim=1)
+    case = torch.stack((trace, m[:, 0, 0], m[:, 1, 1], m[:, 2, 2]), dim=1).argmax(dim=1)
+    q = candidates[torch.arange(R.shape[0], device=R.device), case]
+    return torch.nn.functional.normalize(q)
+
+
+def _footprint(scaling):
+    # area of the largest cross-section of the ellipsoids, up to the factor pi
+    largest = scaling.sort(dim=1).values[:, 1:]
+    return largest[:, 0] * largest[:, 1]
+
+
+def merge_gaussians(xyz, opacity, scaling, rotation, features, group, num_groups):
+    """
+    Merge the Gaussians of each group into one. Every Gaussian is weighted by
+    opacity x footprint; the merged mean and covariance match the weighted
+    first and second moments of the group (the covariance is decomposed back
+    into scales and a rotation), SH coefficients are the weighted average,
+    and the opacity keeps the weighted footprint of the group on the larger
+    merged footprint.
+    """
+    weight = (opacity.squeeze(-1) * _footprint(scaling)).clamp_min(1e-30)
+    total = torch.zeros(num_groups, dtype=weight.dtype, device=weight.device).index_add_(0, group, weight)
+
+    def average(values):
+        shape = (-1,) + (1,) * (values.dim() - 1)
+        summed = torch.zeros((num_groups,) + tuple(values.shape[1:]), dtype=values.dtype, device=values.device)
+        return summed.index_add_(0, group, values * weight.view(shape)) / total.view(shape)
+
+    mean = average(xyz)
+    L = build_scaling_rotation(scaling, rotation)
+    offset = xyz - mean[group]
+    covariance = average(L @ L.transpose(1, 2) + offset[:, :, None] * offset[:, None, :])
+    eigenvalues, eigenvectors = torch.linalg.eigh(covariance.double())
+    # eigh may return a reflection; the rotation needs det = +1
+    eigenvectors[:, :, 2] *= torch.sign(torch.linalg.det(eigenvectors))[:, None]
+    merged_scaling = eigenvalues.clamp_min(1e-20).sqrt().float()
+    merged_opacity = (total / _footprint(merged_scaling)).clamp(max=0.99)[:, None]
+    return mean, merged_opacity, merged_scaling, _matrix_to_quaternion(eigenvectors.float()), average(features)
+
+
+class GaussianHierarchy:
+    """
+    Level-of-detail tree over a trained model for rendering. The leaves are
+    the Gaussians in Morton order; every `branching` consecutive nodes of a
+    level are merged (merge_gaussians) into a node of the next level, up to
+    at most `branching` roots. Each node has a radius bounding its subtree.
+
+    render() accepts a hierarchy in place of a GaussianModel and draws the
+    cut for the view: the coarsest nodes whose radius projects to at most
+    `error` pixels (or that lie behind the camera), leaves otherwise.
+    error = 0 renders all leaves.
+    """
+    def __init__(self, model, error=1.0, branching=8):
+        self.error = error
+        self.branching = branching
+        baked = model if isinstance(model, BakedGaussianModel) else model.bake()
+        with torch.no_grad():
+            self.leaves = baked.subset(morton_order(baked.get_xyz))
+            level = (self.leaves.get_xyz, self.leaves.get_opacity, self.leaves.get_scaling,
+                     self.leaves.get_rotation, self.leaves.get_features)
+            has_confidence = self.leaves.confidence.shape[0] == level[0].shape[0]
+            confidence = self.leaves.confidence
+            radius = 3 * level[2].max(dim=1).values
+            levels, radii, parents, confidences = [level], [radius], [], [confidence]
+            self.level_offsets = [0]
+            while level[0].shape[0] > branching:
+                count = level[0].shape[0]
+                num_groups = math.ceil(count / branching)
+                group = torch.arange(count, device=radius.device) // branching
+                self.level_offsets.append(self.level_offsets[-1] + count)
+                parents.append(group + self.level_offsets[-1])
+                merged = merge_gaussians(*level, group, num_groups)
+                # a node bounds the nodes it merges as well as its own ellipsoid
+                reach = (level[0] - merged[0][group]).norm(dim=1) + radius
+                radius = torch.maximum(3 * merged[2].max(dim=1).values,
+                                       torch.zeros(num_groups, device=reach.device).scatter_reduce(
+                                           0, group, reach, reduce="amax", include_self=False))
+                if has_confidence:
+                    confidence = torch.zeros((num_groups, 1), device=confidence.device).index_add_(
+                        0, group, confidence) / torch.bincount(group, minlength=num_groups)[:, None]
+                    confidences.append(confidence)
+                level = merged
+                levels.append(level)
+                radii.append(radius)
+            self.level_offsets.append(self.level_offsets[-1] + level[0].shape[0])
+            parents.append(torch.full((level[0].shape[0],), -1, dtype=torch.int64, device=radius.device))
+
+            self.nodes = copy.copy(self.leaves)
+            (self.nodes._xyz, self.nodes._opacity, self.nodes._scaling, self.nodes._rotation,
+             self.nodes._features) = [torch.cat(tensors).contiguous() for tensors in zip(*levels)]
+            self.nodes._raw_rotation = self.nodes._rotation
+            self.nodes._covariance = {}
+            if has_confidence:
+                self.nodes.confidence = torch.cat(confidences)
+            self.radius = torch.cat(radii)
+            self.parent = torch.cat(parents)
+        self.last_cut_size = self.leaves.get_xyz.shape[0]
+
+    @property
+    def num_leaves(self):
+        return self.leaves.get_xyz.shape[0]
+
+    def cut(self, camera, error=None):
+        """Baked model of the nodes to render from `camera` with at most `error` pixels of merging."""
+        error = self.error if error is None else error
+        if error <= 0:
+            self.last_cut_size = self.num_leaves
+            return self.leaves
+        with torch.no_grad():
+            view = camera.world_view_transform
+            depth = self.nodes.get_xyz @ view[:3, 2] + view[3, 2]
+            focal = max(camera.image_height / (2 * math.tan(camera.FoVy / 2)),
+                        camera.image_width / (2 * math.tan(camera.FoVx / 2)))
+            projected = self.radius * focal / depth.clamp_min(camera.znear)
+            fine = (projected <= error) | (depth + self.radius < camera.znear)
+
+            # top-down: a node is drawn when all its ancestors are too coarse and it is fine enough (or a leaf)
+            selected = torch.zeros_like(fine)
+            expanded = torch.zeros_like(fine)
+            top = slice(self.level_offsets[-2], self.level_offsets[-1])
+            selected[top] = fine[top] | (len(self.level_offsets) == 2)
+            expanded[top] = ~fine[top]
+            for level in range(len(self.level_offsets) - 3, -1, -1):
+                rows = slice(self.level_offsets[level], self.level_offsets[level + 1])
+                open_parent = expanded[self.parent[rows]]
+                selected[rows] = open_parent & (fine[rows] | (level == 0))
+                expanded[rows] = open_parent & ~fine[rows]
+            self.last_cut_size = int(selected.sum())
+            return self.nodes.subset(selected)
@@ -9,30 +9,94 @@
 # For inquiries contact  george.drettakis@inria.fr
 #
 import matplotlib.pyplot as plt
+import copy
 import torch
 import numpy as np
 from utils.general_utils import inverse_sigmoid, get_expon_lr_func, build_rotation
 from torch import nn
 import os
 from utils.system_utils import mkdir_p
-from plyfile import PlyData, PlyElement
+from utils.ply_utils import vertex_elements, write_vertex_ply, read_vertex_attributes
 from utils.sh_utils import RGB2SH
-from simple_knn._C import distCUDA2
+from utils.knn_utils import distKNN2, KNNCache, morton_order
+from utils.sparse_adam import SparseGaussianAdam
+from scene.gaussian_codec import compress_gaussians, decompress_gaussians
 from utils.graphics_utils import BasicPointCloud
 from utils.general_utils import strip_symmetric, build_scaling_rotation, chamfer_dist
 import open3d as o3d
 from torch.optim.lr_scheduler import MultiStepLR
 
 
+class DensificationPlan:
+    """
+    Rows of a Gaussian model being densified, tracked without copying the
+    parameters. Each row is an index into the current parameters (< num_source)
+    or into the block of newly created rows; `fresh` marks rows that get zero
+    optimizer moments (clones and new rows). Appends go to the end and pruning
+    keeps order, so the final set is always: the surviving current rows in
+    their original order, followed by the surviving fresh rows.
+    """
+    def __init__(self, params):
+        self.params = params
+        self.num_source = next(iter(params.values())).shape[0]
+        device = next(iter(params.values())).device
+        self.src = torch.arange(self.num_source, device=device)
+        self.fresh = torch.zeros(self.num_source, dtype=torch.bool, device=device)
+        self.new = {name: [] for name in params}
+        self.num_new = 0
+
+    def __len__(self):
+        return self.src.shape[0]
+
+    def rows(self, name, idx=None):
+        src = self.src if idx is None else self.src[idx]
+        param = self.params[name]
+        if self.num_new == 0:
+            return param[src]
+        new = torch.cat(self.new[name])
+        out = torch.empty((src.shape[0],) + tuple(param.shape[1:]), dtype=param.dtype, device=param.device)
+        current = src < self.num_source
+        out[current] = param[src[current]]
+        out[~current] = new[src[~current] - self.num_source]
+        return out
+
+    def append_copies(self, idx):
+        self.src = torch.cat((self.src, self.src[idx]))
+        self.fresh = torch.cat((self.fresh, torch.ones_like(idx, dtype=torch.bool)))
+
+    def append(self, values):
+        count = values["xyz"].shape[0]
+        for name in self.new:
+            self.new[name].append(values[name])
+        start = self.num_source + self.num_new
+        self.src = torch.cat((self.src, torch.arange(start, start + count, device=self.src.device)))
+        self.fresh = torch.cat((self.fresh, torch.ones(count, dtype=torch.bool, device=self.fresh.device)))
+        self.num_new += count
+
+    def keep(self, mask):
+        self.src = self.src[mask]
+        self.fresh = self.fresh[mask]
+
+    def source_mask(self):
+        """Mask over the current parameters of the rows that survive."""
+        mask = torch.zeros(self.num_source, dtype=torch.bool, device=self.src.device)
+        mask[self.src[~self.fresh]] = True
+        return mask
+
+    def fresh_rows(self, name):
+        return self.rows(name, torch.nonzero(self.fresh).squeeze(-1))
+
+
+def build_covariance_from_scaling_rotation(scaling, scaling_modifier, rotation):
+    L = build_scaling_rotation(scaling_modifier * scaling, rotation)
+    actual_covariance = L @ L.transpose(1, 2)
+    symm = strip_symmetric(actual_covariance)
+    return symm
+
+
 class GaussianModel:
 
     def setup_functions(self):
-        def build_covariance_from_scaling_rotation(scaling, scaling_modifier, rotation):
-            L = build_scaling_rotation(scaling_modifier * scaling, rotation)
-            actual_covariance = L @ L.transpose(1, 2)
-            symm = strip_symmetric(actual_covariance)
-            return symm
-
         self.scaling_activation = torch.exp
         self.scaling_inverse_activation = torch.log
 
@@ -63,20 +127,34 @@ class GaussianModel:
         self.setup_functions()
         self.bg_color = torch.empty(0)
         self.confidence = torch.empty(0)
+        self.capacity_storage = False
+        self._storage = {}
+        self.knn_cache = KNNCache()
 
     def capture(self):
+        # with capacity storage the parameters and their Adam moments are views of larger buffers, and torch.save
+        # writes the whole storage of a view; copy the active rows to keep the spare ones out of checkpoints
+        def compact(param):
+            return nn.Parameter(param.detach().clone()) if self.capacity_storage else param
+
+        optimizer_state = self.optimizer.state_dict()
+        if self.capacity_storage:
+            optimizer_state["state"] = {index: {key: value.clone() if torch.is_tensor(value) else value
+                                                for key, value in state.items()}
+                                        for index, state in optimizer_state["state"].items()}
+
         return (
             self.active_sh_degree,
-            self._xyz,
-            self._features_dc,
-            self._features_rest,
-            self._scaling,
-            self._rotation,
-            self._opacity,
+            compact(self._xyz),
+            compact(self._features_dc),
+            compact(self._features_rest),
+            compact(self._scaling),
+            compact(self._rotation),
+            compact(self._opacity),
             self.max_radii2D,
             self.xyz_gradient_accum,
             self.denom,
-            self.optimizer.state_dict(),
+            optimizer_state,
             self.spatial_lr_scale,
         )
 
@@ -128,6 +206,10 @@ class GaussianModel:
         if self.active_sh_degree < self.max_sh_degree:
             self.active_sh_degree += 1
 
+    def bake(self):
+        """Frozen, render-ready copy of the current model; see BakedGaussianModel."""
+        return BakedGaussianModel(self)
+
     def create_from_pcd(self, pcd: BasicPointCloud, spatial_lr_scale: float):
         self.spatial_lr_scale = spatial_lr_scale
         fused_point_cloud = torch.tensor(np.asarray(pcd.points)).cuda().float()
@@ -141,7 +223,7 @@ class GaussianModel:
         print("Number of points at initialisation : ", fused_point_cloud.shape[0])
         self.init_point = fused_point_cloud
 
-        dist2 = torch.clamp_min(distCUDA2(fused_point_cloud)[0], 0.0000001)
+        dist2 = torch.clamp_min(distKNN2(fused_point_cloud)[0], 0.0000001)
         scales = torch.log(torch.sqrt(dist2))[..., None].repeat(1, 3)
         rots = torch.zeros((fused_point_cloud.shape[0], 4), device="cuda")
         rots[:, 0] = 1
@@ -164,6 +246,9 @@ class GaussianModel:
 
     def training_setup(self, training_args):
         self.percent_dense = training_args.percent_dense
+        self.capacity_storage = training_args.capacity_storage
+        self._storage = {}
+        self.knn_cache = KNNCache(incremental=training_args.incremental_knn)
         self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
         self.denom = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
 
@@ -176,9 +261,12 @@ class GaussianModel:
             {'params': [self._rotation], 'lr': training_args.rotation_lr, "name": "rotation"},
         ]
         if self.args.train_bg:
-            l.append({'params': [self.bg_color], 'lr': 0.001, "name": "bg_color"})
+            l.append({'params': [self.bg_color], 'lr': 0.001, "name": "bg_color", "dense": True})
 
-        self.optimizer = torch.optim.Adam(l, lr=0.0, eps=1e-15)
+        if training_args.sparse_adam:
+            self.optimizer = SparseGaussianAdam(l, lr=0.0, eps=1e-15)
+        else:
+            self.optimizer = torch.optim.Adam(l, lr=0.0, eps=1e-15)
         self.xyz_scheduler_args = get_expon_lr_func(lr_init=training_args.position_lr_init * self.spatial_lr_scale,
                                                     lr_final=training_args.position_lr_final * self.spatial_lr_scale,
                                                     lr_delay_mult=training_args.position_lr_delay_mult,
@@ -221,11 +309,8 @@ class GaussianModel:
 
         dtype_full = [(attribute, 'f4') for attribute in self.construct_list_of_attributes()]
 
-        elements = np.empty(xyz.shape[0], dtype=dtype_full)
         attributes = np.concatenate((xyz, normals, f_dc, f_rest, opacities, scale, rotation), axis=1)
-        elements[:] = list(map(tuple, attributes))
-        el = PlyElement.describe(elements, 'vertex')
-        PlyData([el]).write(path)
+        write_vertex_ply(path, vertex_elements(attributes, dtype_full))
 
     def reset_opacity(self):
         opacities_new = inverse_sigmoid(torch.min(self.get_opacity, torch.ones_like(self.get_opacity) * 0.05))
@@ -234,53 +319,63 @@ class GaussianModel:
             self._opacity = optimizable_tensors["opacity"]
 
     def load_ply(self, path):
-        plydata = PlyData.read(path)
-
-        xyz = np.stack((np.asarray(plydata.elements[0]["x"]),
-                        np.asarray(plydata.elements[0]["y"]),
-                        np.asarray(plydata.elements[0]["z"])), axis=1)
-        opacities = np.asarray(plydata.elements[0]["opacity"])[..., np.newaxis]
-
-        features_dc = np.zeros((xyz.shape[0], 3, 1))
-        features_dc[:, 0, 0] = np.asarray(plydata.elements[0]["f_dc_0"])
-        features_dc[:, 1, 0] = np.asarray(plydata.elements[0]["f_dc_1"])
-        features_dc[:, 2, 0] = np.asarray(plydata.elements[0]["f_dc_2"])
-
-        extra_f_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("f_rest_")]
-        extra_f_names = sorted(extra_f_names, key=lambda x: int(x.split('_')[-1]))
-        assert len(extra_f_names) == 3 * (self.max_sh_degree + 1) ** 2 - 3
-        features_extra = np.zeros((xyz.shape[0], len(extra_f_names)))
-        for idx, attr_name in enumerate(extra_f_names):
-            features_extra[:, idx] = np.asarray(plydata.elements[0][attr_name])
+        # The whole vertex block is moved to the device in one copy and the
+        # attribute groups are gathered from it there.
+        attributes, names = read_vertex_attributes(path)
+        attributes = torch.tensor(attributes, dtype=torch.float, device="cuda")
+        column = {name: idx for idx, name in enumerate(names)}
+
+        def attribute_group(prefix):
+            group = sorted([name for name in names if name.startswith(prefix)], key=lambda x: int(x.split('_')[-1]))
+            return attributes[:, [column[name] for name in group]]
+
+        xyz = attributes[:, [column["x"], column["y"], column["z"]]]
+        opacities = attributes[:, [column["opacity"]]]
+        features_dc = attribute_group("f_dc_").reshape(-1, 3, 1)
+        features_extra = attribute_group("f_rest_")
+        assert features_extra.shape[1] == 3 * (self.max_sh_degree + 1) ** 2 - 3
         # Reshape (P,F*SH_coeffs) to (P, F, SH_coeffs except DC)
         features_extra = features_extra.reshape((features_extra.shape[0], 3, (self.max_sh_degree + 1) ** 2 - 1))
+        scales = attribute_group("scale_")
+        rots = attribute_group("rot")
+        del attributes
+
+        self._xyz = nn.Parameter(xyz.requires_grad_(True))
+        self._features_dc = nn.Parameter(features_dc.transpose(1, 2).contiguous().requires_grad_(True))
+        self._features_rest = nn.Parameter(features_extra.transpose(1, 2).contiguous().requires_grad_(True))
+        self._opacity = nn.Parameter(opacities.requires_grad_(True))
+        self._scaling = nn.Parameter(scales.requires_grad_(True))
+        self._rotation = nn.Parameter(rots.requires_grad_(True))
 
-        scale_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("scale_")]
-        scale_names = sorted(scale_names, key=lambda x: int(x.split('_')[-1]))
-        scales = np.zeros((xyz.shape[0], len(scale_names)))
-        for idx, attr_name in enumerate(scale_names):
-            scales[:, idx] = np.asarray(plydata.elements[0][attr_name])
-
-        rot_names = [p.name for p in plydata.elements[0].properties if p.name.startswith("rot")]
-        rot_names = sorted(rot_names, key=lambda x: int(x.split('_')[-1]))
-        rots = np.zeros((xyz.shape[0], len(rot_names)))
-        for idx, attr_name in enumerate(rot_names):
-            rots[:, idx] = np.asarray(plydata.elements[0][attr_name])
-
-        self._xyz = nn.Parameter(torch.tensor(xyz, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._features_dc = nn.Parameter(
-            torch.tensor(features_dc, dtype=torch.float, device="cuda").transpose(1, 2).contiguous().requires_grad_(
-                True))
-        self._features_rest = nn.Parameter(
-            torch.tensor(features_extra, dtype=torch.float, device="cuda").transpose(1, 2).contiguous().requires_grad_(
-                True))
-        self._opacity = nn.Parameter(torch.tensor(opacities, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._scaling = nn.Parameter(torch.tensor(scales, dtype=torch.float, device="cuda").requires_grad_(True))
-        self._rotation = nn.Parameter(torch.tensor(rots, dtype=torch.float, device="cuda").requires_grad_(True))
+        self.active_sh_degree = self.max_sh_degree
+
+    def save_compressed(self, path, **kwargs):
+        mkdir_p(os.path.dirname(path))
+        return compress_gaussians(self, path, **kwargs)
+
+    def load_compressed(self, path):
+        tensors = decompress_gaussians(path, device="cuda")
+        assert tensors["sh_degree"] == self.max_sh_degree
+
+        self._xyz = nn.Parameter(tensors["xyz"].requires_grad_(True))
+        self._features_dc = nn.Parameter(tensors["f_dc"].requires_grad_(True))
+        self._features_rest = nn.Parameter(tensors["f_rest"].requires_grad_(True))
+        self._opacity = nn.Parameter(tensors["opacity"].requires_grad_(True))
+        self._scaling = nn.Parameter(tensors["scaling"].requires_grad_(True))
+        self._rotation = nn.Parameter(tensors["rotation"].requires_grad_(True))
 
         self.active_sh_degree = self.max_sh_degree
 
 
+    @staticmethod
+    def _row_state(stored_state):
+        # optimizer state holding one entry per Gaussian (SparseGaussianAdam adds last_step)
+        return [key for key in ("exp_avg", "exp_avg_sq", "last_step") if key in stored_state]
+
+    @staticmethod
+    def _zero_rows(state, count):
+        return torch.zeros((count,) + tuple(state.shape[1:]), dtype=state.dtype, device=state.device)
+
     def replace_tensor_to_optimizer(self, tensor, name):
         optimizable_tensors = {}
         for group in self.optimizer.param_groups:
@@ -296,23 +391,70 @@ class GaussianModel:
                 optimizable_tensors[group["name"]] = group["params"][0]
         return optimizable_tensors
 
+    def _store_rows(self, name, key, tensor, mask=None, extension=None):
+        """
+        Capacity storage: return tensor[mask] followed by the extension rows as
+        the leading rows of a preallocated buffer. Rows already held by the
+        buffer are compacted in place, appends write after the active rows, and
+        the buffer doubles when it runs out of room.
+        """
+        with torch.no_grad():
+            buffer = self._storage.get((name, key))
+            in_buffer = buffer is not None and tensor.data_ptr() == buffer.data_ptr()
+            rows = tensor if mask is None else tensor[mask]
+            count = rows.shape[0]
+            total = count + (0 if extension is None else extension.shape[0])
+            if buffer is None or buffer.shape[0] < total:
+                capacity = max(total, 2 * (count if buffer is None else buffer.shape[0]))
+                buffer = torch.empty((capacity,) + tuple(tensor.shape[1:]), dtype=tensor.dtype, device=tensor.device)
+                buffer[:count] = rows
+                self._storage[(name, key)] = buffer
+            elif mask is not None or not in_buffer:
+                buffer[:count] = rows
+            if extension is not None:
+                buffer[count:total] = extension
+            return buffer[:total]
+
+    def _select_rows(self, name, key, tensor, mask):
+        if self.capacity_storage:
+            return self._store_rows(name, key, tensor, mask=mask)
+        return tensor[mask]
+
+    def _append_rows(self, name, key, tensor, extension):
+        if self.capacity_storage:
+            return self._store_rows(name, key, tensor, extension=extension)
+        return torch.cat((tensor, extension), dim=0)
+
+    def _compact_rows(self, name, key, tensor, mask, extension):
+        # tensor[mask] followed by extension, written once into the output
+        if self.capacity_storage:
+            return self._store_rows(name, key, tensor, mask=mask, extension=extension)
+        index = torch.nonzero(mask).squeeze(-1)
+        out = torch.empty((index.shape[0] + extension.shape[0],) + tuple(tensor.shape[1:]),
+                          dtype=tensor.dtype, device=tensor.device)
+        with torch.no_grad():
+            torch.index_select(tensor, 0, index, out=out[:index.shape[0]])
+            out[index.shape[0]:] = extension
+        return out
+
     def _prune_optimizer(self, mask):
         optimizable_tensors = {}
         for group in self.optimizer.param_groups:
             if group["name"] in ['bg_color']:
                 continue
+            name = group["name"]
             stored_state = self.optimizer.state.get(group['params'][0], None)
             if stored_state is not None:
-                stored_state["exp_avg"] = stored_state["exp_avg"][mask]
-                stored_state["exp_avg_sq"] = stored_state["exp_avg_sq"][mask]
+                for key in self._row_state(stored_state):
+                    stored_state[key] = self._select_rows(name, key, stored_state[key], mask)
 
                 del self.optimizer.state[group['params'][0]]
-                group["params"][0] = nn.Parameter((group["params"][0][mask].requires_grad_(True)))
+                group["params"][0] = nn.Parameter(self._select_rows(name, "param", group["params"][0], mask).requires_grad_(True))
                 self.optimizer.state[group['params'][0]] = stored_state
 
                 optimizable_tensors[group["name"]] = group["params"][0]
             else:
-                group["params"][0] = nn.Parameter(group["params"][0][mask].requires_grad_(True))
+                group["params"][0] = nn.Parameter(self._select_rows(name, "param", group["params"][0], mask).requires_grad_(True))
                 optimizable_tensors[group["name"]] = group["params"][0]
         return optimizable_tensors
 
@@ -357,24 +499,23 @@ class GaussianModel:
             if group["name"] in ['bg_color']:
                 continue
             assert len(group["params"]) == 1
+            name = group["name"]
             extension_tensor = tensors_dict[group["name"]]
             stored_state = self.optimizer.state.get(group['params'][0], None)
             if stored_state is not None:
-
-                stored_state["exp_avg"] = torch.cat((stored_state["exp_avg"], torch.zeros_like(extension_tensor)),
-                                                    dim=0)
-                stored_state["exp_avg_sq"] = torch.cat((stored_state["exp_avg_sq"], torch.zeros_like(extension_tensor)),
-                                                       dim=0)
+                for key in self._row_state(stored_state):
+                    stored_state[key] = self._append_rows(name, key, stored_state[key],
+                                                          self._zero_rows(stored_state[key], extension_tensor.shape[0]))
 
                 del self.optimizer.state[group['params'][0]]
                 group["params"][0] = nn.Parameter(
-                    torch.cat((group["params"][0], extension_tensor), dim=0).requires_grad_(True))
+                    self._append_rows(name, "param", group["params"][0], extension_tensor).requires_grad_(True))
                 self.optimizer.state[group['params'][0]] = stored_state
 
                 optimizable_tensors[group["name"]] = group["params"][0]
             else:
                 group["params"][0] = nn.Parameter(
-                    torch.cat((group["params"][0], extension_tensor), dim=0).requires_grad_(True))
+                    self._append_rows(name, "param", group["params"][0], extension_tensor).requires_grad_(True))
                 optimizable_tensors[group["name"]] = group["params"][0]
 
         return optimizable_tensors
@@ -402,96 +543,233 @@ class GaussianModel:
         self.confidence = torch.cat([self.confidence, torch.ones(new_opacities.shape, device="cuda")], 0)
 
 
-    def proximity(self, scene_extent, N = 3):
-        dist, nearest_indices = distCUDA2(self.get_xyz)
-        selected_pts_mask = torch.logical_and(dist > (5. * scene_extent),
-                                              torch.max(self.get_scaling, dim=1).values > (scene_extent))
-
-        new_indices = nearest_indices[selected_pts_mask].reshape(-1).long()
-        source_xyz = self._xyz[selected_pts_mask].repeat(1, N, 1).reshape(-1, 3)
-        target_xyz = self._xyz[new_indices]
-        new_xyz = (source_xyz + target_xyz) / 2
-        new_scaling = self._scaling[new_indices]
-        new_rotation = torch.zeros_like(self._rotation[new_indices])
-        new_rotation[:, 0] = 1
-        new_features_dc = torch.zeros_like(self._features_dc[new_indices])
-        new_features_rest = torch.zeros_like(self._features_rest[new_indices])
-        new_opacity = self._opacity[new_indices]
-        self.densification_postfix(new_xyz, new_features_dc, new_features_rest, new_opacity, new_scaling, new_rotation)
-
-
+    def plan_densify_and_prune(self, grads, max_grad, min_opacity, extent, max_screen_size, iter, N=2, N_proximity=3):
+        """
+        Make the densification decisions on a DensificationPlan, in order:
+        clone small Gaussians with large gradients, split large ones (or ones
+        far from their neighbours) into N samples, fill the gaps to isolated
+        large Gaussians with N_proximity midpoints (before iteration 2000) and
+        prune transparent or oversized ones. Only positions, scales and the
+        rows that are actually duplicated are gathered; the parameters are not
+        copied.
+        """
+        plan = DensificationPlan({"xyz": self._xyz, "f_dc": self._features_dc, "f_rest": self._features_rest,
+                                  "opacity": self._opacity, "scaling": self._scaling, "rotation": self._rotation})
+        prune = iter > self.args.prune_from_iter
+
+        # clone
+        selected_pts_mask = torch.where(torch.norm(grads, dim=-1) >= max_grad, True, False)
+        selected_pts_mask = torch.logical_and(selected_pts_mask,
+                                              torch.max(self.get_scaling, dim=1).values <= self.percent_dense * extent)
+        plan.append_copies(torch.nonzero(selected_pts_mask).squeeze(-1))
 
-    def densify_and_split(self, grads, grad_threshold, scene_extent, iter, N=2):
-        n_init_points = self.get_xyz.shape[0]
-        # Extract points that satisfy the gradient condition
-        padded_grad = torch.zeros((n_init_points), device="cuda")
+        # split
+        scaling = self.scaling_activation(plan.rows("scaling"))
+        padded_grad = torch.zeros((len(plan)), device=grads.device)
         padded_grad[:grads.shape[0]] = grads.squeeze()
-        selected_pts_mask = torch.where(padded_grad >= grad_threshold, True, False)
+        selected_pts_mask = torch.where(padded_grad >= max_grad, True, False)
         selected_pts_mask = torch.logical_and(selected_pts_mask,
-                                              torch.max(self.get_scaling,
-                                                        dim=1).values > self.percent_dense * scene_extent)
-
-        dist, _ = distCUDA2(self.get_xyz)
-        selected_pts_mask2 = torch.logical_and(dist > (self.args.dist_thres * scene_extent),
-                                               torch.max(self.get_scaling, dim=1).values > ( scene_extent))
+                                              torch.max(scaling, dim=1).values > self.percent_dense * extent)
+        dist, _ = self.knn_cache.query(plan.rows("xyz"))
+        selected_pts_mask2 = torch.logical_and(dist > (self.args.dist_thres * extent),
+                                               torch.max(scaling, dim=1).values > (extent))
         selected_pts_mask = torch.logical_or(selected_pts_mask, selected_pts_mask2)
+        selected = torch.nonzero(selected_pts_mask).squeeze(-1)
 
-        stds = self.get_scaling[selected_pts_mask].repeat(N, 1)
-        means = torch.zeros((stds.size(0), 3), device="cuda")
+        stds = scaling[selected_pts_mask].repeat(N, 1)
+        means = torch.zeros((stds.size(0), 3), device=stds.device)
         samples = torch.normal(mean=means, std=stds)
-        rots = build_rotation(self._rotation[selected_pts_mask]).repeat(N, 1, 1)
-        new_xyz = torch.bmm(rots, samples.unsqueeze(-1)).squeeze(-1) + self.get_xyz[selected_pts_mask].repeat(N, 1)
-        new_scaling = self.scaling_inverse_activation(self.get_scaling[selected_pts_mask].repeat(N, 1) / (0.8 * N))
-        new_rotation = self._rotation[selected_pts_mask].repeat(N, 1)
-        new_features_dc = self._features_dc[selected_pts_mask].repeat(N, 1, 1)
-        new_features_rest = self._features_rest[selected_pts_mask].repeat(N, 1, 1)
-        new_opacity = self._opacity[selected_pts_mask].repeat(N, 1)
-
-        self.densification_postfix(new_xyz, new_features_dc, new_features_rest, new_opacity, new_scaling, new_rotation)
-
-        prune_filter = torch.cat(
-            (selected_pts_mask, torch.zeros(N * selected_pts_mask.sum(), device="cuda", dtype=bool)))
-        self.prune_points(prune_filter, iter)
-
-
-    def densify_and_clone(self, grads, grad_threshold, scene_extent):
-        # Extract points that satisfy the gradient condition
-        selected_pts_mask = torch.where(torch.norm(grads, dim=-1) >= grad_threshold, True, False)
-        selected_pts_mask = torch.logical_and(selected_pts_mask,
-                                              torch.max(self.get_scaling,
-                                                        dim=1).values <= self.percent_dense * scene_extent)
-
-        new_xyz = self._xyz[selected_pts_mask]
-        new_features_dc = self._features_dc[selected_pts_mask]
-        new_features_rest = self._features_rest[selected_pts_mask]
-        new_opacities = self._opacity[selected_pts_mask]
-        new_scaling = self._scaling[selected_pts_mask]
-        new_rotation = self._rotation[selected_pts_mask]
+        rotation = plan.rows("rotation", selected)
+        rots = build_rotation(rotation).repeat(N, 1, 1)
+        split_xyz = torch.bmm(rots, samples.unsqueeze(-1)).squeeze(-1) + plan.rows("xyz", selected).repeat(N, 1)
+        plan.append({"xyz": split_xyz,
+                     "scaling": self.scaling_inverse_activation(scaling[selected_pts_mask].repeat(N, 1) / (0.8 * N)),
+                     "rotation": rotation.repeat(N, 1),
+                     "f_dc": plan.rows("f_dc", selected).repeat(N, 1, 1),
+                     "f_rest": plan.rows("f_rest", selected).repeat(N, 1, 1),
+                     "opacity": plan.rows("opacity", selected).repeat(N, 1)})
+        # the neighbour search of the split step is patched for the proximity step instead of redone
+        self.knn_cache.append(split_xyz)
+        if prune:
+            keep_mask = ~torch.cat((selected_pts_mask, torch.zeros(N * selected.shape[0], device=selected_pts_mask.device,
+                                                                   dtype=bool)))
+            plan.keep(keep_mask)
+            self.knn_cache.select(keep_mask)
+
+        # proximity
+        if iter < 2000:
+            xyz = plan.rows("xyz")
+            dist, nearest_indices = self.knn_cache.query(xyz)
+            selected_pts_mask = torch.logical_and(dist > (5. * extent),
+                                                  torch.max(self.scaling_activation(plan.rows("scaling")), dim=1).values > (extent))
+            new_indices = nearest_indices[selected_pts_mask].reshape(-1).long()
+            source_xyz = xyz[selected_pts_mask].repeat(1, N_proximity, 1).reshape(-1, 3)
+            new_rotation = torch.zeros((new_indices.shape[0], self._rotation.shape[1]), device=xyz.device)
+            new_rotation[:, 0] = 1
+            plan.append({"xyz": (source_xyz + xyz[new_indices]) / 2,
+                         "scaling": plan.rows("scaling", new_indices),
+                         "rotation": new_rotation,
+                         "f_dc": torch.zeros((new_indices.shape[0],) + tuple(self._features_dc.shape[1:]), device=xyz.device),
+                         "f_rest": torch.zeros((new_indices.shape[0],) + tuple(self._features_rest.shape[1:]), device=xyz.device),
+                         "opacity": plan.rows("opacity", new_indices)})
+
+        # prune; max_radii2D has been reset by the densification, so only the world-space size test can fire
+        prune_mask = (self.opacity_activation(plan.rows("opacity")) < min_opacity).squeeze()
+        if max_screen_size:
+            big_points_ws = self.scaling_activation(plan.rows("scaling")).max(dim=1).values > 0.1 * extent
+            prune_mask = torch.logical_or(prune_mask, big_points_ws)
+        if prune:
+            plan.keep(~prune_mask)
+        return plan
+
+    def apply_densification_plan(self, plan):
+        """Build the densified model in one pass: surviving rows, then the fresh rows appended."""
+        keep_mask = plan.source_mask()
+        optimizable_tensors = {}
+        for group in self.optimizer.param_groups:
+            if group["name"] in ['bg_color']:
+                continue
+            name = group["name"]
+            extension = plan.fresh_rows(name)
+            stored_state = self.optimizer.state.get(group['params'][0], None)
+            param = self._compact_rows(name, "param", group["params"][0], keep_mask, extension)
+            if stored_state is not None:
+                for key in self._row_state(stored_state):
+                    stored_state[key] = self._compact_rows(name, key, stored_state[key], keep_mask,
+                                                           self._zero_rows(stored_state[key], extension.shape[0]))
+                del self.optimizer.state[group['params'][0]]
+                group["params"][0] = nn.Parameter(param.requires_grad_(True))
+                self.optimizer.state[group['params'][0]] = stored_state
+            else:
+                group["params"][0] = nn.Parameter(param.requires_grad_(True))
+            optimizable_tensors[name] = group["params"][0]
 
-        self.densification_postfix(new_xyz, new_features_dc, new_features_rest, new_opacities, new_scaling,
-                                   new_rotation)
+        self._xyz = optimizable_tensors["xyz"]
+        self._features_dc = optimizable_tensors["f_dc"]
+        self._features_rest = optimizable_tensors["f_rest"]
+        self._opacity = optimizable_tensors["opacity"]
+        self._scaling = optimizable_tensors["scaling"]
+        self._rotation = optimizable_tensors["rotation"]
 
+        num_fresh = int(plan.fresh.sum())
+        self.xyz_gradient_accum = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
+        self.denom = torch.zeros((self.get_xyz.shape[0], 1), device="cuda")
+        self.max_radii2D = torch.zeros((self.get_xyz.shape[0]), device="cuda")
+        self.confidence = torch.cat([self.confidence[keep_mask], torch.ones((num_fresh, 1), device="cuda")], 0)
 
     def densify_and_prune(self, max_grad, min_opacity, extent, max_screen_size, iter):
         grads = self.xyz_gradient_accum / self.denom
         grads[grads.isnan()] = 0.0
 
-        self.densify_and_clone(grads, max_grad, extent)
-        self.densify_and_split(grads, max_grad, extent, iter)
-        if iter < 2000:
-            self.proximity(extent)
+        # decisions of clone, split, proximity and prune are planned first, then applied in a single compaction
+        self.apply_densification_plan(self.plan_densify_and_prune(grads, max_grad, min_opacity, extent,
+                                                                  max_screen_size, iter))
+        torch.cuda.empty_cache()
 
-        prune_mask = (self.get_opacity < min_opacity).squeeze()
-        if max_screen_size:
-            big_points_vs = self.max_radii2D > max_screen_size
-            big_points_ws = self.get_scaling.max(dim=1).values > 0.1 * extent
-            prune_mask = torch.logical_or(torch.logical_or(prune_mask, big_points_vs), big_points_ws)
 
-        self.prune_points(prune_mask, iter)
-        torch.cuda.empty_cache()
+    def reorder_by_morton(self):
+        """
+        Sort the Gaussians, their optimizer state and densification statistics
+        along a Morton curve of their positions. Densification appends new rows
+        at the end and pruning leaves holes, so this restores the memory
+        locality of spatially close Gaussians. Call it between optimizer steps:
+        pending gradients are dropped.
+        """
+        with torch.no_grad():
+            order = morton_order(self._xyz)
+            # _prune_optimizer gathers the rows of an index tensor as well as of a mask
+            optimizable_tensors = self._prune_optimizer(order)
+            self._xyz = optimizable_tensors["xyz"]
+            self._features_dc = optimizable_tensors["f_dc"]
+            self._features_rest = optimizable_tensors["f_rest"]
+            self._opacity = optimizable_tensors["opacity"]
+            self._scaling = optimizable_tensors["scaling"]
+            self._rotation = optimizable_tensors["rotation"]
 
+            self.xyz_gradient_accum = self.xyz_gradient_accum[order]
+            self.denom = self.denom[order]
+            self.max_radii2D = self.max_radii2D[order]
+            self.confidence = self.confidence[order]
+            self.knn_cache.reorder(order)
+        return order
 
     def add_densification_stats(self, viewspace_point_tensor, update_filter):
         self.xyz_gradient_accum[update_filter] += torch.norm(viewspace_point_tensor.grad[update_filter, :2], dim=-1,
                                                              keepdim=True)
-        self.denom[update_filter] += 1
\ No newline at end of file
+        self.denom[update_filter] += 1
+
+
+class BakedGaussianModel:
+    """
+    Inference-only snapshot of a GaussianModel that render() accepts in its
+    place. The activations (sigmoid opacity, exp scaling, normalized
+    rotation, concatenated SH features) are applied once when baking and
+    kept as contiguous buffers without autograd, so rendering a static model
+    does not redo them every frame. Covariances are computed on first use
+    for each scaling modifier and cached.
+    """
+    def __init__(self, model):
+        with torch.no_grad():
+            self.active_sh_degree = model.active_sh_degree
+            self.max_sh_degree = model.max_sh_degree
+            self._xyz = model.get_xyz.detach().contiguous()
+            self._opacity = model.get_opacity.detach().contiguous()
+            self._scaling = model.get_scaling.detach().contiguous()
+            self._rotation = model.get_rotation.detach().contiguous()
+            self._features = model.get_features.detach().contiguous()
+            self._raw_rotation = model._rotation.detach()
+            self.covariance_activation = model.covariance_activation
+            self.bg_color = model.bg_color.detach()
+            self.confidence = model.confidence.detach()
+        self._covariance = {}
+
+    @property
+    def get_xyz(self):
+        return self._xyz
+
+    @property
+    def get_opacity(self):
+        return self._opacity
+
+    @property
+    def get_scaling(self):
+        return self._scaling
+
+    @property
+    def get_rotation(self):
+        return self._rotation
+
+    @property
+    def get_features(self):
+        return self._features
+
+    @classmethod
+    def from_tensors(cls, xyz, opacity, scaling, rotation, features, sh_degree, bg_color=None):
+        """Baked model over already activated tensors, e.g. Gaussians read back from a chunked store."""
+        baked = cls.__new__(cls)
+        baked.active_sh_degree = baked.max_sh_degree = sh_degree
+        baked._xyz, baked._opacity, baked._scaling = xyz, opacity, scaling
+        baked._rotation = baked._raw_rotation = rotation
+        baked._features = features
+        baked.covariance_activation = build_covariance_from_scaling_rotation
+        baked.bg_color = torch.empty(0) if bg_color is None else bg_color
+        baked.confidence = torch.ones_like(opacity)
+        baked._covariance = {}
+        return baked
+
+    def subset(self, index):
+        """Baked model of the Gaussians at `index` (a mask or row indices); covariances are computed again."""
+        subset = copy.copy(self)
+        for name in ("_xyz", "_opacity", "_scaling", "_rotation", "_features", "_raw_rotation"):
+            setattr(subset, name, getattr(self, name)[index])
+        if self.confidence.shape[0] == self._xyz.shape[0]:
+            subset.confidence = self.confidence[index]
+        subset._covariance = {}
+        return subset
+
+    def get_covariance(self, scaling_modifier=1):
+        if scaling_modifier not in self._covariance:
+            with torch.no_grad():
+                self._covariance[scaling_modifier] = self.covariance_activation(
+                    self._scaling, scaling_modifier, self._raw_rotation).contiguous()
+        return self._covariance[scaling_modifier]
@@ -0,0 +1,193 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import os
+import json
+import hashlib
+import numpy as np
+from PIL import Image
+from scene.dataset_readers import sceneLoadTypeCallbacks, CameraInfo, SceneInfo
+from utils.graphics_utils import BasicPointCloud
+
+MANIFEST_VERSION = 1
+
+
+def colmap_input_files(path, images, eval, n_views=0):
+    reading_dir = "images" if images == None else images
+    files = [os.path.join(path, "sparse/0", name) for name in
+             ["cameras.bin", "images.bin", "cameras.txt", "images.txt"]]
+    files += [os.path.join(path, "poses_bounds.npy"),
+              os.path.join(path, str(n_views) + "_views/dense/fused.ply"),
+              os.path.join(path, reading_dir)]
+    return files
+
+
+def blender_input_files(path, white_background, eval, n_views=0, extension=".png"):
+    files = [os.path.join(path, "transforms_train.json"),
+             os.path.join(path, "transforms_test.json"),
+             os.path.join(path, str(n_views) + "_views/dense/fused.ply")]
+    # the frames are cached as pixels, so every frame the transforms list is an input as well
+    for transforms in files[:2]:
+        try:
+            with open(transforms) as json_file:
+                frames = json.load(json_file)["frames"]
+        except (OSError, ValueError, KeyError):
+            continue
+        # as readCamerasFromTransforms builds the path
+        files += [os.path.join(path, os.path.join(path, frame["file_path"] + extension)) for frame in frames]
+    return files
+
+
+sceneInputFiles = {
+    "Colmap": colmap_input_files,
+    "Blender": blender_input_files
+}
+
+
+def file_signature(path):
+    if not os.path.exists(path):
+        return [path, None, None]
+    stat = os.stat(path)
+    if os.path.isdir(path):
+        # the image folder: its listing decides which files get paired with which camera
+        return [path, stat.st_mtime_ns, sorted(os.listdir(path))]
+    return [path, stat.st_mtime_ns, stat.st_size]
+
+
+def manifest_fingerprint(scene_type, reader_args):
+    """Hash of everything a scene reader depends on: its arguments plus the
+    mtimes and sizes of the input files it opens."""
+    payload = {
+        "version": MANIFEST_VERSION,
+        "scene_type": scene_type,
+        "reader_args": [str(a) for a in reader_args],
+        "files": [file_signature(f) for f in sceneInputFiles[scene_type](*reader_args)],
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+def manifest_path(cache_dir, scene_type, reader_args):
+    key = hashlib.sha1(json.dumps([scene_type] + [str(a) for a in reader_args]).encode("utf-8")).hexdigest()
+    return os.path.join(cache_dir, "scene_{}.npz".format(key[:16]))
+
+
+def _pack_cameras(prefix, cam_infos, arrays):
+    arrays[prefix + "uid"] = np.array([c.uid for c in cam_infos], dtype=np.int64)
+    arrays[prefix + "R"] = np.array([c.R for c in cam_infos], dtype=np.float64).reshape(-1, 3, 3)
+    arrays[prefix + "T"] = np.array([c.T for c in cam_infos], dtype=np.float64).reshape(-1, 3)
+    arrays[prefix + "FovY"] = np.array([c.FovY for c in cam_infos], dtype=np.float64)
+    arrays[prefix + "FovX"] = np.array([c.FovX for c in cam_infos], dtype=np.float64)
+    arrays[prefix + "width"] = np.array([c.width for c in cam_infos], dtype=np.int64)
+    arrays[prefix + "height"] = np.array([c.height for c in cam_infos], dtype=np.int64)
+    arrays[prefix + "image_path"] = np.array([c.image_path for c in cam_infos], dtype=str)
+    arrays[prefix + "image_name"] = np.array([c.image_name for c in cam_infos], dtype=str)
+    arrays[prefix + "has_bounds"] = np.array([c.bounds is not None for c in cam_infos], dtype=bool)
+    arrays[prefix + "bounds"] = np.array([c.bounds if c.bounds is not None else [np.nan, np.nan]
+                                          for c in cam_infos], dtype=np.float64).reshape(-1, 2)
+    image_files = []
+    for idx, c in enumerate(cam_infos):
+        image_file = getattr(c.image, "filename", "")
+        if not image_file:
+            # images built in memory (e.g. alpha-composited Blender frames) are stored as pixels
+            arrays["{}image_{}".format(prefix, idx)] = np.asarray(c.image)
+        image_files.append(image_file)
+        if c.mask is not None:
+            arrays["{}mask_{}".format(prefix, idx)] = np.asarray(c.mask)
+    arrays[prefix + "image_file"] = np.array(image_files, dtype=str)
+
+
+def _unpack_cameras(prefix, data):
+    cam_infos = []
+    for idx in range(len(data[prefix + "uid"])):
+        image_file = str(data[prefix + "image_file"][idx])
+        if image_file:
+            image = Image.open(image_file)
+            image.close()
+        else:
+            image = Image.fromarray(data["{}image_{}".format(prefix, idx)])
+        mask_key = "{}mask_{}".format(prefix, idx)
+        cam_infos.append(CameraInfo(uid=int(data[prefix + "uid"][idx]),
+                                    R=data[prefix + "R"][idx], T=data[prefix + "T"][idx],
+                                    FovY=float(data[prefix + "FovY"][idx]), FovX=float(data[prefix + "FovX"][idx]),
+                                    image=image,
+                                    image_path=str(data[prefix + "image_path"][idx]),
+                                    image_name=str(data[prefix + "image_name"][idx]),
+                                    width=int(data[prefix + "width"][idx]), height=int(data[prefix + "height"][idx]),
+                                    mask=data[mask_key] if mask_key in data else None,
+                                    bounds=data[prefix + "bounds"][idx] if data[prefix + "has_bounds"][idx] else None))
+    return cam_infos
+
+
+def write_manifest(path, fingerprint, scene_info):
+    arrays = {"fingerprint": np.array(fingerprint),
+              "ply_path": np.array(scene_info.ply_path),
+              "translate": np.asarray(scene_info.nerf_normalization["translate"]),
+              "radius": np.asarray(scene_info.nerf_normalization["radius"]),
+              "has_point_cloud": np.array(scene_info.point_cloud is not None)}
+    if scene_info.point_cloud is not None:
+        arrays["points"] = np.asarray(scene_info.point_cloud.points)
+        arrays["colors"] = np.asarray(scene_info.point_cloud.colors)
+        arrays["normals"] = np.asarray(scene_info.point_cloud.normals)
+    _pack_cameras("train_", scene_info.train_cameras, arrays)
+    _pack_cameras("test_", scene_info.test_cameras, arrays)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def read_manifest(path, fingerprint):
+    """Return the cached SceneInfo, or None if there is no entry or it is stale."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with np.load(path, allow_pickle=False) as npz:
+            if str(npz["fingerprint"]) != fingerprint:
+                return None
+            data = {k: npz[k] for k in npz.files}
+    except (OSError, ValueError, KeyError):
+        return None
+
+    point_cloud = None
+    if data["has_point_cloud"]:
+        point_cloud = BasicPointCloud(points=data["points"], colors=data["colors"], normals=data["normals"])
+    return SceneInfo(point_cloud=point_cloud,
+                     train_cameras=_unpack_cameras("train_", data),
+                     test_cameras=_unpack_cameras("test_", data),
+                     nerf_normalization={"translate": data["translate"], "radius": data["radius"][()]},
+                     ply_path=str(data["ply_path"]))
+
+
+def readSceneInfoCached(scene_type, reader_args, cache_dir=None):
+    """
+    Run sceneLoadTypeCallbacks[scene_type](*reader_args) through an on-disk
+    manifest. Entries are keyed by the reader arguments and invalidated when
+    any input file changes, in which case the scene is parsed again and the
+    manifest rewritten.
+    """
+    if not cache_dir:
+        return sceneLoadTypeCallbacks[scene_type](*reader_args)
+
+    path = manifest_path(cache_dir, scene_type, reader_args)
+    fingerprint = manifest_fingerprint(scene_type, reader_args)
+    scene_info = read_manifest(path, fingerprint)
+    if scene_info is not None:
+        print("Loaded scene manifest from {}".format(path))
+        return scene_info
+
+    scene_info = sceneLoadTypeCallbacks[scene_type](*reader_args)
+    try:
+        write_manifest(path, fingerprint, scene_info)
+    except OSError as e:
+        print("[Warning] Could not write scene manifest {}: {}".format(path, e))
+    return scene_info
@@ -0,0 +1,107 @@
+"""
+Benchmark and check for CameraStream, the camera prefetcher behind
+train.py --prefetch_cameras.
+
+Builds synthetic cameras with images and memory-mapped depths as the
+training loader keeps them (float32, or uint8 and float16 with
+--compact_images) and draws the same camera sequence twice: through the
+stream, which stages the copies in pinned buffers on a side CUDA stream,
+and through the direct loader of the training loop before the stream
+(original_image and the depth moved to the device on use). Every image and
+depth must be bitwise equal; the time per camera is reported for both.
+
+    python tools/benchmarks/bench_camera_stream.py --num_cameras 32 --resolution 1600 1064 --prefetch 1 2 4
+"""
+import os
+import sys
+import time
+import tempfile
+from argparse import ArgumentParser
+
+import numpy as np
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from utils.camera_stream import CameraStream
+
+
+class SyntheticCamera:
+    # the parts of scene.cameras.Camera that the stream reads
+    def __init__(self, image, depth, compact):
+        self.compact_images = compact
+        self._image = (image * 255.0).round().to(torch.uint8) if compact else image
+        self.depth_image = depth
+
+    @property
+    def stored_image(self):
+        return self._image
+
+    @property
+    def original_image(self):
+        if self.compact_images:
+            return self._image.float() / 255.0
+        return self._image
+
+
+def synthetic_cameras(num, width, height, compact, directory, seed=0):
+    generator = torch.Generator().manual_seed(seed)
+    depth_dtype = np.float16 if compact else np.float32
+    cameras = []
+    for i in range(num):
+        path = os.path.join(directory, "depth_{}_{}.npy".format(i, int(compact)))
+        np.save(path, np.random.default_rng(seed + i).random((height, width)).astype(depth_dtype) * 50)
+        cameras.append(SyntheticCamera(torch.rand((3, height, width), generator=generator),
+                                       np.load(path, mmap_mode="r"), compact))
+    return cameras
+
+
+def direct(camera, device):
+    return camera.original_image.to(device), torch.from_numpy(np.array(camera.depth_image)).to(device).float()
+
+
+def timed(fetch, draws, device):
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for i in range(draws):
+        image, depth = fetch(i)
+        # stands in for the iteration that consumes them
+        image.sum(), depth.sum()
+    if device.startswith("cuda"):
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / draws
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Camera prefetch benchmark")
+    parser.add_argument("--num_cameras", type=int, default=16)
+    parser.add_argument("--resolution", nargs=2, type=int, default=[1008, 756])
+    parser.add_argument("--draws", type=int, default=64)
+    parser.add_argument("--prefetch", nargs="+", type=int, default=[1, 2, 4])
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args(sys.argv[1:])
+    if not args.device.startswith("cuda"):
+        print("No CUDA device: the stream stages nothing and builds the tensors on demand; only that path is checked")
+
+    with tempfile.TemporaryDirectory() as directory:
+        for compact in (False, True):
+            cameras = synthetic_cameras(args.num_cameras, *args.resolution, compact, directory)
+            # the stream draws from its own seeded RNG: a CPU stream gives the sequence any stream will draw
+            picker = CameraStream(cameras, device="cpu")
+            sequence = [picker.next()[0] for _ in range(args.draws)]
+            line = "{:>7s}  direct {:6.2f}ms".format("compact" if compact else "float32",
+                                                    timed(lambda i: direct(sequence[i], args.device), args.draws,
+                                                          args.device) * 1e3)
+            for prefetch in args.prefetch:
+                stream = CameraStream(cameras, prefetch=prefetch, device=args.device)
+                exact = True
+                for camera in sequence:
+                    streamed_camera, image, depth = stream.next()
+                    expected_image, expected_depth = direct(camera, args.device)
+                    exact &= streamed_camera is camera and torch.equal(image, expected_image) \
+                        and torch.equal(depth, expected_depth)
+                stream = CameraStream(cameras, prefetch=prefetch, device=args.device)
+                stream_time = timed(lambda i: stream.next()[1:], args.draws, args.device)
+                line += "  prefetch {} {:6.2f}ms ({})".format(prefetch, stream_time * 1e3,
+                                                              "bitwise equal" if exact else "MISMATCH")
+            print(line)
@@ -0,0 +1,53 @@
+"""
+Benchmark for chamfer_dist, the nearest-neighbour distance behind
+GaussianModel.dist_prune.
+
+Times the grid index on random point clouds (initial points against a
+larger, jittered Gaussian set, as in dist_prune) and checks a random subset
+of queries against the dense N x M minimum the function used to compute.
+
+    python tools/benchmarks/bench_chamfer.py --num_points 100000 1000000 --device cuda
+"""
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from utils.general_utils import chamfer_dist
+
+
+def dense_chamfer_dist(array1, array2):
+    # what chamfer_dist did before the grid index
+    dist = torch.norm(array1[None] - array2[:, None], 2, dim=-1)
+    return dist.min(1)[0]
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="chamfer_dist benchmark")
+    parser.add_argument("--num_points", nargs="+", type=int, default=[100_000, 1_000_000])
+    parser.add_argument("--queries_per_point", type=float, default=2.0)
+    parser.add_argument("--check", type=int, default=256)
+    parser.add_argument("--device", default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args(sys.argv[1:])
+
+    torch.manual_seed(0)
+    for num in args.num_points:
+        points = torch.rand(num, 3, device=args.device)
+        queries = points[torch.randint(0, num, (int(num * args.queries_per_point),), device=args.device)]
+        queries = queries + 0.01 * torch.randn_like(queries)
+
+        if args.device == "cuda":
+            torch.cuda.synchronize()
+        start = time.perf_counter()
+        dist = chamfer_dist(points, queries)
+        if args.device == "cuda":
+            torch.cuda.synchronize()
+        elapsed = time.perf_counter() - start
+
+        subset = torch.randint(0, queries.shape[0], (args.check,), device=args.device)
+        equal = torch.equal(dist[subset], dense_chamfer_dist(points, queries[subset]))
+        print("{:>9d} points x {:>9d} queries  {:6.2f}s ({:6.2f} M queries/s)  equal={}".format(
+            num, queries.shape[0], elapsed, queries.shape[0] / elapsed / 1e6, equal))
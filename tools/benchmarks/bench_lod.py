@@ -0,0 +1,92 @@
+"""
+Benchmark for GaussianHierarchy, the level-of-detail renderer behind
+render.py --lod_error.
+
+Builds the hierarchy of a synthetic or trained (--ply) model and, for each
+error budget, reports the number of Gaussians in the cut for a ring of
+cameras. On CUDA with the rasterizer installed it also reports the frame
+time and the PSNR of the cut against the full model.
+
+    python tools/benchmarks/bench_lod.py --num_gaussians 1000000 --errors 0.5 1 2 4
+    python tools/benchmarks/bench_lod.py --ply output/fern/point_cloud/iteration_10000/point_cloud.ply --distance 4
+"""
+import os
+import sys
+import time
+from argparse import ArgumentParser, Namespace
+
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from scene.gaussian_model import BakedGaussianModel
+from scene.gaussian_lod import GaussianHierarchy
+from utils.image_utils import psnr
+from bench_morton import synthetic_gaussians, ply_gaussians, orbit_cameras
+
+
+def baked_model(gaussians):
+    return BakedGaussianModel.from_tensors(gaussians["xyz"], gaussians["opacity"], gaussians["scaling"],
+                                           gaussians["rotation"], gaussians["features"],
+                                           int(gaussians["features"].shape[1] ** 0.5) - 1)
+
+
+def render_views(pc, cameras, repeats):
+    from gaussian_renderer import render
+    pipe = Namespace(use_confidence=False, compute_cov3D_python=False, convert_SHs_python=False, debug=False)
+    background = torch.zeros(3, device="cuda")
+    with torch.no_grad():
+        images = [render(camera, pc, pipe, background)["render"].clamp(0, 1) for camera in cameras]
+        torch.cuda.synchronize()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for camera in cameras:
+                render(camera, pc, pipe, background)
+        torch.cuda.synchronize()
+    return images, (time.perf_counter() - start) / (repeats * len(cameras))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Level-of-detail benchmark")
+    parser.add_argument("--num_gaussians", type=int, default=1_000_000)
+    parser.add_argument("--ply", type=str, default=None)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--errors", nargs="+", type=float, default=[0.5, 1.0, 2.0, 4.0, 8.0])
+    parser.add_argument("--branching", type=int, default=8)
+    parser.add_argument("--views", type=int, default=8)
+    parser.add_argument("--distance", type=float, default=2.0)
+    parser.add_argument("--resolution", type=int, default=800)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(sys.argv[1:])
+
+    try:
+        import diff_gaussian_rasterization  # noqa: F401
+        can_render = args.device.startswith("cuda")
+    except ImportError:
+        can_render = False
+
+    gaussians = ply_gaussians(args.ply, args.device) if args.ply else synthetic_gaussians(args.num_gaussians, args.device)
+    baked = baked_model(gaussians)
+    start = time.perf_counter()
+    hierarchy = GaussianHierarchy(baked, branching=args.branching)
+    print("{} Gaussians: hierarchy of {} nodes in {} levels built in {:.2f}s".format(
+        hierarchy.num_leaves, hierarchy.parent.shape[0], len(hierarchy.level_offsets) - 1, time.perf_counter() - start))
+
+    xyz = gaussians["xyz"]
+    cameras = orbit_cameras(xyz, args.views, args.resolution, args.distance)
+    if can_render:
+        reference, full_time = render_views(baked, cameras, args.repeats)
+        print("full model   {:6.2f}ms".format(full_time * 1e3))
+    for error in args.errors:
+        hierarchy.error = error
+        sizes = []
+        for camera in cameras:
+            hierarchy.cut(camera)
+            sizes.append(hierarchy.last_cut_size)
+        line = "error {:5.2f}px  cut {:9.0f} Gaussians ({:5.1%})".format(
+            error, sum(sizes) / len(sizes), sum(sizes) / len(sizes) / hierarchy.num_leaves)
+        if can_render:
+            images, frame_time = render_views(hierarchy, cameras, args.repeats)
+            quality = sum(psnr(a[None], b[None]).mean().item() for a, b in zip(images, reference)) / len(images)
+            line += "  {:6.2f}ms ({:4.2f}x)  PSNR vs full {:6.2f} dB".format(frame_time * 1e3, full_time / frame_time, quality)
+        print(line)
@@ -0,0 +1,150 @@
+"""
+Benchmark for GaussianModel.reorder_by_morton (--morton_interval).
+
+Times distKNN2 (the neighbour search of densification) and, on CUDA with
+the rasterizer installed, render() from a ring of cameras on the same
+Gaussians in two memory orders: shuffled, as after many rounds of
+densification appending and pruning rows, and sorted along the Morton
+curve. With --ply the file order of a trained model is compared instead of
+a shuffle.
+
+    python tools/benchmarks/bench_morton.py --num_gaussians 200000 1000000 --device cuda
+    python tools/benchmarks/bench_morton.py --ply output/fern/point_cloud/iteration_10000/point_cloud.ply
+"""
+import os
+import sys
+import math
+import time
+from argparse import ArgumentParser, Namespace
+
+import numpy as np
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from utils.knn_utils import distKNN2, morton_order
+
+
+def synthetic_gaussians(num, device, num_clusters=2000, seed=0):
+    # surfaces of a scene are stood in for by many small clusters of Gaussians, in random row order
+    generator = torch.Generator().manual_seed(seed)
+    centres = torch.rand((num_clusters, 3), generator=generator) * 10 - 5
+    xyz = centres[torch.randint(num_clusters, (num,), generator=generator)] + \
+        torch.randn((num, 3), generator=generator) * 0.05
+    return {"xyz": xyz.to(device),
+            "opacity": torch.full((num, 1), 0.5, device=device),
+            "scaling": torch.full((num, 3), 0.01, device=device),
+            "rotation": torch.nn.functional.normalize(torch.randn((num, 4), generator=generator)).to(device),
+            "features": (torch.randn((num, 16, 3), generator=generator) * 0.1).to(device)}
+
+
+def ply_gaussians(path, device):
+    from scene.gaussian_model import GaussianModel
+    model = GaussianModel(Namespace(sh_degree=3))
+    model.load_ply(path)
+    with torch.no_grad():
+        return {"xyz": model.get_xyz.detach().to(device), "opacity": model.get_opacity.detach().to(device),
+                "scaling": model.get_scaling.detach().to(device), "rotation": model.get_rotation.detach().to(device),
+                "features": model.get_features.detach().to(device)}
+
+
+def permuted(gaussians, order):
+    return {name: tensor[order].contiguous() for name, tensor in gaussians.items()}
+
+
+def look_at_camera(position, target, resolution, device, fov=1.0):
+    from scene.cameras import MiniCam
+    from utils.graphics_utils import getWorld2View2, getProjectionMatrix
+    forward = (target - position) / np.linalg.norm(target - position)
+    right = np.cross(forward, np.array([0.0, 1.0, 0.0]))
+    right /= np.linalg.norm(right)
+    down = np.cross(forward, right)
+    world_to_camera = np.stack([right, down, forward])
+    view = torch.tensor(getWorld2View2(world_to_camera.T, -world_to_camera @ position),
+                        dtype=torch.float32).transpose(0, 1).to(device)
+    projection = getProjectionMatrix(znear=0.01, zfar=100.0, fovX=fov, fovY=fov).transpose(0, 1).to(device)
+    return MiniCam(resolution, resolution, fov, fov, 0.01, 100.0, view, view @ projection)
+
+
+def orbit_cameras(xyz, num_views, resolution, distance=2.0):
+    # a ring around the centre of the points, `distance` times their median distance to it
+    centre = xyz.mean(dim=0).cpu().numpy()
+    radius = distance * float((xyz - xyz.mean(dim=0)).norm(dim=1).median())
+    cameras = []
+    for i in range(num_views):
+        angle = 2 * math.pi * i / num_views
+        position = centre + radius * np.array([math.cos(angle), 0.3, math.sin(angle)])
+        cameras.append(look_at_camera(position, centre, resolution, xyz.device))
+    return cameras
+
+
+def time_renders(gaussians, cameras, repeats):
+    from gaussian_renderer import render
+    pc = Namespace(get_xyz=gaussians["xyz"], get_opacity=gaussians["opacity"], get_scaling=gaussians["scaling"],
+                   get_rotation=gaussians["rotation"], get_features=gaussians["features"],
+                   active_sh_degree=int(math.isqrt(gaussians["features"].shape[1])) - 1,
+                   max_sh_degree=int(math.isqrt(gaussians["features"].shape[1])) - 1,
+                   bg_color=torch.empty(0), confidence=torch.ones_like(gaussians["opacity"]))
+    pipe = Namespace(use_confidence=False, compute_cov3D_python=False, convert_SHs_python=False, debug=False)
+    background = torch.zeros(3, device="cuda")
+    with torch.no_grad():
+        render(cameras[0], pc, pipe, background)
+        torch.cuda.synchronize()
+        start = time.perf_counter()
+        for _ in range(repeats):
+            for camera in cameras:
+                render(camera, pc, pipe, background)
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / (repeats * len(cameras))
+
+
+def time_knn(xyz, repeats):
+    distKNN2(xyz)
+    if xyz.is_cuda:
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        distKNN2(xyz)
+    if xyz.is_cuda:
+        torch.cuda.synchronize()
+    return (time.perf_counter() - start) / repeats
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Morton reordering benchmark")
+    parser.add_argument("--num_gaussians", nargs="+", type=int, default=[200_000])
+    parser.add_argument("--ply", type=str, default=None)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    parser.add_argument("--views", type=int, default=8)
+    parser.add_argument("--resolution", type=int, default=800)
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args(sys.argv[1:])
+
+    try:
+        import diff_gaussian_rasterization  # noqa: F401
+        can_render = args.device.startswith("cuda")
+    except ImportError:
+        can_render = False
+
+    if args.ply:
+        cases = [("file order", ply_gaussians(args.ply, args.device))]
+    else:
+        cases = [("shuffled", synthetic_gaussians(num, args.device)) for num in args.num_gaussians]
+    for label, gaussians in cases:
+        num = gaussians["xyz"].shape[0]
+        start = time.perf_counter()
+        order = morton_order(gaussians["xyz"])
+        sorted_gaussians = permuted(gaussians, order)
+        if args.device.startswith("cuda"):
+            torch.cuda.synchronize()
+        sort_time = time.perf_counter() - start
+
+        knn_before, knn_after = time_knn(gaussians["xyz"], args.repeats), time_knn(sorted_gaussians["xyz"], args.repeats)
+        line = "{:>9d} Gaussians  reorder {:7.4f}s  distKNN2 {} {:7.4f}s / morton {:7.4f}s ({:4.2f}x)".format(
+            num, sort_time, label, knn_before, knn_after, knn_before / knn_after)
+        if can_render:
+            cameras = orbit_cameras(gaussians["xyz"], args.views, args.resolution)
+            render_before = time_renders(gaussians, cameras, args.repeats)
+            render_after = time_renders(sorted_gaussians, cameras, args.repeats)
+            line += "  render {:6.2f}ms / morton {:6.2f}ms ({:4.2f}x)".format(
+                render_before * 1e3, render_after * 1e3, render_before / render_after)
+        print(line)
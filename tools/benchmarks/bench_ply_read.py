@@ -0,0 +1,61 @@
+"""
+Benchmark for read_vertex_attributes, the reader behind GaussianModel.load_ply.
+
+Writes a trained-model-shaped PLY (see bench_ply_write.py) and times the
+plyfile path load_ply used before (float64 arrays filled attribute by
+attribute) against reading the memory-mapped vertex block, touching every
+value so the comparison includes the disk read.
+
+    python tools/benchmarks/bench_ply_read.py --num_gaussians 1000000
+"""
+import os
+import sys
+import time
+import tempfile
+from argparse import ArgumentParser
+
+import numpy as np
+from plyfile import PlyData
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from utils.ply_utils import vertex_elements, write_vertex_ply, read_vertex_attributes
+from bench_ply_write import gaussian_attributes
+
+
+def read_reference(path):
+    vertices = PlyData.read(path).elements[0]
+    names = [p.name for p in vertices.properties]
+    attributes = np.zeros((vertices.count, len(names)))
+    for idx, name in enumerate(names):
+        attributes[:, idx] = np.asarray(vertices[name])
+    return attributes
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="PLY reader benchmark")
+    parser.add_argument("--num_gaussians", nargs="+", type=int, default=[1_000_000])
+    args = parser.parse_args(sys.argv[1:])
+
+    dtype_full = [(name, 'f4') for name in gaussian_attributes()]
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "point_cloud.ply")
+        for num in args.num_gaussians:
+            attributes = rng.standard_normal((num, len(dtype_full)), dtype=np.float32)
+            write_vertex_ply(path, vertex_elements(attributes, dtype_full))
+            size = os.path.getsize(path)
+
+            start = time.perf_counter()
+            reference = read_reference(path)
+            plyfile_time = time.perf_counter() - start
+
+            start = time.perf_counter()
+            mapped, _ = read_vertex_attributes(path)
+            mapped = np.array(mapped)
+            mapped_time = time.perf_counter() - start
+
+            print("{:>9d} Gaussians  plyfile {:6.2f}s  mmap {:6.2f}s ({:6.0f} MB/s)  speedup {:5.1f}x  equal={}".format(
+                num, plyfile_time, mapped_time, size / mapped_time / 1e6, plyfile_time / mapped_time,
+                np.array_equal(reference, mapped)))
+            del attributes, reference, mapped
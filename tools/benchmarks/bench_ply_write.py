@@ -0,0 +1,72 @@
+"""
+Benchmark for the bulk PLY writer used by storePly and GaussianModel.save_ply.
+
+Builds random Gaussian attribute matrices laid out like save_ply (xyz,
+normals, f_dc, f_rest, opacity, scale, rotation; 62 float32 columns at SH
+degree 3) and times write_vertex_ply. Up to --reference_max Gaussians the
+plyfile path with one Python tuple per row is timed too and the two files are
+compared byte for byte.
+
+    python tools/benchmarks/bench_ply_write.py --num_gaussians 1000000 5000000
+"""
+import os
+import sys
+import time
+import filecmp
+import tempfile
+from argparse import ArgumentParser
+
+import numpy as np
+from plyfile import PlyData, PlyElement
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from utils.ply_utils import vertex_elements, write_vertex_ply
+
+
+def gaussian_attributes(sh_degree=3):
+    names = ['x', 'y', 'z', 'nx', 'ny', 'nz']
+    names += ['f_dc_{}'.format(i) for i in range(3)]
+    names += ['f_rest_{}'.format(i) for i in range(3 * (sh_degree + 1) ** 2 - 3)]
+    names += ['opacity']
+    names += ['scale_{}'.format(i) for i in range(3)]
+    names += ['rot_{}'.format(i) for i in range(4)]
+    return names
+
+
+def write_reference(path, attributes, dtype_full):
+    # what storePly / save_ply did before the bulk writer
+    elements = np.empty(attributes.shape[0], dtype=dtype_full)
+    elements[:] = list(map(tuple, attributes))
+    PlyData([PlyElement.describe(elements, 'vertex')]).write(path)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="PLY writer benchmark")
+    parser.add_argument("--num_gaussians", nargs="+", type=int, default=[1_000_000, 5_000_000])
+    parser.add_argument("--reference_max", type=int, default=1_000_000)
+    args = parser.parse_args(sys.argv[1:])
+
+    dtype_full = [(name, 'f4') for name in gaussian_attributes()]
+    rng = np.random.default_rng(0)
+    with tempfile.TemporaryDirectory() as tmp:
+        for num in args.num_gaussians:
+            attributes = rng.standard_normal((num, len(dtype_full)), dtype=np.float32)
+            path = os.path.join(tmp, "bulk.ply")
+            start = time.perf_counter()
+            write_vertex_ply(path, vertex_elements(attributes, dtype_full))
+            bulk = time.perf_counter() - start
+            size = os.path.getsize(path)
+            line = "{:>9d} Gaussians  bulk {:7.2f}s ({:6.0f} MB/s)".format(num, bulk, size / bulk / 1e6)
+
+            if num <= args.reference_max:
+                reference_path = os.path.join(tmp, "reference.ply")
+                start = time.perf_counter()
+                write_reference(reference_path, attributes, dtype_full)
+                reference = time.perf_counter() - start
+                identical = filecmp.cmp(path, reference_path, shallow=False)
+                line += "  plyfile {:7.2f}s  speedup {:5.1f}x  identical={}".format(
+                    reference, reference / bulk, identical)
+                os.remove(reference_path)
+            print(line)
+            os.remove(path)
+            del attributes
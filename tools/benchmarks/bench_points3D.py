@@ -0,0 +1,106 @@
+"""
+Benchmark for the bulk COLMAP points3D.bin reader.
+
+Writes a synthetic points3D.bin with a few million points and random track
+lengths, then times the original per-point struct.unpack reader against
+read_points3D_binary_bulk and checks that both return the same arrays.
+
+    python tools/benchmarks/bench_points3D.py --num_points 2000000
+"""
+import os
+import sys
+import time
+import struct
+import tempfile
+from argparse import ArgumentParser
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from scene.colmap_loader import read_next_bytes, read_points3D_binary_bulk, \
+    POINT3D_RECORD_DTYPE, TRACK_ELEM_DTYPE
+
+
+def write_synthetic_points3D(path, num_points, max_track_length, seed=0):
+    rng = np.random.default_rng(seed)
+    track_lengths = rng.integers(2, max_track_length + 1, size=num_points)
+    header = np.empty(num_points, dtype=POINT3D_RECORD_DTYPE)
+    header["id"] = np.arange(1, num_points + 1)
+    header["xyz"] = rng.normal(size=(num_points, 3))
+    header["rgb"] = rng.integers(0, 256, size=(num_points, 3))
+    header["error"] = rng.random(num_points)
+    elems = np.empty(track_lengths.sum(), dtype=TRACK_ELEM_DTYPE)
+    elems["image_id"] = rng.integers(1, 1000, size=len(elems))
+    elems["point2D_idx"] = rng.integers(0, 20000, size=len(elems))
+
+    offsets = np.concatenate([[0], np.cumsum(track_lengths)])
+    with open(path, "wb") as fid:
+        fid.write(struct.pack("<Q", num_points))
+        header_bytes = header.tobytes()
+        elem_bytes = elems.tobytes()
+        step = POINT3D_RECORD_DTYPE.itemsize
+        elem_size = TRACK_ELEM_DTYPE.itemsize
+        for i in range(num_points):
+            fid.write(header_bytes[i * step:(i + 1) * step])
+            fid.write(struct.pack("<Q", track_lengths[i]))
+            fid.write(elem_bytes[offsets[i] * elem_size:offsets[i + 1] * elem_size])
+    return header, elems, offsets
+
+
+def read_points3D_binary_reference(path_to_model_file):
+    # The per-point reader read_points3D_binary used before the bulk reader.
+    with open(path_to_model_file, "rb") as fid:
+        num_points = read_next_bytes(fid, 8, "Q")[0]
+
+        xyzs = np.empty((num_points, 3))
+        rgbs = np.empty((num_points, 3))
+        errors = np.empty((num_points, 1))
+
+        for p_id in range(num_points):
+            binary_point_line_properties = read_next_bytes(
+                fid, num_bytes=43, format_char_sequence="QdddBBBd")
+            xyz = np.array(binary_point_line_properties[1:4])
+            rgb = np.array(binary_point_line_properties[4:7])
+            error = np.array(binary_point_line_properties[7])
+            track_length = read_next_bytes(
+                fid, num_bytes=8, format_char_sequence="Q")[0]
+            track_elems = read_next_bytes(
+                fid, num_bytes=8*track_length,
+                format_char_sequence="ii"*track_length)
+            xyzs[p_id] = xyz
+            rgbs[p_id] = rgb
+            errors[p_id] = error
+    return xyzs, rgbs, errors
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="points3D.bin reader benchmark")
+    parser.add_argument("--num_points", type=int, default=2_000_000)
+    parser.add_argument("--max_track_length", type=int, default=12)
+    parser.add_argument("--skip_reference", action="store_true")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "points3D.bin")
+        t0 = time.perf_counter()
+        header, elems, offsets = write_synthetic_points3D(path, args.num_points, args.max_track_length)
+        print("Wrote {} points ({:.1f} MB) in {:.2f}s".format(
+            args.num_points, os.path.getsize(path) / 2**20, time.perf_counter() - t0))
+
+        t0 = time.perf_counter()
+        xyzs, rgbs, errors, tracks = read_points3D_binary_bulk(path, return_tracks=True)
+        t_bulk = time.perf_counter() - t0
+        print("bulk reader      : {:.2f}s ({:.2f} Mpts/s)".format(t_bulk, args.num_points / t_bulk / 1e6))
+
+        assert np.array_equal(tracks.offsets, offsets)
+        assert np.array_equal(tracks.image_ids, elems["image_id"])
+        assert np.array_equal(tracks.point2D_idxs, elems["point2D_idx"])
+
+        if not args.skip_reference:
+            t0 = time.perf_counter()
+            ref = read_points3D_binary_reference(path)
+            t_ref = time.perf_counter() - t0
+            print("reference reader : {:.2f}s ({:.2f} Mpts/s)".format(t_ref, args.num_points / t_ref / 1e6))
+            for a, b in zip(ref, (xyzs, rgbs, errors)):
+                assert a.dtype == b.dtype and a.shape == b.shape and np.array_equal(a, b)
+            print("speedup          : {:.1f}x, outputs identical".format(t_ref / t_bulk))
@@ -0,0 +1,67 @@
+"""
+Startup benchmark for readColmapSceneInfo.
+
+Builds synthetic COLMAP scenes (images.bin, cameras.bin, poses_bounds.npy,
+tiny PNGs and a fused.ply) with a growing number of cameras and reports the
+time spent reading each one. With batched camera reading the per-camera cost
+should stay flat as the camera count grows.
+
+    python tools/benchmarks/bench_scene_startup.py --num_cams 100 400 1600
+"""
+import os
+import sys
+import time
+import struct
+import tempfile
+from argparse import ArgumentParser
+
+import numpy as np
+from PIL import Image
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from scene.dataset_readers import readColmapSceneInfo, storePly
+
+
+def write_synthetic_colmap_scene(root, num_cams, width=32, height=24, num_points=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    os.makedirs(os.path.join(root, "sparse/0"))
+    os.makedirs(os.path.join(root, "images"))
+    os.makedirs(os.path.join(root, "0_views/dense"))
+
+    with open(os.path.join(root, "sparse/0/images.bin"), "wb") as fid:
+        fid.write(struct.pack("<Q", num_cams))
+        for i in range(num_cams):
+            qvec = rng.normal(size=4)
+            qvec /= np.linalg.norm(qvec)
+            fid.write(struct.pack("<idddddddi", i + 1, *qvec, *rng.normal(size=3), 1))
+            fid.write("image_{:05d}.png".format(i).encode("utf-8") + b"\x00")
+            fid.write(struct.pack("<Q", 0))
+    with open(os.path.join(root, "sparse/0/cameras.bin"), "wb") as fid:
+        fid.write(struct.pack("<Q", 1))
+        fid.write(struct.pack("<iiQQ", 1, 1, width, height))
+        fid.write(struct.pack("<dddd", width, width, width / 2, height / 2))
+
+    pixels = np.zeros((height, width, 3), dtype=np.uint8)
+    for i in range(num_cams):
+        Image.fromarray(pixels).save(os.path.join(root, "images", "image_{:05d}.png".format(i)))
+    np.save(os.path.join(root, "poses_bounds.npy"), rng.random((num_cams, 17)))
+    storePly(os.path.join(root, "0_views/dense/fused.ply"),
+             rng.normal(size=(num_points, 3)), rng.integers(0, 256, size=(num_points, 3)))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="readColmapSceneInfo startup benchmark")
+    parser.add_argument("--num_cams", nargs="+", type=int, default=[100, 400, 1600])
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    for num_cams in args.num_cams:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            write_synthetic_colmap_scene(tmp_dir, num_cams)
+            timings = []
+            for _ in range(args.repeats):
+                t0 = time.perf_counter()
+                readColmapSceneInfo(tmp_dir, "images", False)
+                timings.append(time.perf_counter() - t0)
+            best = min(timings)
+            print("{:6d} cameras: {:8.3f}s total, {:7.3f} ms/camera".format(num_cams, best, 1000 * best / num_cams))
@@ -0,0 +1,78 @@
+"""
+Benchmark for GaussianStream, the out-of-core renderer front-end behind
+render.py --stream_budget_mb.
+
+Writes the chunked store of a synthetic city (blocks of Gaussians on a
+ground plane, much larger than one view) and flies a camera down a street
+through it. For each memory budget it reports the chunks paged in, the LRU
+hit rate, evictions, chunks dropped for lack of room, the Gaussians drawn
+per frame and the time spent selecting and paging chunks.
+
+    python tools/benchmarks/bench_streaming.py --num_gaussians 4000000 --budgets_mb 64 256 1024 --device cuda
+"""
+import os
+import sys
+import time
+import tempfile
+from argparse import ArgumentParser
+
+import numpy as np
+import torch
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from scene.gaussian_chunks import CHUNKS_NAME, GaussianStream, write_chunks
+from bench_morton import look_at_camera
+
+
+def synthetic_city(num, blocks=32, block_size=20.0, seed=0):
+    # rows as in a chunked store: xyz, opacity, scaling, rotation, degree-3 SH features
+    rng = np.random.default_rng(seed)
+    block = rng.integers(0, blocks, (num, 2))
+    xyz = np.stack((block[:, 0] * block_size + rng.random(num) * block_size * 0.8,
+                    -rng.random(num) * 30.0,
+                    block[:, 1] * block_size + rng.random(num) * block_size * 0.8), axis=1)
+    rotation = rng.standard_normal((num, 4))
+    rotation /= np.linalg.norm(rotation, axis=1, keepdims=True)
+    return np.concatenate((xyz, np.full((num, 1), 0.5), np.full((num, 3), 0.05), rotation,
+                           rng.standard_normal((num, 48)) * 0.1), axis=1).astype(np.float32)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Chunk streaming benchmark")
+    parser.add_argument("--num_gaussians", type=int, default=2_000_000)
+    parser.add_argument("--budgets_mb", nargs="+", type=int, default=[32, 128, 512])
+    parser.add_argument("--max_chunk_size", type=int, default=1 << 14)
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--device", type=str, default="cuda" if torch.cuda.is_available() else "cpu")
+    args = parser.parse_args(sys.argv[1:])
+
+    rows = synthetic_city(args.num_gaussians)
+    extent = rows[:, 0].max()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, CHUNKS_NAME)
+        start = time.perf_counter()
+        index = write_chunks(path, rows[:, :3], lambda index: rows[index], 3, (16, 3), args.max_chunk_size)
+        print("{} Gaussians ({:.0f} MB) in {} chunks, written in {:.1f}s".format(
+            args.num_gaussians, rows.nbytes / 2 ** 20, len(index["chunks"]), time.perf_counter() - start))
+
+        # down the street between the first two rows of blocks and back
+        street = 0.9 * 20.0
+        positions = [np.array([x, -5.0, street]) for x in np.linspace(0, extent, args.frames // 2)]
+        positions += positions[::-1]
+        cameras = [look_at_camera(position, position + np.array([direction, 0.0, 0.3]), 800, args.device)
+                   for position, direction in zip(positions, [1.0] * (args.frames // 2) + [-1.0] * (args.frames // 2))]
+        for budget in args.budgets_mb:
+            stream = GaussianStream(path, budget * 2 ** 20, device=args.device)
+            drawn = 0
+            start = time.perf_counter()
+            for camera in cameras:
+                drawn += stream.cut(camera).get_xyz.shape[0]
+            if args.device.startswith("cuda"):
+                torch.cuda.synchronize()
+            frame_time = (time.perf_counter() - start) / len(cameras)
+            stats = stream.stats()
+            print("budget {:5d} MB  paged {:6d} chunks ({:8.1f} MB)  hit rate {:5.1%}  evictions {:6d}  "
+                  "dropped {:5d}  drawn {:9.0f} Gaussians/frame  {:6.2f} ms/frame".format(
+                      budget, stats["misses"] - stats["dropped"], stats["paged_bytes"] / 2 ** 20, stats["hit_rate"],
+                      stats["evictions"], stats["dropped"], drawn / len(cameras), frame_time * 1e3))
@@ -7,11 +7,15 @@ import skimage.transform
 
 import colmap_read_model as read_model
 
+# the scene directory itself, not the package: scene/__init__.py pulls in torch and the CUDA extensions
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'scene'))
+from colmap_loader import read_intrinsics_binary, read_images_binary_indexed
+
 
 def load_colmap_data(realdir):
     
     camerasfile = os.path.join(realdir, 'sparse/0/cameras.bin')
-    camdata = read_model.read_cameras_binary(camerasfile)
+    camdata = read_intrinsics_binary(camerasfile)
     # cam = camdata[camdata.keys()[0]]
     list_of_keys = list(camdata.keys())
     cam = camdata[list_of_keys[0]]
@@ -22,22 +26,17 @@ def load_colmap_data(realdir):
     hwf = np.array([h,w,f]).reshape([3,1])
     
     imagesfile = os.path.join(realdir, 'sparse/0/images.bin')
-    imdata = read_model.read_images_binary(imagesfile)
+    imdata = read_images_binary_indexed(imagesfile)
     
-    w2c_mats = []
-    bottom = np.array([0,0,0,1.]).reshape([1,4])
+    bottom = np.array([0,0,0,1.]).reshape([1,1,4])
     
-    names = [imdata[k].name for k in imdata]
+    names = imdata.names
     print( 'Images #', len(names))
     perm = np.argsort(names)
-    for k in imdata:
-        im = imdata[k]
-        R = im.qvec2rotmat()
-        t = im.tvec.reshape([3,1])
-        m = np.concatenate([np.concatenate([R, t], 1), bottom], 0)
-        w2c_mats.append(m)
+    R = imdata.rotmats()
+    t = imdata.tvecs[..., np.newaxis]
+    w2c_mats = np.concatenate([np.concatenate([R, t], 2), np.tile(bottom, [len(imdata), 1, 1])], 1)
     print(len(w2c_mats))
-    w2c_mats = np.stack(w2c_mats, 0)
     c2w_mats = np.linalg.inv(w2c_mats)
     
     poses = c2w_mats[:, :3, :4].transpose([1,2,0])
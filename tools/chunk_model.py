@@ -0,0 +1,38 @@
+"""
+Write the chunked, out-of-core store (see scene/gaussian_chunks.py) of a
+trained model next to its PLY, as point_cloud/iteration_<n>/point_cloud.gschunks.
+The PLY is read through a memory map, so only the positions of all
+Gaussians are held in memory at once. render.py --stream_budget_mb renders
+from the store (and writes it first when it is missing).
+
+    python tools/chunk_model.py -m output/city --iteration -1 --max_chunk_size 65536
+"""
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from scene.gaussian_chunks import CHUNKS_NAME, chunk_ply
+from utils.system_utils import searchForMaxIteration
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Chunked model store")
+    parser.add_argument("--model_path", "-m", required=True, type=str)
+    parser.add_argument("--iteration", default=-1, type=int)
+    parser.add_argument("--max_chunk_size", default=1 << 16, type=int)
+    args = parser.parse_args(sys.argv[1:])
+
+    iteration = args.iteration
+    if iteration == -1:
+        iteration = searchForMaxIteration(os.path.join(args.model_path, "point_cloud"))
+    point_cloud_path = os.path.join(args.model_path, "point_cloud", "iteration_{}".format(iteration))
+    path = os.path.join(point_cloud_path, CHUNKS_NAME)
+
+    start = time.perf_counter()
+    index = chunk_ply(os.path.join(point_cloud_path, "point_cloud.ply"), path, args.max_chunk_size)
+    counts = [chunk["count"] for chunk in index["chunks"]]
+    print("{}: {} Gaussians in {} chunks ({} to {}, mean {:.0f}), {:.1f} MB, written in {:.1f}s".format(
+        path, sum(counts), len(counts), min(counts, default=0), max(counts, default=0),
+        sum(counts) / max(len(counts), 1), os.path.getsize(path) / 1e6, time.perf_counter() - start))
@@ -0,0 +1,138 @@
+"""
+Compact a trained model by dropping the Gaussians that contribute least to
+the training views.
+
+Every training camera is rendered once to sum, per Gaussian, its blending
+weight over all pixels (gaussian_renderer.blending_contribution). The
+Gaussians are ranked by it and, for each kept fraction in --keep_ratios,
+the PSNR of the smaller model on the test views (the training views when
+there are none) is measured. The kept count is --target_count when given,
+otherwise the smallest one within --max_psnr_drop dB of the full model.
+The compacted model can be fine-tuned for a few iterations at the final
+learning rates, then it is written to --output (default <model>_compact)
+with a compaction.json report of PSNR against Gaussian count.
+
+    python tools/compact_model.py -m output/fern --keep_ratios 0.5 0.33 0.25 0.2 --max_psnr_drop 0.3
+    python tools/compact_model.py -m output/fern --target_count 200000 --finetune_iterations 1000
+"""
+import os
+import sys
+import json
+import shutil
+from random import randint
+from argparse import ArgumentParser
+
+import torch
+from torch import nn
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from scene import Scene
+from scene.gaussian_model import GaussianModel
+from gaussian_renderer import render, blending_contribution
+from arguments import ModelParams, PipelineParams, OptimizationParams, get_combined_args
+from utils.general_utils import safe_state
+from utils.image_utils import mean_psnr
+from utils.loss_utils import l1_loss, ssim
+
+
+def views_psnr(model, views, pipeline, background):
+    return mean_psnr((torch.clamp(render(view, model, pipeline, background)["render"], 0.0, 1.0)[None],
+                      view.original_image[None, 0:3].cuda()) for view in views)
+
+
+def keep_gaussians(gaussians, mask):
+    # the model is not being optimized yet, so the parameters are simply replaced
+    gaussians._xyz = nn.Parameter(gaussians._xyz.detach()[mask].requires_grad_(True))
+    gaussians._features_dc = nn.Parameter(gaussians._features_dc.detach()[mask].requires_grad_(True))
+    gaussians._features_rest = nn.Parameter(gaussians._features_rest.detach()[mask].requires_grad_(True))
+    gaussians._opacity = nn.Parameter(gaussians._opacity.detach()[mask].requires_grad_(True))
+    gaussians._scaling = nn.Parameter(gaussians._scaling.detach()[mask].requires_grad_(True))
+    gaussians._rotation = nn.Parameter(gaussians._rotation.detach()[mask].requires_grad_(True))
+
+
+def finetune(gaussians, scene, opt, pipeline, background, iterations):
+    gaussians.spatial_lr_scale = scene.cameras_extent
+    gaussians.training_setup(opt)
+    # a short polish of the compacted model: no densification, the learning rates at the end of the schedule
+    gaussians.update_learning_rate(opt.iterations)
+    views = scene.getTrainCameras()
+    for _ in tqdm(range(iterations), desc="Fine-tuning"):
+        view = views[randint(0, len(views) - 1)]
+        image = render(view, gaussians, pipeline, background)["render"]
+        gt_image = view.original_image[0:3].cuda()
+        loss = (1.0 - opt.lambda_dssim) * l1_loss(image, gt_image) + opt.lambda_dssim * (1.0 - ssim(image, gt_image))
+        loss.backward()
+        gaussians.optimizer.step()
+        gaussians.optimizer.zero_grad(set_to_none=True)
+
+
+def compact_model(dataset, opt, pipeline, args):
+    gaussians = GaussianModel(args)
+    scene = Scene(args, gaussians, load_iteration=args.iteration, shuffle=False)
+    bg_color = [1, 1, 1] if dataset.white_background else [0, 0, 0]
+    background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
+    eval_views = scene.getTestCameras() or scene.getTrainCameras()
+    num = gaussians.get_xyz.shape[0]
+
+    with torch.no_grad():
+        baked = gaussians.bake()
+        importance = torch.zeros(num, device="cuda")
+        for view in tqdm(scene.getTrainCameras(), desc="Blending contribution"):
+            importance += blending_contribution(view, baked, pipeline, background)
+        ranking = torch.argsort(importance, descending=True)
+
+        full_psnr = views_psnr(baked, eval_views, pipeline, background)
+        counts = [args.target_count] if args.target_count else [int(round(num * ratio)) for ratio in args.keep_ratios]
+        report = {"num_gaussians": num, "psnr": full_psnr, "never_visible": int((importance == 0).sum()), "candidates": []}
+        print("{:>9d} Gaussians  PSNR {:.3f} dB  ({} never contribute)".format(num, full_psnr, report["never_visible"]))
+        for count in sorted(set(min(count, num) for count in counts), reverse=True):
+            value = views_psnr(baked.subset(ranking[:count]), eval_views, pipeline, background)
+            report["candidates"].append({"num_gaussians": count, "psnr": value, "psnr_drop": full_psnr - value})
+            print("{:>9d} Gaussians  PSNR {:.3f} dB  ({:+.3f} dB, {:.1f}x smaller)".format(
+                count, value, value - full_psnr, num / max(count, 1)))
+        del baked
+
+    if args.target_count:
+        count = report["candidates"][0]["num_gaussians"]
+    else:
+        within = [c["num_gaussians"] for c in report["candidates"] if c["psnr_drop"] <= args.max_psnr_drop]
+        count = min(within, default=num)
+    keep = torch.zeros(num, dtype=torch.bool, device="cuda")
+    keep[ranking[:count]] = True
+    keep_gaussians(gaussians, keep)
+    report["kept"] = count
+
+    if args.finetune_iterations > 0:
+        finetune(gaussians, scene, opt, pipeline, background, args.finetune_iterations)
+        with torch.no_grad():
+            report["finetuned_psnr"] = views_psnr(gaussians, eval_views, pipeline, background)
+        print("Fine-tuned {} Gaussians: PSNR {:.3f} dB".format(count, report["finetuned_psnr"]))
+
+    output = args.output or dataset.model_path.rstrip("/") + "_compact"
+    os.makedirs(output, exist_ok=True)
+    shutil.copyfile(os.path.join(dataset.model_path, "cfg_args"), os.path.join(output, "cfg_args"))
+    gaussians.save_ply(os.path.join(output, "point_cloud", "iteration_{}".format(scene.loaded_iter), "point_cloud.ply"))
+    with open(os.path.join(output, "compaction.json"), "w") as f:
+        json.dump(report, f, indent=2)
+    print("Kept {} of {} Gaussians ({:.1f}x smaller), written to {}".format(count, num, num / max(count, 1), output))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Importance-based model compaction")
+    model = ModelParams(parser, sentinel=True)
+    optimization = OptimizationParams(parser)
+    pipeline = PipelineParams(parser)
+    parser.add_argument("--iteration", default=-1, type=int)
+    parser.add_argument("--keep_ratios", nargs="+", type=float, default=[0.5, 0.33, 0.25, 0.2])
+    parser.add_argument("--target_count", default=0, type=int)
+    parser.add_argument("--max_psnr_drop", default=0.5, type=float)
+    parser.add_argument("--finetune_iterations", default=0, type=int)
+    parser.add_argument("--output", default="", type=str)
+    parser.add_argument("--quiet", action="store_true")
+    args = get_combined_args(parser)
+    print("Compacting " + args.model_path)
+
+    safe_state(args.quiet)
+
+    compact_model(model.extract(args), optimization.extract(args), pipeline.extract(args), args)
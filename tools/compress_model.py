@@ -0,0 +1,78 @@
+"""
+Compress a trained model to point_cloud/iteration_<n>/point_cloud.gsz (see
+scene/gaussian_codec.py) and report what it costs: file size against the
+PLY, and the PSNR of the test views rendered from the PLY and from the
+compressed model (against the ground truth and against each other).
+render.py and train.py load the .gsz when there is no PLY, or with
+--compressed_model.
+
+    python tools/compress_model.py -m output/fern --iteration -1
+    python tools/compress_model.py -m output/fern --codebook_size 8192 --block_size 32768
+"""
+import os
+import sys
+from argparse import ArgumentParser
+
+import torch
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from scene import Scene
+from scene.gaussian_model import GaussianModel
+from scene.gaussian_codec import COMPRESSED_NAME, ply_nbytes
+from gaussian_renderer import render
+from arguments import ModelParams, PipelineParams, get_combined_args
+from utils.general_utils import safe_state
+from utils.image_utils import mean_psnr
+
+
+def compress_model(dataset, pipeline, args):
+    with torch.no_grad():
+        # compress what is in the PLY, whatever --compressed_model says
+        args.compressed_model = False
+        gaussians = GaussianModel(args)
+        scene = Scene(args, gaussians, load_iteration=args.iteration, shuffle=False)
+        point_cloud_path = os.path.join(dataset.model_path, "point_cloud", "iteration_{}".format(scene.loaded_iter))
+        path = os.path.join(point_cloud_path, COMPRESSED_NAME)
+        gaussians.save_compressed(path, block_size=args.block_size, codebook_size=args.codebook_size,
+                                  kmeans_iterations=args.kmeans_iterations)
+
+        compressed = GaussianModel(args)
+        compressed.load_compressed(path)
+
+        ply_size = os.path.getsize(os.path.join(point_cloud_path, "point_cloud.ply"))
+        size = os.path.getsize(path)
+        print("{} Gaussians: PLY {:.2f} MB ({:.2f} MB of attributes), compressed {:.2f} MB, {:.1f}x smaller".format(
+            gaussians.get_xyz.shape[0], ply_size / 1e6, ply_nbytes(gaussians) / 1e6, size / 1e6, ply_size / size))
+
+        views = scene.getTestCameras() or scene.getTrainCameras()
+        bg_color = [1, 1, 1] if dataset.white_background else [0, 0, 0]
+        background = torch.tensor(bg_color, dtype=torch.float32, device="cuda")
+        original, decoded, gts = [], [], []
+        for view in tqdm(views, desc="Rendering"):
+            gt = view.original_image[0:3, :, :].cuda()
+            original.append(torch.clamp(render(view, gaussians, pipeline, background)["render"], 0.0, 1.0)[None])
+            decoded.append(torch.clamp(render(view, compressed, pipeline, background)["render"], 0.0, 1.0)[None])
+            gts.append(gt[None])
+
+        psnr_ply = mean_psnr(zip(original, gts))
+        psnr_compressed = mean_psnr(zip(decoded, gts))
+        print("PSNR over {} views: PLY {:.3f} dB, compressed {:.3f} dB ({:+.3f} dB), compressed vs PLY {:.2f} dB".format(
+            len(views), psnr_ply, psnr_compressed, psnr_compressed - psnr_ply, mean_psnr(zip(decoded, original))))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Gaussian model compression")
+    model = ModelParams(parser, sentinel=True)
+    pipeline = PipelineParams(parser)
+    parser.add_argument("--iteration", default=-1, type=int)
+    parser.add_argument("--block_size", default=1 << 16, type=int)
+    parser.add_argument("--codebook_size", default=4096, type=int)
+    parser.add_argument("--kmeans_iterations", default=10, type=int)
+    parser.add_argument("--quiet", action="store_true")
+    args = get_combined_args(parser)
+    print("Compressing " + args.model_path)
+
+    safe_state(args.quiet)
+
+    compress_model(model.extract(args), pipeline.extract(args), args)
@@ -0,0 +1,39 @@
+"""
+Downsample an initial point cloud (e.g. <n>_views/dense/fused.ply) with
+farthest point sampling and report the throughput.
+
+    python tools/downsample_ply.py -i fused.ply -o fused_100k.ply -k 100000 --method voxel --seed 0
+"""
+import os
+import sys
+import time
+from argparse import ArgumentParser
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from scene.dataset_readers import fetchPly, storePly, farthest_point_sampling
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Farthest point sampling of a PLY point cloud")
+    parser.add_argument("--input", "-i", required=True, type=str)
+    parser.add_argument("--output", "-o", required=True, type=str)
+    parser.add_argument("--num_points", "-k", required=True, type=int)
+    parser.add_argument("--method", default="exact", choices=["exact", "voxel"])
+    parser.add_argument("--seed", default=0, type=int)
+    parser.add_argument("--chunk_size", default=1 << 18, type=int)
+    args = parser.parse_args(sys.argv[1:])
+
+    pcd = fetchPly(args.input)
+    num_input = pcd.points.shape[0]
+    start = time.perf_counter()
+    points, indices = farthest_point_sampling(pcd.points, args.num_points, method=args.method, seed=args.seed,
+                                              chunk_size=args.chunk_size, return_indices=True)
+    elapsed = time.perf_counter() - start
+    print("Sampled {} of {} points ({}) in {:.2f}s: {:.2f} M input points/s".format(
+        len(indices), num_input, args.method, elapsed, num_input / max(elapsed, 1e-9) / 1e6))
+    if args.method == "exact":
+        print("{:.1f} M distance updates/s".format(num_input * len(indices) / max(elapsed, 1e-9) / 1e6))
+
+    storePly(args.output, points, (np.asarray(pcd.colors)[indices] * 255.0).round())
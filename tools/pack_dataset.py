@@ -0,0 +1,112 @@
+"""
+Pack a COLMAP or Blender scene into a single <output>/scene.gspack file.
+
+Images are stored pre-resized at every resolution the trainer will ask for
+(same rules as --resolution / -r), optionally together with the monocular
+depth of each level, the camera poses and bounds, and the initial point
+cloud. Training with -s <output> then reads everything from that one file.
+
+    python tools/pack_dataset.py -s data/llff/fern --eval --n_views 3 -r 8 -o data/llff/fern
+    python tools/pack_dataset.py -s data/llff/fern --eval --n_views 3 -r 8 --depth_provider midas -o packed/fern
+"""
+import os
+import sys
+from argparse import ArgumentParser, Namespace
+
+import numpy as np
+from tqdm import tqdm
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from arguments import ModelParams
+from scene.dataset_readers import sceneLoadTypeCallbacks
+from scene.dataset_pack import PACK_NAME, PackWriter
+from utils.camera_utils import cameraResolution, decodeCamImage
+from utils.depth_utils import get_depth_provider
+
+
+def pack_levels(cam_info, resolutions, resolution_scales):
+    sizes = []
+    for resolution in resolutions:
+        for scale in resolution_scales:
+            size = cameraResolution(Namespace(resolution=resolution), cam_info, scale)
+            if size not in sizes:
+                sizes.append(size)
+    return sizes
+
+
+def pack_scene(source_path, output, images=None, white_background=False, eval=False, n_views=0,
+               resolutions=(-1,), resolution_scales=(1.0,), depth_args=None):
+    if os.path.exists(os.path.join(source_path, "sparse")):
+        scene_info = sceneLoadTypeCallbacks["Colmap"](source_path, images, eval, n_views)
+    elif os.path.exists(os.path.join(source_path, "transforms_train.json")):
+        scene_info = sceneLoadTypeCallbacks["Blender"](source_path, white_background, eval, n_views)
+    else:
+        raise ValueError("Could not recognize scene type of {}".format(source_path))
+    # the train/test split (eval, n_views) is fixed at pack time and stored as camera indices
+    cam_infos = scene_info.train_cameras + scene_info.test_cameras
+    num_train = len(scene_info.train_cameras)
+    depth_provider = get_depth_provider(depth_args) if depth_args is not None else None
+
+    os.makedirs(output, exist_ok=True)
+    writer = PackWriter(os.path.join(output, PACK_NAME))
+    cameras = []
+    for cam_info in tqdm(cam_infos, desc="Packing cameras"):
+        levels = []
+        for size in pack_levels(cam_info, resolutions, resolution_scales):
+            image = decodeCamImage(cam_info, size)
+            level = {"size": list(size),
+                     "image": writer.add_array((image.permute(1, 2, 0) * 255.0).round().byte().numpy()),
+                     "depth": None}
+            if depth_provider is not None:
+                depth = depth_provider(image[:3, ...], cam_info.image_name)
+                level["depth"] = writer.add_array(depth.detach().cpu().numpy().astype(np.float16))
+            levels.append(level)
+        cameras.append({"uid": int(cam_info.uid),
+                        "R": np.asarray(cam_info.R).tolist(), "T": np.asarray(cam_info.T).tolist(),
+                        "FovY": float(cam_info.FovY), "FovX": float(cam_info.FovX),
+                        "width": int(cam_info.width), "height": int(cam_info.height),
+                        "size": list(cam_info.image.size),
+                        "image_path": cam_info.image_path, "image_name": cam_info.image_name,
+                        "bounds": None if cam_info.bounds is None else np.asarray(cam_info.bounds).tolist(),
+                        "mask": None if cam_info.mask is None else writer.add_array(cam_info.mask),
+                        "levels": levels})
+
+    point_cloud = None
+    if scene_info.point_cloud is not None:
+        point_cloud = {k: writer.add_array(getattr(scene_info.point_cloud, k))
+                       for k in ["points", "colors", "normals"]}
+    writer.close({"eval": bool(eval),
+                  "n_views": n_views,
+                  "train": list(range(num_train)),
+                  "test": list(range(num_train, len(cam_infos))),
+                  "cameras": cameras,
+                  "point_cloud": point_cloud,
+                  "ply": writer.add_file(scene_info.ply_path)})
+    return os.path.join(output, PACK_NAME)
+
+
+if __name__ == "__main__":
+    # the image folder train.py -s would read from the same source
+    model_defaults = ArgumentParser()
+    ModelParams(model_defaults)
+    parser = ArgumentParser(description="Pack a scene into a single memory-mappable file")
+    parser.add_argument("--source_path", "-s", required=True, type=str)
+    parser.add_argument("--output", "-o", required=True, type=str)
+    parser.add_argument("--images", "-i", default=model_defaults.get_default("images"), type=str)
+    parser.add_argument("--white_background", "-w", action="store_true")
+    parser.add_argument("--eval", action="store_true")
+    parser.add_argument("--n_views", default=0, type=int)
+    parser.add_argument("--resolutions", "-r", nargs="+", type=int, default=[-1])
+    parser.add_argument("--resolution_scales", nargs="+", type=float, default=[1.0])
+    parser.add_argument("--depth_provider", default="", type=str,
+                        help="also store per-level depths from this provider (see utils/depth_utils.py)")
+    parser.add_argument("--depth_dir", default="", type=str)
+    args = parser.parse_args(sys.argv[1:])
+
+    depth_args = None
+    if args.depth_provider:
+        depth_args = Namespace(depth_provider=args.depth_provider, depth_dir=args.depth_dir,
+                               source_path=args.source_path)
+    path = pack_scene(args.source_path, args.output, args.images, args.white_background, args.eval, args.n_views,
+                      args.resolutions, args.resolution_scales, depth_args)
+    print("Wrote {} ({:.1f} MiB)".format(path, os.path.getsize(path) / 2**20))
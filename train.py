@@ -23,6 +23,7 @@ from torchmetrics.functional.regression import pearson_corrcoef
 from random import randint
 from utils.loss_utils import l1_loss, l1_loss_mask, l2_loss, ssim
 from utils.depth_utils import estimate_depth
+from utils.camera_stream import CameraStream
 from gaussian_renderer import render, network_gui
 import sys
 from scene import Scene, GaussianModel
@@ -55,7 +56,8 @@ def training(dataset, opt, pipe, args):
     iter_end = torch.cuda.Event(enable_timing=True)
     progress_bar = tqdm(range(first_iter, opt.iterations), desc="Training progress")
 
-    viewpoint_stack, pseudo_stack = None, None
+    camera_stream = CameraStream(scene.getTrainCameras(), prefetch=opt.prefetch_cameras, device="cuda")
+    pseudo_stack = None
     ema_loss_for_log = 0.0
     first_iter += 1
     for iteration in range(first_iter, opt.iterations + 1):
@@ -82,23 +84,20 @@ def training(dataset, opt, pipe, args):
         if iteration % 500 == 0:
             gaussians.oneupSHdegree()
 
-        # Pick a random Camera
-        if not viewpoint_stack:
-            viewpoint_stack = scene.getTrainCameras().copy()
-
-        viewpoint_cam = viewpoint_stack.pop(randint(0, len(viewpoint_stack)-1))
+        # Pick a random Camera; its image and depth were copied to the GPU ahead of time
+        viewpoint_cam, gt_image, midas_depth = camera_stream.next()
         render_pkg = render(viewpoint_cam, gaussians, pipe, background)
         image, viewspace_point_tensor, visibility_filter, radii = render_pkg["render"], render_pkg["viewspace_points"], render_pkg["visibility_filter"], render_pkg["radii"]
+        # Gaussians that receive a gradient this iteration, for the sparse optimizer step
+        visible = visibility_filter
 
 
         # Loss
-        gt_image = viewpoint_cam.original_image.cuda()
         Ll1 =  l1_loss_mask(image, gt_image)
         loss = ((1.0 - opt.lambda_dssim) * Ll1 + opt.lambda_dssim * (1.0 - ssim(image, gt_image)))
 
 
         rendered_depth = render_pkg["depth"][0]
-        midas_depth = torch.tensor(viewpoint_cam.depth_image).cuda()
         rendered_depth = rendered_depth.reshape(-1, 1)
         midas_depth = midas_depth.reshape(-1, 1)
 
@@ -119,6 +118,7 @@ def training(dataset, opt, pipe, args):
             pseudo_cam = pseudo_stack.pop(randint(0, len(pseudo_stack) - 1))
 
             render_pkg_pseudo = render(pseudo_cam, gaussians, pipe, background)
+            visible = visible | render_pkg_pseudo["visibility_filter"]
             rendered_depth_pseudo = render_pkg_pseudo["depth"][0]
             midas_depth_pseudo = estimate_depth(render_pkg_pseudo["render"], mode='train')
 
@@ -167,9 +167,16 @@ def training(dataset, opt, pipe, args):
 
             # Optimizer step
             if iteration < opt.iterations:
-                gaussians.optimizer.step()
+                if opt.sparse_adam:
+                    gaussians.optimizer.step(visible)
+                else:
+                    gaussians.optimizer.step()
                 gaussians.optimizer.zero_grad(set_to_none = True)
 
+                # restore memory locality every morton_interval iterations, and right before each save
+                if opt.morton_interval and (iteration % opt.morton_interval == 0 or iteration + 1 in saving_iterations):
+                    gaussians.reorder_by_morton()
+
             gaussians.update_learning_rate(iteration)
             if (iteration - args.start_sample_pseudo - 1) % opt.opacity_reset_interval == 0 and \
                     iteration > args.start_sample_pseudo:
@@ -244,6 +251,10 @@ def training_report(tb_writer, iteration, Ll1, loss, l1_loss, testing_iterations
         if tb_writer:
             tb_writer.add_histogram("scene/opacity_histogram", scene.gaussians.get_opacity, iteration)
             tb_writer.add_scalar('total_points', scene.gaussians.get_xyz.shape[0], iteration)
+            knn_cache = scene.gaussians.knn_cache
+            tb_writer.add_scalar('knn_cache/hits', knn_cache.hits, iteration)
+            tb_writer.add_scalar('knn_cache/misses', knn_cache.misses, iteration)
+            tb_writer.add_scalar('knn_cache/searched_rows', knn_cache.searched_rows, iteration)
         torch.cuda.empty_cache()
 
 if __name__ == "__main__":
@@ -0,0 +1,118 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import random
+from collections import deque
+import numpy as np
+import torch
+
+
+def _torch_dtype(numpy_dtype):
+    return torch.from_numpy(np.empty(0, dtype=numpy_dtype)).dtype
+
+
+class CameraStream:
+    """
+    Replacement for the training loop's viewpoint_stack. Cameras are drawn
+    uniformly without replacement and the stack is refilled once it is empty,
+    as before, but the next `prefetch` cameras are selected ahead of time and
+    their ground-truth image and depth are copied to `device` on a side CUDA
+    stream (from pinned host memory when they live on the CPU), so the copies
+    overlap with the current iteration. The pinned staging buffers are
+    allocated once per image shape and reused in a ring of prefetch + 2.
+    The draws come from the stream's own random.Random(seed), so drawing
+    ahead leaves the global RNG, which train.py samples pseudo views from,
+    alone, and the camera order does not depend on `prefetch`.
+
+    next() returns (camera, gt_image, depth): gt_image is a float32 (3,H,W)
+    tensor in [0,1] and depth a float32 (H,W) tensor, or None when the camera
+    has no depth. On a CPU device nothing is staged and tensors are built on
+    demand.
+    """
+    def __init__(self, cameras, prefetch=2, device="cuda", seed=0):
+        self.cameras = cameras
+        self.rng = random.Random(seed)
+        self.prefetch = max(int(prefetch), 1)
+        self.device = torch.device(device)
+        if self.device.type == "cuda" and not torch.cuda.is_available():
+            self.device = torch.device("cpu")
+        self.use_cuda = self.device.type == "cuda"
+        self.copy_stream = torch.cuda.Stream(device=self.device) if self.use_cuda else None
+        self.stack = []
+        self.staged = deque()
+        # (shape, dtype) -> ring of (pinned buffer, event of the last copy out of it)
+        self.pinned = {}
+
+    def _pick(self):
+        if not self.stack:
+            self.stack = list(self.cameras)
+        return self.stack.pop(self.rng.randint(0, len(self.stack) - 1))
+
+    def _staging_buffer(self, shape, dtype):
+        ring = self.pinned.setdefault((tuple(shape), dtype), deque())
+        if len(ring) < self.prefetch + 2:
+            return torch.empty(shape, dtype=dtype, pin_memory=True)
+        buffer, copied = ring.popleft()
+        # issued prefetch + 2 cameras ago, so this practically never waits
+        copied.synchronize()
+        return buffer
+
+    def _to_device(self, data, used):
+        if isinstance(data, torch.Tensor):
+            if data.device == self.device:
+                return data
+            if data.device.type != "cpu" or data.is_pinned():
+                return data.to(self.device, non_blocking=True)
+            buffer = self._staging_buffer(data.shape, data.dtype)
+            buffer.copy_(data)
+        else:
+            data = np.asarray(data)
+            buffer = self._staging_buffer(data.shape, _torch_dtype(data.dtype))
+            buffer.numpy()[...] = data
+        used.append(buffer)
+        return buffer.to(self.device, non_blocking=True)
+
+    def _stage(self, camera):
+        image = camera.stored_image
+        depth = camera.depth_image
+        if not self.use_cuda:
+            return camera, image, depth, None
+        used = []
+        with torch.cuda.stream(self.copy_stream):
+            image = self._to_device(image, used)
+            if depth is not None:
+                depth = self._to_device(depth, used)
+            ready = torch.cuda.Event()
+            ready.record(self.copy_stream)
+        for buffer in used:
+            self.pinned[(tuple(buffer.shape), buffer.dtype)].append((buffer, ready))
+        return camera, image, depth, ready
+
+    def _finish(self, camera, image, depth, ready):
+        if ready is not None:
+            current = torch.cuda.current_stream(self.device)
+            current.wait_event(ready)
+            # the copies were allocated on copy_stream but are consumed on the compute stream
+            image.record_stream(current)
+            if depth is not None:
+                depth.record_stream(current)
+        if image.dtype == torch.uint8:
+            image = image.float() / 255.0
+        if depth is not None:
+            # np.array copies: cached depths are read-only memory maps
+            depth = torch.from_numpy(np.array(depth, dtype=np.float32)) if isinstance(depth, np.ndarray) \
+                else depth.float()
+        return camera, image.to(self.device), None if depth is None else depth.to(self.device)
+
+    def next(self):
+        while len(self.staged) < self.prefetch + 1:
+            self.staged.append(self._stage(self._pick()))
+        return self._finish(*self.staged.popleft())
@@ -9,17 +9,21 @@
 # For inquiries contact  george.drettakis@inria.fr
 #
 
+import os
+from concurrent.futures import ThreadPoolExecutor
 from scene.cameras import Camera
 import numpy as np
 import cv2
+from PIL import Image
 from tqdm import tqdm
 from utils.general_utils import PILtoTorch
 from utils.graphics_utils import fov2focal
-from utils.depth_utils import estimate_depth
+from utils.depth_utils import get_depth_provider
+from utils.depth_cache import load_or_estimate_depth
 
 WARNED = False
 
-def loadCam(args, id, cam_info, resolution_scale):
+def cameraResolution(args, cam_info, resolution_scale):
     orig_w, orig_h = cam_info.image.size
 
     if args.resolution in [1, 2, 4, 8]:
@@ -40,13 +44,32 @@ def loadCam(args, id, cam_info, resolution_scale):
 
         scale = float(global_down) * float(resolution_scale)
         resolution = (int(orig_w / scale), int(orig_h / scale))
+    return resolution
 
-    resized_image_rgb = PILtoTorch(cam_info.image, resolution)
+
+def decodeCamImage(cam_info, resolution):
+    # File-backed images are reopened here and closed as soon as they are resized,
+    # so no file handle outlives the decode.
+    image_file = getattr(cam_info.image, "filename", "")
+    if image_file:
+        with Image.open(image_file) as image:
+            return PILtoTorch(image, resolution)
+    return PILtoTorch(cam_info.image, resolution)
+
+
+def loadCam(args, id, cam_info, resolution_scale, resized_image_rgb=None):
+    resolution = cameraResolution(args, cam_info, resolution_scale)
+    if resized_image_rgb is None:
+        resized_image_rgb = decodeCamImage(cam_info, resolution)
     mask = None if cam_info.mask is None else cv2.resize(cam_info.mask, resolution)
     gt_image = resized_image_rgb[:3, ...]
     loaded_mask = None
 
-    depth = estimate_depth(gt_image.cuda()).cpu().numpy()
+    provider = get_depth_provider(args)
+    cache_dir = None if args.no_depth_cache or not provider.cacheable else \
+        (args.depth_cache_dir or os.path.join(args.source_path, ".depth_cache"))
+    depth = load_or_estimate_depth(gt_image, lambda image: provider(image, cam_info.image_name), provider.model_id,
+                                   cache_dir, recompute=args.recompute_depth, dtype=np.dtype(args.depth_cache_dtype))
 
     if resized_image_rgb.shape[1] == 4:
         loaded_mask = resized_image_rgb[3:4, ...]
@@ -54,17 +77,28 @@ def loadCam(args, id, cam_info, resolution_scale):
     return Camera(colmap_id=cam_info.uid, R=cam_info.R, T=cam_info.T, 
                   FoVx=cam_info.FovX, FoVy=cam_info.FovY,  image=gt_image, gt_alpha_mask=loaded_mask,
                   uid=id, data_device=args.data_device, image_name=cam_info.image_name,
-                  depth_image=depth, mask=mask, bounds=cam_info.bounds)
+                  depth_image=depth, mask=mask, bounds=cam_info.bounds,
+                  compact_images=args.compact_images)
 
 
 def cameraList_from_camInfos(cam_infos, resolution_scale, args):
+    # Images are decoded and resized by a thread pool (PIL releases the GIL while
+    # decoding); depth estimation and Camera construction stay on the main thread
+    # and consume the decoded images in the original camera order.
     camera_list = []
+    resolutions = [cameraResolution(args, c, resolution_scale) for c in cam_infos]
+    num_workers = args.load_workers if args.load_workers > 0 else min(8, os.cpu_count() or 1)
 
-    for id, c in tqdm((enumerate(cam_infos))):
-        camera_list.append(loadCam(args, id, c, resolution_scale))
+    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        images = pool.map(decodeCamImage, cam_infos, resolutions)
+        for id, (c, image) in tqdm(enumerate(zip(cam_infos, images)), total=len(cam_infos)):
+            camera_list.append(loadCam(args, id, c, resolution_scale, image))
 
     return camera_list
 
+def cameraList_nbytes(camera_list):
+    return sum(camera.resident_bytes() for camera in camera_list)
+
 def camera_to_JSON(id, camera : Camera):
     Rt = np.zeros((4, 4))
     Rt[:3, :3] = camera.R.transpose()
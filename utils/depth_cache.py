@@ -0,0 +1,56 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import os
+import hashlib
+import numpy as np
+
+
+def depth_cache_key(image, model_id, dtype=np.float16):
+    """Key a monocular depth map by the exact network input (which already
+    encodes the source pixels and the resolution), the depth model id and
+    the stored dtype."""
+    h = hashlib.sha1()
+    h.update(model_id.encode("utf-8"))
+    h.update(np.dtype(dtype).str.encode("utf-8"))
+    h.update(str(tuple(image.shape)).encode("utf-8"))
+    h.update(image.detach().cpu().contiguous().numpy().tobytes())
+    return h.hexdigest()
+
+
+def load_or_estimate_depth(image, estimate_fn, model_id, cache_dir, recompute=False, dtype=np.float16):
+    """
+    Return the depth of `image` (C,H,W tensor in [0,1]) as an (H,W) array.
+
+    With a cache_dir, depths are stored as `dtype` .npy files (float16 by
+    default, half the size of float32) and returned as read-only memory
+    maps, so warm starts do not copy them. The array returned on a cold start
+    is that same memory map, so results do not depend on whether the cache
+    was hit. If the cache cannot be written (e.g. a read-only dataset), the
+    estimated depth is returned as a `dtype` array instead.
+    """
+    if not cache_dir:
+        return estimate_fn(image).cpu().numpy()
+
+    key = depth_cache_key(image, model_id, dtype)
+    path = os.path.join(cache_dir, key[:2], key + ".npy")
+    if recompute or not os.path.exists(path):
+        depth = estimate_fn(image).cpu().numpy().astype(dtype)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, depth)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print("[Warning] Could not write depth cache {}: {}".format(path, e))
+            return depth
+    return np.load(path, mmap_mode="r")
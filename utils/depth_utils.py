@@ -1,17 +1,29 @@
+import os
+import numpy as np
 import torch
 
-midas = torch.hub.load("intel-isl/MiDaS", "DPT_Hybrid")
-device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
-midas.to(device)
-midas.eval()
-for param in midas.parameters():
-    param.requires_grad = False
-
-midas_transforms = torch.hub.load("intel-isl/MiDaS", "transforms")
-transform = midas_transforms.dpt_transform
 downsampling = 1
 
+_midas = None
+
+
+def get_midas():
+    # MiDaS is fetched through torch.hub on first use only, so importing this
+    # module (and everything that imports scene) stays free of network access.
+    global _midas
+    if _midas is None:
+        midas = torch.hub.load("intel-isl/MiDaS", "DPT_Hybrid")
+        device = torch.device("cuda") if torch.cuda.is_available() else torch.device("cpu")
+        midas.to(device)
+        midas.eval()
+        for param in midas.parameters():
+            param.requires_grad = False
+        _midas = midas
+    return _midas
+
+
 def estimate_depth(img, mode='test'):
+    midas = get_midas()
     h, w = img.shape[1:3]
     norm_img = (img[None] - 0.5) / 0.5
     norm_img = torch.nn.functional.interpolate(
@@ -39,3 +51,102 @@ def estimate_depth(img, mode='test'):
         ).squeeze()
     return prediction
 
+
+class MidasDepthProvider:
+    """Monocular depth from MiDaS DPT_Hybrid (loaded on the first call)."""
+    model_id = "intel-isl/MiDaS/DPT_Hybrid"
+    cacheable = True
+
+    def __init__(self, args=None):
+        self.device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    def __call__(self, image, image_name=None):
+        return estimate_depth(image.to(self.device))
+
+
+class PrecomputedDepthProvider:
+    """
+    Depth maps stored next to the dataset as <depth_dir>/<image_name>.npy
+    (an (H,W) array in MiDaS' inverse-depth convention), resized to the
+    camera resolution.
+    """
+    cacheable = False
+
+    def __init__(self, args):
+        self.depth_dir = args.depth_dir or os.path.join(args.source_path, "depths")
+        self.model_id = "precomputed:" + os.path.abspath(self.depth_dir)
+
+    def __call__(self, image, image_name=None):
+        path = os.path.join(self.depth_dir, image_name + ".npy")
+        if not os.path.exists(path):
+            raise FileNotFoundError("No precomputed depth for {} in {}".format(image_name, self.depth_dir))
+        depth = torch.from_numpy(np.load(path).astype(np.float32))
+        h, w = image.shape[1:3]
+        if depth.shape != (h, w):
+            depth = torch.nn.functional.interpolate(depth[None, None], size=(h, w), mode="bilinear",
+                                                    align_corners=False).squeeze()
+        return depth
+
+
+class LuminanceDepthProvider:
+    """
+    Cheap CPU stand-in: a blurred luminance map used as pseudo inverse depth.
+    It has no geometric meaning; it exists so the loading and caching paths can
+    be exercised without downloading a network.
+    """
+    model_id = "luminance"
+    cacheable = True
+
+    def __init__(self, args=None):
+        pass
+
+    def __call__(self, image, image_name=None):
+        image = image.detach().float().cpu()
+        luma = (0.299 * image[0] + 0.587 * image[1] + 0.114 * image[2])[None, None]
+        return torch.nn.functional.avg_pool2d(luma, 5, stride=1, padding=2, count_include_pad=False).squeeze()
+
+
+class PackedDepthProvider:
+    """Depths stored in <source_path>/scene.gspack by tools/pack_dataset.py, per image level."""
+    cacheable = False
+
+    def __init__(self, args):
+        # imported here: scene imports this module through utils.camera_utils
+        from scene.dataset_pack import PACK_NAME, open_pack
+        self.pack = open_pack(os.path.join(args.source_path, PACK_NAME))
+        self.model_id = "packed:" + self.pack.path
+        self.depths = {(cam["image_name"], tuple(level["size"])): level["depth"]
+                       for cam in self.pack.index["cameras"] for level in cam["levels"]
+                       if level["depth"] is not None}
+
+    def __call__(self, image, image_name=None):
+        h, w = image.shape[1:3]
+        key = (image_name, (w, h))
+        if key not in self.depths:
+            raise KeyError("No packed depth for {} at {}x{} in {}".format(image_name, w, h, self.pack.path))
+        return torch.from_numpy(np.array(self.pack.array(self.depths[key]), dtype=np.float32))
+
+
+depthProviders = {
+    "midas": MidasDepthProvider,
+    "precomputed": PrecomputedDepthProvider,
+    "luminance": LuminanceDepthProvider,
+    "packed": PackedDepthProvider
+}
+
+_providers = {}
+
+
+def get_depth_provider(args):
+    """
+    Return the provider selected by args.depth_provider, constructing it once
+    per name and the arguments its constructor reads (depth_dir, source_path).
+    """
+    name = args.depth_provider
+    if name not in depthProviders:
+        raise ValueError("Unknown depth provider '{}', expected one of {}".format(name, sorted(depthProviders)))
+    key = (name, os.path.abspath(args.depth_dir) if args.depth_dir else "",
+           os.path.abspath(args.source_path) if args.source_path else "")
+    if key not in _providers:
+        _providers[key] = depthProviders[name](args)
+    return _providers[key]
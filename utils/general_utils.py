@@ -177,5 +177,7 @@ def vis_depth(depth):
 
 
 def chamfer_dist(array1, array2):
-    dist = torch.norm(array1[None] - array2[:, None], 2, dim=-1)
-    return dist.min(1)[0]
\ No newline at end of file
+    # for every point of array2, the distance to its nearest point in array1; a grid
+    # index keeps memory linear instead of materializing all len(array1) x len(array2) pairs
+    from utils.knn_utils import GridIndex
+    return GridIndex(array1).min_distance(array2)
\ No newline at end of file
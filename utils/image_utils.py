@@ -21,3 +21,8 @@ def psnr(img1, img2, mask=None):
         mask_bin = (mask == 1.)
         mse = (((img1 - img2)[mask_bin]) ** 2).mean()
     return 20 * torch.log10(1.0 / torch.sqrt(mse))
+
+def mean_psnr(pairs):
+    """PSNR averaged over (image, reference) pairs of (1, C, H, W) images."""
+    values = [psnr(a, b).mean().item() for a, b in pairs]
+    return sum(values) / max(len(values), 1)
@@ -0,0 +1,562 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import itertools
+import torch
+
+try:
+    from simple_knn._C import distCUDA2
+except ImportError:
+    distCUDA2 = None
+
+
+def _shell_offsets(ring, device):
+    # integer cell offsets at Chebyshev distance exactly `ring`
+    r = range(-ring, ring + 1)
+    offsets = [o for o in itertools.product(r, r, r) if max(abs(v) for v in o) == ring]
+    return torch.tensor(offsets, dtype=torch.int64, device=device)
+
+
+def _pairwise_min_distance(queries, points, block=1 << 22):
+    # exact minimum distance by brute force, in blocks of at most `block` query/point pairs
+    best = torch.full((queries.shape[0],), float("inf"), dtype=queries.dtype, device=queries.device)
+    if points.shape[0] == 0:
+        return best
+    q_chunk = max(1, min(queries.shape[0], block // min(points.shape[0], block)))
+    p_chunk = max(1, block // q_chunk)
+    for q in range(0, queries.shape[0], q_chunk):
+        for p in range(0, points.shape[0], p_chunk):
+            dist = torch.norm(points[None, p:p + p_chunk] - queries[q:q + q_chunk, None], 2, dim=-1)
+            best[q:q + q_chunk] = torch.minimum(best[q:q + q_chunk], dist.min(1)[0])
+    return best
+
+
+def _merge_knn(best_dist, best_index, dist, index, k):
+    # keep the k smallest of the current best and the (Q, M) candidates, in ascending order
+    dist = torch.cat((best_dist, dist), dim=1)
+    index = torch.cat((best_index, index), dim=1)
+    dist, order = torch.topk(dist, k, dim=1, largest=False, sorted=True)
+    return dist, torch.gather(index, 1, order)
+
+
+def _pairwise_knn(queries, query_index, points, k, best_dist, best_index, block=1 << 22):
+    # exact k nearest points (squared distances) by brute force, skipping each query's own index
+    q_chunk = max(1, min(queries.shape[0], block // max(1, min(points.shape[0], block))))
+    p_chunk = max(k, block // q_chunk)
+    for q in range(0, queries.shape[0], q_chunk):
+        for p in range(0, points.shape[0], p_chunk):
+            dist = ((points[None, p:p + p_chunk] - queries[q:q + q_chunk, None]) ** 2).sum(-1)
+            index = torch.arange(p, min(p + p_chunk, points.shape[0]), device=points.device).expand_as(dist)
+            dist = dist.masked_fill(index == query_index[q:q + q_chunk, None], float("inf"))
+            best_dist[q:q + q_chunk], best_index[q:q + q_chunk] = _merge_knn(
+                best_dist[q:q + q_chunk], best_index[q:q + q_chunk], dist, index, k)
+    return best_dist, best_index
+
+
+class GridIndex:
+    """
+    Uniform-grid nearest-neighbour index over a 3D point set, in torch, on the
+    device of the points. Points are bucketed into cubic cells sorted by cell
+    key; a query searches the shells of cells around its own cell until no
+    closer point can exist. Queries that are still unresolved after
+    `max_rings` shells (far from every point) move on to a 4x coarser grid,
+    and finally to blocked brute force. Candidate pairs are generated in
+    batches of at most `max_pairs`, so memory is linear in the number of
+    points and queries even around dense clusters. `cell_size` overrides the
+    size derived from `points_per_cell`.
+
+    insert(), select() and reorder() edit the indexed rows in place, in time
+    linear in the number of points, for as long as the grid still fits them.
+    """
+    def __init__(self, points, points_per_cell=4, max_rings=2, cell_size=None, max_pairs=1 << 23):
+        self.points = points.detach()
+        self.points_per_cell = points_per_cell
+        self.max_rings = max_rings
+        self.max_pairs = max_pairs
+        device = points.device
+        n = points.shape[0]
+        self.fitted_count = n
+        self._coarse = None
+        if n == 0:
+            self.cell_size = 1.0
+            self.sorted_points = self.points
+            self.order = torch.zeros(0, dtype=torch.int64, device=device)
+            return
+        lo = self.points.min(dim=0).values
+        extent = (self.points.max(dim=0).values - lo).clamp_min(1e-12)
+        self.extent = float(extent.max())
+        if cell_size is None:
+            cell_size = self._fit_cell_size(lo, extent)
+        self.cell_size = max(cell_size, self.extent / (1 << 20))
+        self.lo = lo
+        self.pad = 2 * max_rings + 1
+        self.dims = (torch.floor(extent / self.cell_size).to(torch.int64) + 1 + 2 * self.pad).tolist()
+
+        keys = self._keys(torch.floor((self.points - lo) / self.cell_size).to(torch.int64))
+        keys, order = torch.sort(keys)
+        self.sorted_points = self.points[order]
+        self.order = order
+        self._set_cells(keys)
+        # (ring, cell offsets) searched in turn; the own cell and its 26 neighbours go first, together
+        self.shells = [(1, torch.cat((_shell_offsets(0, device), _shell_offsets(1, device))))]
+        self.shells += [(ring, _shell_offsets(ring, device)) for ring in range(2, max_rings + 1)]
+
+    def _fit_cell_size(self, lo, extent, iterations=4):
+        # start from ~1 point per cell of the bounding box, then fit the cell size so that the cell of a
+        # point holds about points_per_cell points; the occupancy is averaged over points, not cells,
+        # so that a dense cluster is not hidden by many sparsely filled cells
+        n = self.points.shape[0]
+        cell_size = max(float((extent.prod() / n) ** (1.0 / 3.0)), self.extent / (1 << 20))
+        for _ in range(iterations):
+            cells = torch.floor((self.points - lo) / cell_size).to(torch.int64)
+            dims = cells.max(dim=0).values + 1
+            _, counts = torch.unique((cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2],
+                                     return_counts=True)
+            occupancy = float((counts.double() ** 2).sum()) / n
+            cell_size = max(cell_size * (self.points_per_cell / occupancy) ** (1.0 / 3.0), self.extent / (1 << 20))
+        return cell_size
+
+    def _set_cells(self, sorted_keys):
+        # one entry per occupied cell: its key and the range of its points in sorted order
+        self.sorted_keys = sorted_keys
+        self.cell_keys, counts = torch.unique_consecutive(sorted_keys, return_counts=True)
+        self.cell_counts = counts
+        self.cell_starts = torch.cumsum(counts, 0) - counts
+
+    def _coarser(self):
+        # the next level for queries the shells of this grid cannot settle, or None to use brute force;
+        # built on first use, then edited along with this grid
+        if self.cell_size * 4 >= self.extent:
+            return None
+        if self._coarse is None:
+            self._coarse = GridIndex(self.points, self.points_per_cell, self.max_rings, self.cell_size * 4,
+                                     self.max_pairs)
+        return self._coarse
+
+    def insert(self, points, max_change=2.0):
+        """
+        Index `points` as the rows after the current ones, without refitting
+        the grid. Returns False, leaving the index unchanged, when the grid no
+        longer fits: more than max_change times the points the cell size was
+        fitted to, or points outside the box the shells can reach.
+        """
+        points = points.detach()
+        num_old, num_new = self.points.shape[0], points.shape[0]
+        if num_new == 0:
+            return True
+        if num_old == 0 or num_old + num_new > max_change * self.fitted_count:
+            return False
+        cells, inside = self._locate(points)
+        if not bool(inside.all()):
+            return False
+        keys, order = torch.sort(self._keys(cells))
+        # merge into the sorted rows: each new key goes after the equal old ones
+        position = torch.searchsorted(self.sorted_keys, keys, right=True) + torch.arange(num_new, device=keys.device)
+        old = torch.ones(num_old + num_new, dtype=torch.bool, device=keys.device)
+        old[position] = False
+        sorted_keys = torch.empty(num_old + num_new, dtype=keys.dtype, device=keys.device)
+        sorted_points = torch.empty((num_old + num_new, 3), dtype=self.points.dtype, device=keys.device)
+        sorted_order = torch.empty(num_old + num_new, dtype=torch.int64, device=keys.device)
+        sorted_keys[old], sorted_keys[position] = self.sorted_keys, keys
+        sorted_points[old], sorted_points[position] = self.sorted_points, points[order]
+        sorted_order[old], sorted_order[position] = self.order, order + num_old
+        self.points = torch.cat((self.points, points))
+        self.sorted_points, self.order = sorted_points, sorted_order
+        self._set_cells(sorted_keys)
+        if self._coarse is not None and not self._coarse.insert(points, max_change):
+            self._coarse = None
+        return True
+
+    def select(self, mask, max_change=2.0):
+        """
+        Keep the indexed rows of `mask`, renumbered in order, without
+        refitting the grid. Returns False, leaving the index unchanged, when
+        fewer than 1 / max_change of the points the cell size was fitted to
+        would remain.
+        """
+        if self.points.shape[0] == 0:
+            return True
+        if int(mask.sum()) * max_change < self.fitted_count:
+            return False
+        keep = mask[self.order]
+        remap = torch.cumsum(mask, 0) - 1
+        self.points = self.points[mask]
+        self.sorted_points = self.sorted_points[keep]
+        self.order = remap[self.order[keep]]
+        self._set_cells(self.sorted_keys[keep])
+        if self._coarse is not None and not self._coarse.select(mask, max_change):
+            self._coarse = None
+        return True
+
+    def reorder(self, order):
+        """Renumber the indexed rows: row i becomes old row order[i]."""
+        inverse = torch.empty_like(order)
+        inverse[order] = torch.arange(order.shape[0], device=order.device)
+        self.points = self.points[order]
+        self.order = inverse[self.order]
+        if self._coarse is not None:
+            self._coarse.reorder(order)
+
+    def _keys(self, cells):
+        cells = cells + self.pad
+        return (cells[..., 0] * self.dims[1] + cells[..., 1]) * self.dims[2] + cells[..., 2]
+
+    def _locate(self, queries):
+        # cells of the queries, and whether the shells around them stay inside the padded grid
+        cells = torch.floor((queries - self.lo) / self.cell_size).to(torch.int64)
+        upper = torch.tensor(self.dims, device=queries.device) - 2 * self.pad
+        inside = ((cells >= -self.max_rings) & (cells < upper + self.max_rings)).all(dim=1)
+        return cells, inside
+
+    def min_distance(self, queries, chunk_size=1 << 14):
+        """Distance from every query to its nearest indexed point (same as a dense min over all pairs)."""
+        queries = queries.detach()
+        best = torch.full((queries.shape[0],), float("inf"), dtype=queries.dtype, device=queries.device)
+        if self.points.shape[0] == 0 or queries.shape[0] == 0:
+            return best
+
+        cells, inside = self._locate(queries)
+        unresolved = [torch.nonzero(~inside).squeeze(-1)]
+        for start in range(0, queries.shape[0], chunk_size):
+            idx = torch.arange(start, min(start + chunk_size, queries.shape[0]), device=queries.device)
+            idx = idx[inside[idx]]
+            for ring, shell in self.shells:
+                if idx.shape[0] == 0:
+                    break
+                for batch, owner, point in self._shell_pairs(idx, cells, shell):
+                    dist = torch.norm(self.sorted_points[point] - queries[batch][owner], 2, dim=-1)
+                    nearest = torch.full((batch.shape[0],), float("inf"), dtype=dist.dtype, device=dist.device)
+                    best[batch] = torch.minimum(best[batch], nearest.scatter_reduce(0, owner, dist, reduce="amin"))
+                # every point in a farther shell is at least ring * cell_size away
+                idx = idx[best[idx] > ring * self.cell_size]
+            unresolved.append(idx)
+
+        unresolved = torch.cat(unresolved)
+        if unresolved.shape[0]:
+            coarser = self._coarser()
+            if coarser is not None:
+                best[unresolved] = coarser.min_distance(queries[unresolved], chunk_size)
+            else:
+                best[unresolved] = _pairwise_min_distance(queries[unresolved], self.points)
+        return best
+
+    def knn(self, k=3, queries=None, exclude=None, radius2=None, chunk_size=1 << 14):
+        """
+        The k nearest indexed points of every query: (squared distances,
+        indices), both (Q, k) and sorted by distance. Without `queries` the
+        indexed points themselves are the queries and each skips itself;
+        otherwise `exclude` optionally gives, per query, one index to skip.
+        With `radius2` (Q,) only neighbours closer than that squared distance
+        are needed, so the search of a query may stop early and leave farther
+        slots incomplete. Slots with no neighbour hold inf and index 0.
+        """
+        device = self.points.device
+        if queries is None:
+            # walk the points in cell order so that neighbouring queries share cells
+            queries, rows, exclude = self.sorted_points, self.order, self.order
+        else:
+            queries = queries.detach()
+            if exclude is None:
+                exclude = torch.full((queries.shape[0],), -1, dtype=torch.int64, device=device)
+            rows = None
+        if radius2 is None:
+            radius2 = torch.full((queries.shape[0],), float("inf"), dtype=queries.dtype, device=device)
+        num_queries = queries.shape[0]
+        best_dist = torch.full((num_queries, k), float("inf"), dtype=queries.dtype, device=device)
+        best_index = torch.zeros((num_queries, k), dtype=torch.int64, device=device)
+        if self.points.shape[0] == 0 or num_queries == 0:
+            return best_dist, best_index
+
+        cells, inside = self._locate(queries)
+        if rows is None:
+            rows = torch.argsort(torch.where(inside, self._keys(cells.clamp(-self.max_rings)), -1))
+            queries, exclude, radius2, cells, inside = queries[rows], exclude[rows], radius2[rows], cells[rows], inside[rows]
+        unresolved = [torch.nonzero(~inside).squeeze(-1)]
+
+        for start in range(0, num_queries, chunk_size):
+            idx = torch.arange(start, min(start + chunk_size, num_queries), device=device)
+            idx = idx[inside[idx]]
+            for ring, shell in self.shells:
+                if idx.shape[0] == 0:
+                    break
+                for batch, owner, point in self._shell_pairs(idx, cells, shell):
+                    dist = ((self.sorted_points[point] - queries[batch][owner]) ** 2).sum(-1)
+                    index = self.order[point]
+                    dist = dist.masked_fill(index == exclude[batch][owner], float("inf"))
+                    dist, index = self._rank_pairs(owner, dist, index, batch.shape[0], k)
+                    out = rows[batch]
+                    best_dist[out], best_index[out] = _merge_knn(best_dist[out], best_index[out], dist, index, k)
+                # every point in a farther shell is at least ring * cell_size away
+                idx = idx[torch.minimum(best_dist[rows[idx], -1], radius2[idx]) > (ring * self.cell_size) ** 2]
+            unresolved.append(idx)
+
+        unresolved = torch.cat(unresolved)
+        if unresolved.shape[0]:
+            # searched again from scratch, so that no neighbour is counted twice
+            out = rows[unresolved]
+            coarser = self._coarser()
+            if coarser is not None:
+                best_dist[out], best_index[out] = coarser.knn(k, queries[unresolved], exclude[unresolved],
+                                                              radius2[unresolved], chunk_size)
+            else:
+                best_dist[out], best_index[out] = _pairwise_knn(
+                    queries[unresolved], exclude[unresolved], self.points, k,
+                    torch.full_like(best_dist[out], float("inf")), torch.zeros_like(best_index[out]))
+        return best_dist, best_index
+
+    def near_mask(self, points, around):
+        """Mask of the indexed `points` whose cell is one of, or adjacent to, the cells of `around`."""
+        shell = torch.cat((_shell_offsets(0, points.device), _shell_offsets(1, points.device)))
+        cells = torch.floor((around - self.lo) / self.cell_size).to(torch.int64)
+        near = torch.unique(self._keys(cells[:, None, :] + shell[None]))
+        keys = self._keys(torch.floor((points - self.lo) / self.cell_size).to(torch.int64))
+        slot = torch.searchsorted(near, keys).clamp_max(near.shape[0] - 1)
+        return near[slot] == keys
+
+    def _shell_pairs(self, idx, cells, shell):
+        # yields (queries, owner, sorted point): one pair per point in each shell cell of the queries `idx`,
+        # with `owner` indexing into the batch of queries; batches hold at most max_pairs pairs
+        # (or a single query), and owner is non-decreasing within a batch
+        keys = self._keys(cells[idx][:, None, :] + shell[None])
+        slot = torch.searchsorted(self.cell_keys, keys.reshape(-1)).clamp_max(self.cell_keys.shape[0] - 1)
+        found = self.cell_keys[slot] == keys.reshape(-1)
+        starts = self.cell_starts[slot].view(keys.shape)
+        counts = torch.where(found, self.cell_counts[slot], torch.zeros_like(slot)).view(keys.shape)
+        per_query = torch.cumsum(counts.sum(dim=1), 0)
+        if per_query.shape[0] == 0 or int(per_query[-1]) == 0:
+            return
+        bounds = [0]
+        if int(per_query[-1]) > self.max_pairs:
+            while bounds[-1] < idx.shape[0]:
+                done = int(per_query[bounds[-1] - 1]) if bounds[-1] else 0
+                end = int(torch.searchsorted(per_query, done + self.max_pairs, right=True))
+                bounds.append(max(end, bounds[-1] + 1))
+        else:
+            bounds.append(idx.shape[0])
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            batch_counts = counts[lo:hi].reshape(-1)
+            total = int(batch_counts.sum())
+            if total == 0:
+                continue
+            owner = torch.arange(hi - lo, device=idx.device).repeat_interleave(shell.shape[0])
+            owner = owner.repeat_interleave(batch_counts)
+            first = torch.repeat_interleave(starts[lo:hi].reshape(-1) - (torch.cumsum(batch_counts, 0) - batch_counts),
+                                            batch_counts)
+            yield idx[lo:hi], owner, first + torch.arange(total, device=idx.device)
+
+    @staticmethod
+    def _rank_pairs(owner, dist, index, num_queries, k):
+        # the k closest pairs of every owner as (num_queries, k) tables, padded with inf;
+        # `owner` is non-decreasing, as produced by _shell_pairs
+        counts = torch.bincount(owner, minlength=num_queries)
+        width = int(counts.max()) if owner.shape[0] else 0
+        rank = torch.arange(owner.shape[0], device=owner.device) - (torch.cumsum(counts, 0) - counts)[owner]
+        if num_queries * max(width, k) <= 4 * owner.shape[0] + (1 << 16):
+            # scatter each owner's pairs into a padded row and take the row-wise top k
+            table_dist = torch.full((num_queries, max(width, k)), float("inf"), dtype=dist.dtype, device=dist.device)
+            table_index = torch.zeros((num_queries, max(width, k)), dtype=index.dtype, device=index.device)
+            table_dist[owner, rank] = dist
+            table_index[owner, rank] = index
+            table_dist, order = torch.topk(table_dist, k, dim=1, largest=False, sorted=True)
+            return table_dist, torch.gather(table_index, 1, order)
+
+        # a few very crowded cells: sort the pairs by distance within each owner instead
+        order = torch.argsort(dist, stable=True)
+        order = order[torch.argsort(owner[order], stable=True)]
+        dist, index = dist[order], index[order]
+        keep = rank < k
+        table_dist = torch.full((num_queries, k), float("inf"), dtype=dist.dtype, device=dist.device)
+        table_index = torch.zeros((num_queries, k), dtype=index.dtype, device=index.device)
+        table_dist[owner[keep], rank[keep]] = dist[keep]
+        table_index[owner[keep], rank[keep]] = index[keep]
+        return table_dist, table_index
+
+
+def distKNN2(points):
+    """
+    Device-agnostic counterpart of simple_knn's distCUDA2: for every point the
+    mean squared distance to its 3 nearest neighbours (float32, (N,)) and
+    their indices (int32, (N, 3)). CUDA tensors use the extension when it is
+    built; everything else goes through the grid search of GridIndex.
+    """
+    if distCUDA2 is not None and points.is_cuda:
+        return distCUDA2(points)
+    dist, index = GridIndex(points.detach().float()).knn(k=3)
+    # the extension leaves missing neighbours at FLT_MAX
+    dist = dist.clamp_max(torch.finfo(torch.float32).max)
+    return (dist[:, 0] + dist[:, 1] + dist[:, 2]) / 3.0, index.to(torch.int32)
+
+
+class KNNCache:
+    """
+    The 3-nearest-neighbour distances of a point set, kept up to date while
+    the set is edited instead of being searched again from scratch. query()
+    returns the distances and indices in the layout of distKNN2 and reuses
+    the cached answer when the points are unchanged; append() and select()
+    patch it for added and removed points, editing the GridIndex of the last
+    full search instead of building a new one. Points that moved make the
+    next query a miss. `hits`, `misses` and `searched_rows` (rows searched
+    again by the patches) count the work saved.
+
+    With `incremental`, the exact GridIndex search is used on every device,
+    CUDA included: the neighbours are then exact rather than the Morton-box
+    approximation of the simple_knn extension. Without it, query() is
+    distKNN2 itself, edits drop the cache and only repeated queries of
+    unchanged points are saved.
+    """
+    k = 3
+
+    def __init__(self, incremental=False):
+        self.incremental = incremental
+        self.invalidate()
+        self.hits = 0
+        self.misses = 0
+        self.searched_rows = 0
+
+    def invalidate(self):
+        self.points = None
+        self.dist = None
+        self.index = None
+        self.grid = None
+        self.patchable = False
+        self.result = None
+
+    def _result(self):
+        if not self.patchable:
+            return self.result
+        dist = self.dist.clamp_max(torch.finfo(torch.float32).max)
+        return (dist[:, 0] + dist[:, 1] + dist[:, 2]) / 3.0, self.index.to(torch.int32)
+
+    def query(self, points):
+        points = points.detach()
+        if self.points is not None and self.points.shape == points.shape and torch.equal(self.points, points):
+            self.hits += 1
+            return self._result()
+        self.misses += 1
+        if not self.incremental:
+            self.invalidate()
+            self.points = points
+            self.result = distKNN2(points)
+            return self.result
+        self.points = points
+        self.patchable = True
+        self.grid = GridIndex(points.float())
+        self.dist, self.index = self.grid.knn(k=self.k)
+        return self._result()
+
+    def append(self, points):
+        """The point set grows by `points` at the end: search only around the new points."""
+        if not self.patchable:
+            self.invalidate()
+            return
+        points = points.detach()
+        num_old, num_new = self.points.shape[0], points.shape[0]
+        if num_new == 0:
+            return
+        old = self.points
+        self.points = torch.cat((old, points))
+        # neighbours of the new points among all points
+        new_rows = torch.arange(num_old, num_old + num_new, device=points.device)
+        if not self.grid.insert(points.float()):
+            # the point count changed a lot or the new points left the grid: fit a new one
+            self.grid = GridIndex(self.points.float())
+        grid = self.grid
+        new_dist, new_index = grid.knn(k=self.k, queries=points.float(), exclude=new_rows)
+        # a new point only matters to old points that have it inside their k-th neighbour distance: when that
+        # distance is below the cell size the new point sits in an adjacent cell, otherwise it at least has
+        # to reach the bounding box of the new points
+        radius2 = self.dist[:, -1]
+        gap = torch.maximum(points.min(dim=0).values - old, old - points.max(dim=0).values).clamp_min(0)
+        near = (radius2 > grid.cell_size ** 2) | grid.near_mask(old.float(), points.float())
+        near = torch.nonzero(near & ((gap ** 2).sum(-1) < radius2)).squeeze(-1)
+        if near.shape[0]:
+            # the fine cells of the full grid keep the bounded search to the few new points next to each old one
+            dist, index = GridIndex(points.float(), cell_size=grid.cell_size).knn(
+                k=self.k, queries=old[near].float(), radius2=radius2[near])
+            self.dist[near], self.index[near] = _merge_knn(self.dist[near], self.index[near], dist,
+                                                           index + num_old, self.k)
+        self.dist = torch.cat((self.dist, new_dist))
+        self.index = torch.cat((self.index, new_index))
+        self.searched_rows += num_new + near.shape[0]
+
+    def select(self, mask):
+        """Keep the points of `mask`: renumber the neighbours and search again only for rows that lost one."""
+        if not self.patchable:
+            self.invalidate()
+            return
+        remap = torch.cumsum(mask, 0) - 1
+        lost = ~mask[self.index] & torch.isfinite(self.dist)
+        self.points, self.dist, self.index = self.points[mask], self.dist[mask], remap[self.index[mask]]
+        stale = torch.nonzero(lost[mask].any(dim=1)).squeeze(-1)
+        if not self.grid.select(mask):
+            self.grid = GridIndex(self.points.float())
+        if stale.shape[0]:
+            self.dist[stale], self.index[stale] = self.grid.knn(
+                k=self.k, queries=self.points[stale].float(), exclude=stale)
+        # slots that were empty stay empty, with index 0 as from a full search
+        self.index[~torch.isfinite(self.dist)] = 0
+        self.searched_rows += stale.shape[0]
+
+    def reorder(self, order):
+        """The points are permuted (row i becomes old row order[i]): nothing has to be searched again."""
+        if not self.patchable:
+            self.invalidate()
+            return
+        inverse = torch.empty_like(order)
+        inverse[order] = torch.arange(order.shape[0], device=order.device)
+        self.points, self.dist, self.index = self.points[order], self.dist[order], inverse[self.index[order]]
+        self.index[~torch.isfinite(self.dist)] = 0
+        self.grid.reorder(order)
+
+
+def _spread_bits(v):
+    # insert two zero bits between each of the 21 low bits of v
+    v = (v | (v << 32)) & 0x1F00000000FFFF
+    v = (v | (v << 16)) & 0x1F0000FF0000FF
+    v = (v | (v << 8)) & 0x100F00F00F00F00F
+    v = (v | (v << 4)) & 0x10C30C30C30C30C3
+    v = (v | (v << 2)) & 0x1249249249249249
+    return v
+
+
+def morton_codes(points, bits=21):
+    """63-bit Morton (Z-order) codes of the points quantized to 2^bits cells per axis of their bounding box."""
+    points = points.detach().float()
+    if points.shape[0] == 0:
+        return torch.zeros(0, dtype=torch.int64, device=points.device)
+    lo = points.min(dim=0).values
+    extent = (points.max(dim=0).values - lo).max().clamp_min(1e-12)
+    cells = ((points - lo) / extent * ((1 << bits) - 1)).round().to(torch.int64)
+    return _spread_bits(cells[:, 0]) | (_spread_bits(cells[:, 1]) << 1) | (_spread_bits(cells[:, 2]) << 2)
+
+
+def morton_order(points):
+    """Permutation that sorts the points along the Morton curve, so that nearby points get nearby rows."""
+    return torch.argsort(morton_codes(points))
+
+
+def octree_chunks(codes, max_chunk_size, bits=21):
+    """(start, end) runs of the sorted Morton `codes` that are octree cells of at most max_chunk_size points."""
+    chunks = []
+    stack = [(0, codes.shape[0], 0, 0)] if codes.shape[0] else []
+    while stack:
+        start, end, depth, prefix = stack.pop()
+        if end - start <= max_chunk_size or depth == bits:
+            chunks.append((start, end))
+            continue
+        shift = 3 * (bits - depth - 1)
+        children = torch.tensor([(prefix * 8 + c) << shift for c in range(1, 8)], dtype=torch.int64)
+        bounds = [start] + (start + torch.searchsorted(codes[start:end], children)).tolist() + [end]
+        # pushed last to first so that the chunks come out in Morton order
+        for c in range(7, -1, -1):
+            if bounds[c + 1] > bounds[c]:
+                stack.append((bounds[c], bounds[c + 1], depth + 1, prefix * 8 + c))
+    return chunks
@@ -0,0 +1,113 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import sys
+import numpy as np
+
+# PLY property type names as written by plyfile
+_PLY_TYPE_NAMES = {"i1": "char", "u1": "uchar", "i2": "short", "u2": "ushort",
+                   "i4": "int", "u4": "uint", "f4": "float", "f8": "double"}
+
+
+def vertex_elements(attributes, dtype):
+    """
+    Structured (N,) array of `dtype` holding the (N, F) attribute matrix, one
+    field per column. When every field has the same type the matrix is
+    reinterpreted in place (after at most one contiguous cast); otherwise the
+    fields are filled column by column. No per-row Python objects are created.
+    """
+    dtype = np.dtype(dtype)
+    field_types = {dtype.fields[name][0] for name in dtype.names}
+    if len(field_types) == 1:
+        base = field_types.pop()
+        return np.ascontiguousarray(attributes, dtype=base).view(dtype).reshape(-1)
+    elements = np.empty(attributes.shape[0], dtype=dtype)
+    for idx, name in enumerate(dtype.names):
+        elements[name] = attributes[:, idx]
+    return elements
+
+
+def write_vertex_ply(path, elements, chunk_size=1 << 20):
+    """
+    Write a structured array as the 'vertex' element of a binary PLY. The
+    output is byte-identical to PlyData([PlyElement.describe(elements, 'vertex')]).write(path);
+    the vertex block is streamed from the array in chunks.
+    """
+    dtype = elements.dtype
+    byte_order = "binary_little_endian" if sys.byteorder == "little" else "binary_big_endian"
+    header = ["ply", "format {} 1.0".format(byte_order), "element vertex {}".format(elements.shape[0])]
+    for name in dtype.names:
+        header.append("property {} {}".format(_PLY_TYPE_NAMES[dtype.fields[name][0].str[1:]], name))
+    header.append("end_header")
+    elements = np.ascontiguousarray(elements)
+    with open(path, "wb") as f:
+        f.write(("\n".join(header) + "\n").encode("ascii"))
+        for start in range(0, elements.shape[0], chunk_size):
+            f.write(elements[start:start + chunk_size].view(np.uint8).data)
+
+
+_PLY_TYPES = {"char": "i1", "int8": "i1", "uchar": "u1", "uint8": "u1",
+              "short": "i2", "int16": "i2", "ushort": "u2", "uint16": "u2",
+              "int": "i4", "int32": "i4", "uint": "u4", "uint32": "u4",
+              "float": "f4", "float32": "f4", "double": "f8", "float64": "f8"}
+
+
+def read_ply_header(f):
+    """Parse a PLY header: returns (format, [(element, count, [(property, type), ...])], header size)."""
+    if f.readline().strip() != b"ply":
+        raise ValueError("not a PLY file")
+    fmt, elements = None, []
+    while True:
+        line = f.readline()
+        if not line:
+            raise ValueError("PLY header has no end_header")
+        words = line.decode("ascii").split()
+        if not words or words[0] in ("comment", "obj_info"):
+            continue
+        if words[0] == "end_header":
+            return fmt, elements, f.tell()
+        if words[0] == "format":
+            fmt = words[1]
+        elif words[0] == "element":
+            elements.append((words[1], int(words[2]), []))
+        elif words[0] == "property":
+            if words[1] == "list":
+                elements[-1][2].append((words[4], None))
+            else:
+                elements[-1][2].append((words[2], _PLY_TYPES[words[1]]))
+
+
+def read_vertex_attributes(path):
+    """
+    Return (attributes, names): the vertex properties of a PLY as an (N, F)
+    float32 array and their names in file order. For a binary PLY whose
+    vertex properties are all float32 (everything save_ply writes) the array
+    is a view of a copy-on-write memory map of the vertex block, so nothing
+    is parsed or copied until it is read; other files are converted once.
+    """
+    with open(path, "rb") as f:
+        fmt, elements, offset = read_ply_header(f)
+    byte_order = {"binary_little_endian": "<", "binary_big_endian": ">"}.get(fmt)
+    scalar = all(t is not None for _, _, props in elements for _, t in props)
+    if byte_order is None or not scalar or elements[0][0] != "vertex":
+        # ASCII or list properties: let plyfile parse it
+        from plyfile import PlyData
+        vertices = PlyData.read(path)["vertex"]
+        names = [p.name for p in vertices.properties]
+        return np.stack([np.asarray(vertices[name], dtype=np.float32) for name in names], axis=1), names
+
+    _, count, props = elements[0]
+    names = [name for name, _ in props]
+    dtype = np.dtype([(name, byte_order + t) for name, t in props])
+    vertices = np.memmap(path, dtype=dtype, mode="c", offset=offset, shape=(count,))
+    if all(t == "f4" for _, t in props) and dtype.fields[names[0]][0] == np.dtype(np.float32):
+        return vertices.view(np.float32).reshape(count, len(names)), names
+    return np.stack([vertices[name].astype(np.float32) for name in names], axis=1), names
@@ -0,0 +1,86 @@
+#
+# Copyright (C) 2023, Inria
+# GRAPHDECO research group, https://team.inria.fr/graphdeco
+# All rights reserved.
+#
+# This software is free for non-commercial, research and evaluation use
+# under the terms of the LICENSE.md file.
+#
+# For inquiries contact  george.drettakis@inria.fr
+#
+
+import math
+import torch
+
+
+class SparseGaussianAdam(torch.optim.Optimizer):
+    """
+    Adam that, given a visibility mask over the Gaussians, updates the moments
+    and parameters of the visible rows only. Every row remembers the step it
+    was last updated at (state "last_step"); when it becomes visible again
+    its moments first receive the decay of the skipped steps (zero gradients),
+    so exp_avg / exp_avg_sq equal those of dense Adam and the usual bias
+    correction for the global step applies. The parameter drift dense Adam
+    would have applied from the leftover momentum during the skipped steps is
+    not replayed. Groups flagged "dense" (e.g. the background colour) and
+    steps without a mask are updated like torch.optim.Adam.
+    """
+    def __init__(self, params, lr=1e-3, betas=(0.9, 0.999), eps=1e-8):
+        super().__init__(params, dict(lr=lr, betas=betas, eps=eps))
+
+    @torch.no_grad()
+    def step(self, visibility=None, closure=None):
+        loss = None
+        if closure is not None:
+            with torch.enable_grad():
+                loss = closure()
+
+        for group in self.param_groups:
+            beta1, beta2 = group["betas"]
+            for param in group["params"]:
+                if param.grad is None:
+                    continue
+                state = self.state[param]
+                if len(state) == 0:
+                    state["step"] = 0
+                    state["exp_avg"] = torch.zeros_like(param, memory_format=torch.preserve_format)
+                    state["exp_avg_sq"] = torch.zeros_like(param, memory_format=torch.preserve_format)
+                    state["last_step"] = torch.zeros(param.shape[0], dtype=torch.int32, device=param.device)
+                state["step"] += 1
+                step = state["step"]
+                step_size = group["lr"] / (1 - beta1 ** step)
+                bias_correction2_sqrt = math.sqrt(1 - beta2 ** step)
+
+                if visibility is None or group.get("dense", False) or visibility.shape[0] != param.shape[0]:
+                    exp_avg, exp_avg_sq = state["exp_avg"], state["exp_avg_sq"]
+                    skipped = step - 1 - state["last_step"]
+                    if bool((skipped > 0).any()):
+                        self._decay(exp_avg, exp_avg_sq, skipped, beta1, beta2)
+                    exp_avg.lerp_(param.grad, 1 - beta1)
+                    exp_avg_sq.mul_(beta2).addcmul_(param.grad, param.grad, value=1 - beta2)
+                    denom = (exp_avg_sq.sqrt() / bias_correction2_sqrt).add_(group["eps"])
+                    param.addcdiv_(exp_avg, denom, value=-step_size)
+                    state["last_step"].fill_(step)
+                    continue
+
+                rows = torch.nonzero(visibility).squeeze(-1)
+                grad = param.grad[rows]
+                exp_avg = state["exp_avg"][rows]
+                exp_avg_sq = state["exp_avg_sq"][rows]
+                self._decay(exp_avg, exp_avg_sq, step - 1 - state["last_step"][rows], beta1, beta2)
+                exp_avg.lerp_(grad, 1 - beta1)
+                exp_avg_sq.mul_(beta2).addcmul_(grad, grad, value=1 - beta2)
+                denom = (exp_avg_sq.sqrt() / bias_correction2_sqrt).add_(group["eps"])
+                param[rows] = param[rows].addcdiv_(exp_avg, denom, value=-step_size)
+                state["exp_avg"][rows] = exp_avg
+                state["exp_avg_sq"][rows] = exp_avg_sq
+                state["last_step"][rows] = step
+        return loss
+
+    @staticmethod
+    def _decay(exp_avg, exp_avg_sq, skipped, beta1, beta2):
+        # the moment updates of `skipped` steps with zero gradient, per row
+        shape = (-1,) + (1,) * (exp_avg.dim() - 1)
+        skipped = skipped.to(exp_avg.dtype).view(shape)
+        exp_avg.mul_(torch.pow(beta1, skipped))
+        exp_avg_sq.mul_(torch.pow(beta2, skipped))